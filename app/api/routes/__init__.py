@@ -2,10 +2,14 @@ from fastapi import APIRouter
 from api.routes.websocket import router as websocket_router
 from api.routes.health import router as health_router
 from api.routes.global_factors import router as global_factors_router
+from api.routes.render import router as render_router
+from api.routes.metrics import router as metrics_router
 
 router = APIRouter()
 router.include_router(websocket_router)
 router.include_router(health_router)
 router.include_router(global_factors_router)
+router.include_router(render_router)
+router.include_router(metrics_router)
 
 __all__ = ["router"] 
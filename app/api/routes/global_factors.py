@@ -1,7 +1,9 @@
-from typing import Optional
+from typing import Dict, Optional
 from fastapi import APIRouter
 from pydantic import BaseModel, Field
-from core import connection_manager
+from core import connection_manager, state_backend
+from core.state_backend import FACTOR_CHANNEL
+from api.routes.websocket import room_manager
 
 router = APIRouter()
 
@@ -22,6 +24,8 @@ FACTORS = {
 class FactorUpdate(BaseModel):
     value: float
     client_id: Optional[str] = Field(None, alias="clientId")
+    # Set the factor for the generation of a room's shared streams
+    room_id: Optional[str] = Field(None, alias="roomId")
 
 # Dynamically generate types for each factor
 def create_factor_model(factor_name: str):
@@ -40,32 +44,54 @@ async def update_factor(factor_type: str, factor_update: FactorUpdate):
     共通のファクター更新ロジック
     """
     config = FACTORS[factor_type]
-    print(f"Updating {factor_type} factor to {factor_update.value}")
 
-    if factor_update.client_id:
+    message = {
+        "type": config.message_type,
+        "value": factor_update.value
+    }
+    if factor_update.room_id:
+        message["roomId"] = factor_update.room_id
+    if state_backend.shared:
+        # The client may be connected to another worker; every worker
+        # delivers to its own connections (see `deliver_factor_update`)
+        published = {"clientId": factor_update.client_id, "message": message}
+        if factor_update.room_id:
+            published.update(roomId=factor_update.room_id, factor=config.name, value=factor_update.value)
+        workers = await state_backend.publish(FACTOR_CHANNEL, published)
+        delivery = {"workers": workers}
+    elif factor_update.room_id:
+        # Applied to the room's generation and sent to its members
+        if room_manager.set_factor(factor_update.room_id, config.name, factor_update.value) is None:
+            return {"status": "error", "message": "Room not found"}
+        delivery = await room_manager.broadcast(factor_update.room_id, message)
+    elif factor_update.client_id:
         # Send to a specific client
-        if factor_update.client_id in connection_manager.active_connections:
-            await connection_manager.send_note_data(factor_update.client_id, {
-                "type": config.message_type,
-                "value": factor_update.value
-            })
-        else:
+        if factor_update.client_id not in connection_manager.active_connections:
             return {"status": "error", "message": "Client not found"}
+        delivery = await connection_manager.broadcast(message, [factor_update.client_id])
     else:
-        # Send to all clients
-        for client_id in connection_manager.active_connections:
-            print(client_id)
-            await connection_manager.send_note_data(client_id, {
-                "type": config.message_type,
-                "value": factor_update.value
-            })
+        # Send to all clients concurrently
+        delivery = await connection_manager.broadcast(message)
     
     return {
         "status": "success", 
         config.name: factor_update.value,
-        "target": factor_update.client_id or "all"
+        "target": factor_update.room_id or factor_update.client_id or "all",
+        "delivery": delivery
     }
 
+async def deliver_factor_update(published: Dict) -> None:
+    """Deliver a factor update published by any worker to local connections."""
+    room_id = published.get("roomId")
+    if room_id:
+        if room_manager.set_factor(room_id, published["factor"], published["value"]) is not None:
+            await room_manager.broadcast(room_id, published["message"])
+        return
+    client_id = published.get("clientId")
+    if client_id and client_id not in connection_manager.active_connections:
+        return
+    await connection_manager.broadcast(published["message"], [client_id] if client_id else None)
+
 @router.post("/api/volume-factor")
 async def update_volume_factor(volume_update: VolumeFactorUpdate):
     return await update_factor("volume", volume_update)
@@ -1,8 +1,74 @@
+import os
+import time
+from typing import Optional
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 from datetime import datetime
 
 router = APIRouter()
 
+
+def process_start_time() -> float:
+    """Get when the process started, including interpreter startup and imports.
+
+    Returns:
+        float: Unix time, the time of this import where /proc is unavailable
+    """
+    try:
+        with open("/proc/self/stat") as file:
+            # Field 22, after the parenthesized command which may contain spaces
+            start_ticks = int(file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as file:
+            boot_time = next(int(line.split()[1]) for line in file if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+def resident_memory() -> Optional[int]:
+    """Get the resident set size of the process in bytes, if available."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Readiness:
+    """Startup state of the worker, distinct from liveness."""
+
+    def __init__(self):
+        self.started_at = process_start_time()
+        self.ready = False
+        self.stopping = False
+        self.startup_seconds: Optional[float] = None
+
+    def mark_ready(self) -> None:
+        """Called once startup (state backend, subscriptions) has completed."""
+        self.ready = True
+        self.startup_seconds = time.time() - self.started_at
+
+    def mark_stopping(self) -> None:
+        self.ready = False
+        self.stopping = True
+
+
+readiness = Readiness()
+
+
 @router.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()} 
\ No newline at end of file
+    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+
+
+@router.get("/api/ready")
+async def readiness_check():
+    """Ready to accept websocket clients; 503 while starting or shutting down."""
+    if not readiness.ready:
+        status = "stopping" if readiness.stopping else "starting"
+        return JSONResponse({"status": status}, status_code=503)
+    return {
+        "status": "ready",
+        "startupSeconds": readiness.startup_seconds,
+        "rssBytes": resident_memory(),
+    }
@@ -0,0 +1,86 @@
+import math
+import os
+from typing import Dict, List, Optional, Union
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from music_generator import check_params, max_events_per_second
+
+router = APIRouter()
+
+RENDER_MAX_SECONDS = float(os.getenv("RENDER_MAX_SECONDS", "3600"))
+RENDER_MAX_VOICES = 16
+# Events a render may generate over all voices, 0 for no limit
+RENDER_MAX_EVENTS = int(os.getenv("RENDER_MAX_EVENTS", "4000000"))
+
+
+class RenderVoice(BaseModel):
+    voice_id: Union[int, str] = Field(..., alias="voiceId")
+    params: Dict
+    program: Optional[int] = Field(None, ge=0, le=127)
+
+
+class RenderRequest(BaseModel):
+    voices: List[RenderVoice] = Field(..., min_length=1, max_length=RENDER_MAX_VOICES)
+    global_params: Dict = Field(..., alias="globalParams")
+    length_seconds: float = Field(..., gt=0, le=RENDER_MAX_SECONDS, alias="lengthSeconds")
+    seed: Optional[int] = None
+
+
+def check_voice_params(voice: RenderVoice, global_params: Dict) -> None:
+    """Reject parameters that would break the render after the response has started.
+
+    Args:
+        voice (RenderVoice): Voice
+        global_params (Dict): Global parameters
+    """
+    try:
+        check_params(voice.params, global_params)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Voice {voice.voice_id}: {e}")
+
+
+def check_render_events(render_request: RenderRequest) -> None:
+    """Reject renders that could generate more than RENDER_MAX_EVENTS events.
+
+    The length alone does not bound the work: fast tempos and short
+    durations multiply the events per second.
+
+    Args:
+        render_request (RenderRequest): Render request, with checked voice parameters
+    """
+    if not RENDER_MAX_EVENTS:
+        return
+    events = sum(
+        math.ceil(render_request.length_seconds * max_events_per_second(voice.params, render_request.global_params))
+        for voice in render_request.voices
+    )
+    if events > RENDER_MAX_EVENTS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Up to {events} events at these tempos and durations, at most {RENDER_MAX_EVENTS} per render"
+        )
+
+
+@router.post("/api/render/midi")
+def render_midi_file(render_request: RenderRequest):
+    """Render a multi-track Standard MIDI File.
+
+    The file is streamed while it is generated, one track per voice.
+    """
+    # Imported on first render to keep it out of the startup path
+    from music_generator.midi_writer import render_midi
+
+    for voice in render_request.voices:
+        check_voice_params(voice, render_request.global_params)
+    check_render_events(render_request)
+    voices = [
+        {"voiceId": voice.voice_id, "params": voice.params, "program": voice.program}
+        for voice in render_request.voices
+    ]
+    # A sync iterator is run in the threadpool, keeping generation off the event loop
+    return StreamingResponse(
+        render_midi(voices, render_request.global_params, render_request.length_seconds, render_request.seed),
+        media_type="audio/midi",
+        headers={"Content-Disposition": 'attachment; filename="twelve-tones.mid"'}
+    )
@@ -1,88 +1,315 @@
-from typing import Dict
+from typing import Dict, List
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from core import connection_manager
-from music_generator import MusicGenerator
+from core import admission_controller, connection_manager, state_backend
+from core.admission import RateLimited
+from core.rooms import RoomError, RoomManager
+from core.executor import GenerationExecutor
+from core.metrics import metrics
+from core.streaming import NoteStreamer
+from music_generator import MusicGenerator, check_batch, check_duration, check_params
+from music_generator.music_generator import FILL_MAX_EVENTS
+from music_generator.tone_row import get_snap_table
 
 router = APIRouter()
 music_generator = MusicGenerator()
-client_states: Dict[str, Dict] = {}
+generation_executor = GenerationExecutor.from_env(music_generator)
+
+MESSAGE_TYPES = (
+    "init", "generate_notes", "generate_notes_batch", "fill_until", "start_stream", "stop_stream",
+    "voice_added", "voice_removed", "voice_updated", "join_room", "leave_room"
+)
+MESSAGES = metrics.counter("ws_messages_total", "Websocket messages received", ("type",))
+MESSAGE_SECONDS = metrics.histogram(
+    "ws_message_seconds", "Time from receiving a message to queueing its response", ("type",)
+)
+
+
+async def generate_next_notes(
+    client_id: str, voice_id: int, params: Dict, global_params: Dict, duration: int = 1
+) -> List[Dict]:
+    return await generation_executor.call(
+        "generate_next_notes", client_id, voice_id, params, global_params, duration
+    )
+
+
+async def save_voice(client_id: str, voice_id: int) -> None:
+    """Write a voice state to the shared backend so other workers can resume it."""
+    if not state_backend.shared:
+        return
+    data = await generation_executor.call("dump_voice", client_id, voice_id)
+    if data is not None:
+        await state_backend.save_voice(client_id, voice_id, data)
+
+
+async def restore_client(client_id: str) -> None:
+    """Load the voice states a client left on another worker."""
+    if not state_backend.shared:
+        return
+    voices = await state_backend.load_client(client_id)
+    for voice_id, data in voices.items():
+        await generation_executor.call("restore_voice", client_id, voice_id, data)
+        admission_controller.track_voice(client_id, voice_id)
+
+
+async def leave_room(client_id: str) -> None:
+    """Take a client out of its room, releasing the room's generation state if it closed."""
+    room = room_manager.leave(client_id)
+    if room is not None:
+        admission_controller.remove_client(room.key)
+        await generation_executor.call("remove_client", room.key)
+
+
+note_streamer = NoteStreamer(connection_manager, generate_next_notes, admission_controller)
+# Shared streams, generated once per room and sent to all its members
+room_manager = RoomManager(connection_manager, generate_next_notes, admission_controller)
+
+# Voice states of the inline and thread backends; process workers hold their own
+metrics.gauge_callback("voice_state_clients", "Clients with voice states", lambda: len(music_generator.state_store))
+metrics.gauge_callback(
+    "voice_state_voices", "Voice states held",
+    lambda: music_generator.state_store.stats()["voices"]
+)
+# Snap table cache of the inline and thread backends
+metrics.counter_callback("snap_table_cache_hits_total", "Row refills served from a cached snap table",
+                         lambda: get_snap_table.cache_info().hits)
+metrics.counter_callback("snap_table_cache_misses_total", "Row refills that built a snap table",
+                         lambda: get_snap_table.cache_info().misses)
+metrics.gauge_callback("snap_table_cache_entries", "Scale and range pairs in the snap table cache",
+                       lambda: get_snap_table.cache_info().currsize)
+metrics.gauge_callback(
+    "stream_voices", "Voices being streamed",
+    lambda: sum(len(stream.voices) for stream in note_streamer.streams.values())
+)
+metrics.gauge_callback("rooms", "Open rooms", lambda: room_manager.stats()["rooms"])
+metrics.gauge_callback("room_listeners", "Clients in rooms", lambda: room_manager.stats()["listeners"])
+metrics.gauge_callback("room_voices", "Voices streamed to rooms", lambda: room_manager.stats()["voices"])
 
 @router.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     await connection_manager.connect(websocket, client_id)
     try:
+        await restore_client(client_id)
         while True:
             # Wait for messages from clients
             data = await websocket.receive_json()
+            start = MESSAGE_SECONDS.start()
             
             # Process messages based on type
-            if data["type"] == "init":
-                # Set initial state for client
-                client_states[client_id] = {
-                    "voice_states": {}
-                }
-                response = {
-                    "type": "init_response",
-                    "status": "ready"
-                }
-            elif data["type"] == "generate_notes":
-                voice_id = data["voiceId"]
-                params = data["params"]
-                duration = data["duration"]
-                global_params = data["globalParams"]
+            try:
+                if data["type"] == "init":
+                    encoding = connection_manager.set_encoding(client_id, data.get("encoding", "json"))
+                    seed = data.get("seed")
+                    if seed is not None:
+                        # Per-voice random sources make the session reproducible
+                        await generation_executor.call("seed_client", client_id, int(seed))
+                    response = {
+                        "type": "init_response",
+                        "status": "ready",
+                        "encoding": encoding,
+                        "seed": seed
+                    }
+                elif data["type"] == "generate_notes":
+                    voice_id = data["voiceId"]
+                    params = data["params"]
+                    duration = check_duration(data["duration"], voice_id)
+                    global_params = data["globalParams"]
                 
-                # Generate notes
-                note_data = music_generator.generate_next_notes(
-                    client_id, voice_id, params, global_params, duration
-                )
+                    admission_controller.admit_voices(client_id, voice_id)
+                    admission_controller.admit_events(client_id, duration)
+                    with admission_controller.generation_slot():
+                        # Generate notes
+                        note_data = await generate_next_notes(
+                            client_id, voice_id, params, global_params, duration
+                        )
+                    await save_voice(client_id, voice_id)
+                    response = {
+                        "type": "note_data",
+                        "voiceId": voice_id,
+                        "noteData": note_data
+                    }
+                elif data["type"] == "generate_notes_batch":
+                    # Several voices sharing globalParams, answered in one frame
+                    voices = data["voices"]
+                    global_params = data["globalParams"]
+                    durations = check_batch(voices)
+                    admission_controller.admit_voices(client_id, *(voice["voiceId"] for voice in voices))
+                    admission_controller.admit_events(client_id, *durations)
+                    with admission_controller.generation_slot():
+                        voices_data = await generation_executor.call(
+                            "generate_notes_batch", client_id, voices, global_params
+                        )
+                    for voice in voices:
+                        await save_voice(client_id, voice["voiceId"])
+                    response = {
+                        "type": "note_data_batch",
+                        "voices": voices_data
+                    }
+                elif data["type"] == "fill_until":
+                    # Generate just enough to cover the voice's clock up to a time or beat
+                    voice_id = data["voiceId"]
+                    if data.get("untilBeat") is not None:
+                        until, unit = float(data["untilBeat"]), "beats"
+                    else:
+                        until, unit = float(data["untilSeconds"]), "seconds"
+                    admission_controller.admit_voices(client_id, voice_id)
+                    admission_controller.admit_open_ended(client_id)
+                    # Billed afterwards, so bounded like a request of max_duration events
+                    max_events = admission_controller.max_duration or FILL_MAX_EVENTS
+                    with admission_controller.generation_slot():
+                        note_data = await generation_executor.call(
+                            "fill_until", client_id, voice_id, data["params"], data["globalParams"],
+                            until, unit, max_events
+                        )
+                    admission_controller.charge(client_id, len(note_data))
+                    await save_voice(client_id, voice_id)
+                    response = {
+                        "type": "note_data",
+                        "voiceId": voice_id,
+                        "noteData": note_data
+                    }
+                elif data["type"] == "start_stream":
+                    # Push notes ahead of playback instead of answering generate_notes
+                    voice_id = data["voiceId"]
+                    params = data["params"]
+                    global_params = data["globalParams"]
+                    lookahead = note_streamer.get_lookahead(data, params, global_params)
+                    # Refills run in the background, so bad parameters are rejected here
+                    check_params(params, global_params)
+                    if data.get("roomId") is not None:
+                        # A voice of the host's room, streamed to every member
+                        room = room_manager.host_room(client_id, data["roomId"])
+                        admission_controller.admit_voices(room.key, voice_id)
+                        room_manager.start_voice(room, voice_id, params, global_params, lookahead)
+                    else:
+                        admission_controller.admit_voices(client_id, voice_id)
+                        note_streamer.start_voice(client_id, voice_id, params, global_params, lookahead)
+                    response = {
+                        "type": "stream_started",
+                        "voiceId": voice_id,
+                        "roomId": data.get("roomId"),
+                        "lookaheadSeconds": lookahead
+                    }
+                elif data["type"] == "stop_stream":
+                    voice_id = data["voiceId"]
+                    if data.get("roomId") is not None:
+                        room = room_manager.host_room(client_id, data["roomId"])
+                        room_manager.stop_voice(room, voice_id)
+                        admission_controller.remove_voice(room.key, voice_id)
+                    else:
+                        note_streamer.stop_voice(client_id, voice_id)
+                        await save_voice(client_id, voice_id)
+                    response = {
+                        "type": "stream_stopped",
+                        "voiceId": voice_id,
+                        "roomId": data.get("roomId")
+                    }
+                elif data["type"] == "join_room":
+                    # Listen to a room's streams, creating the room as its host
+                    room_id = str(data["roomId"])
+                    current = room_manager.client_rooms.get(client_id)
+                    if current is not None and current != room_id:
+                        await leave_room(client_id)
+                    room = room_manager.join(client_id, room_id)
+                    response = {
+                        "type": "room_joined",
+                        "roomId": room_id,
+                        "host": room.host == client_id,
+                        "listeners": len(room.members),
+                        "factors": room.factors
+                    }
+                elif data["type"] == "leave_room":
+                    room_id = room_manager.client_rooms.get(client_id)
+                    await leave_room(client_id)
+                    response = {
+                        "type": "room_left",
+                        "roomId": room_id
+                    }
+                elif data["type"] == "voice_added":
+                    # Initialize new voice
+                    voice_id = data["voiceId"]
+                    admission_controller.admit_voices(client_id, voice_id)
+                    await generation_executor.call("init_voice_state", client_id, voice_id)
+                    await save_voice(client_id, voice_id)
+                    response = {
+                        "type": "voice_added_response",
+                        "voiceId": voice_id,
+                        "status": "initialized"
+                    }                
+                elif data["type"] == "voice_removed":
+                    # Remove voice state
+                    voice_id = data["voiceId"]
+                    note_streamer.stop_voice(client_id, voice_id)
+                    admission_controller.remove_voice(client_id, voice_id)
+                    await generation_executor.call("remove_voice", client_id, voice_id)
+                    if state_backend.shared:
+                        await state_backend.delete_voice(client_id, voice_id)
+                    response = {
+                        "type": "voice_removed_response",
+                        "voiceId": voice_id,
+                        "status": "removed"
+                    } 
+                elif data["type"] == "voice_updated":
+                    # Update voice ID
+                    old_id = data["oldId"]
+                    new_id = data["newId"]
+                    note_streamer.rename_voice(client_id, old_id, new_id)
+                    admission_controller.rename_voice(client_id, old_id, new_id)
+                    await generation_executor.call("rename_voice", client_id, old_id, new_id)
+                    if state_backend.shared:
+                        await state_backend.delete_voice(client_id, old_id)
+                        await save_voice(client_id, new_id)
+                    response = {
+                        "type": "voice_updated_response",
+                        "oldId": old_id,
+                        "newId": new_id,
+                        "status": "updated"
+                    }
+                else:
+                    response = {
+                        "type": "error",
+                        "message": "Unknown message type"
+                    }
+            except RateLimited as e:
+                # Rejected before any generation; the client may retry later
                 response = {
-                    "type": "note_data",
-                    "voiceId": voice_id,
-                    "noteData": note_data
+                    "type": "error",
+                    "code": "rate_limited",
+                    "reason": e.reason,
+                    "message": e.message,
+                    "retryAfter": e.retry_after,
+                    "requestType": data["type"],
+                    "voiceId": data.get("voiceId")
                 }
-            elif data["type"] == "voice_added":
-                # Initialize new voice
-                voice_id = data["voiceId"]
-                music_generator.init_voice_state(client_id, voice_id)
-                response = {
-                    "type": "voice_added_response",
-                    "voiceId": voice_id,
-                    "status": "initialized"
-                }                
-            elif data["type"] == "voice_removed":
-                # Remove voice state
-                voice_id = data["voiceId"]
-                if client_id in music_generator.client_states:
-                    if voice_id in music_generator.client_states[client_id]:
-                        del music_generator.client_states[client_id][voice_id]
+            except ValueError as e:
                 response = {
-                    "type": "voice_removed_response",
-                    "voiceId": voice_id,
-                    "status": "removed"
-                } 
-            elif data["type"] == "voice_updated":
-                # Update voice ID
-                old_id = data["oldId"]
-                new_id = data["newId"]
-                if client_id in music_generator.client_states:
-                    if old_id in music_generator.client_states[client_id]:
-                        music_generator.client_states[client_id][new_id] = \
-                            music_generator.client_states[client_id].pop(old_id)
-                response = {
-                    "type": "voice_updated_response",
-                    "oldId": old_id,
-                    "newId": new_id,
-                    "status": "updated"
+                    "type": "error",
+                    "code": "invalid_params",
+                    "message": str(e),
+                    "requestType": data["type"],
+                    "voiceId": data.get("voiceId")
                 }
-            else:
+            except RoomError as e:
                 response = {
                     "type": "error",
-                    "message": "Unknown message type"
+                    "code": "room",
+                    "message": str(e),
+                    "requestType": data["type"],
+                    "roomId": data.get("roomId")
                 }
             
             await connection_manager.send_note_data(client_id, response)
+            message_type = (data["type"] if data["type"] in MESSAGE_TYPES else "unknown",)
+            MESSAGES.inc(labels=message_type)
+            MESSAGE_SECONDS.stop(start, message_type)
             
     except WebSocketDisconnect:
+        pass
+    finally:
+        # Release everything held for the client, including its voice states.
+        # A shared backend keeps its copy until the TTL so a reconnect to any
+        # worker can resume the voices.
+        note_streamer.stop_client(client_id)
+        await leave_room(client_id)
+        admission_controller.remove_client(client_id)
         connection_manager.disconnect(client_id)
-        if client_id in client_states:
-            del client_states[client_id]
+        await generation_executor.call("remove_client", client_id)
@@ -0,0 +1,113 @@
+"""Benchmark cached duration / scale distributions against the previous implementation.
+
+Run from the app directory:
+
+    python -m benchmarks.bench_distributions
+"""
+import random
+import time
+from typing import Callable
+from unittest import mock
+
+from music_generator import MusicGenerator
+from music_generator.scale_manager import ScaleManager
+from benchmarks.common import GLOBAL_PARAMS, PARAMS
+
+
+def legacy_get_note_duration(complexity: int, rng=random) -> str:
+    """get_note_duration before the cumulative weight cache."""
+    if complexity <= 0:
+        return '2n'
+    elif complexity <= 25:
+        return random.choices(['2n', '4n'], weights=[1 - (0.5 * complexity/25), 0.5 * complexity/25])[0]
+    elif complexity <= 50:
+        weights = [
+            0.5 - (0.167 * (complexity-25)/25),
+            0.5 - (0.167 * (complexity-25)/25),
+            0.333 * (complexity-25)/25
+        ]
+        return random.choices(['2n', '4n', '8n'], weights=weights)[0]
+    elif complexity <= 75:
+        weights = [
+            0.333 - (0.083 * (complexity-50)/25),
+            0.333 - (0.083 * (complexity-50)/25),
+            0.333 - (0.083 * (complexity-50)/25),
+            0.25 * (complexity-50)/25
+        ]
+        return random.choices(['2n', '4n', '8n', '16n'], weights=weights)[0]
+    else:
+        weights = [
+            0.25 - (0.05 * (complexity-75)/25),
+            0.25 - (0.05 * (complexity-75)/25),
+            0.25 - (0.05 * (complexity-75)/25),
+            0.25 - (0.05 * (complexity-75)/25),
+            0.2 * (complexity-75)/25
+        ]
+        return random.choices(['2n', '4n', '8n', '16n', '32n'], weights=weights)[0]
+
+
+def legacy_get_scale_for_dissonance_weighted(dissonance: float, rng=random) -> tuple:
+    """get_scale_for_dissonance_weighted before the distribution cache."""
+    for (low, high), scales in ScaleManager.SCALE_BANK.items():
+        if low <= dissonance < high:
+            if len(scales) == 1:
+                return scales[0]
+            weights = [(high - dissonance), (dissonance - low)]
+            return random.choices(scales, weights=weights)[0]
+    return ("None", None)
+
+
+def rate(func: Callable[[], int], seconds: float = 1.0) -> float:
+    """Call func repeatedly for about `seconds` and return items per second.
+
+    Args:
+        func (Callable[[], int]): Returns the number of items produced per call
+        seconds (float): Measuring time
+    Returns:
+        float: Items per second
+    """
+    items = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        items += func()
+    return items / elapsed
+
+
+def main() -> None:
+    generator = MusicGenerator()
+
+    def durations(get_note_duration: Callable[[int], str]) -> Callable[[], int]:
+        def run() -> int:
+            for complexity in range(0, 101, 5):
+                get_note_duration(complexity)
+            return 21
+        return run
+
+    def scales(get_scale: Callable[[float], tuple]) -> Callable[[], int]:
+        def run() -> int:
+            for bucket in range(100):
+                get_scale(bucket / 100)
+            return 100
+        return run
+
+    def notes() -> int:
+        return len(generator.generate_next_notes("bench", 0, PARAMS, GLOBAL_PARAMS, 64))
+
+    print(f"get_note_duration     before: {rate(durations(legacy_get_note_duration)):>12,.0f} /s")
+    print(f"get_note_duration     after:  {rate(durations(generator.get_note_duration)):>12,.0f} /s")
+    print(f"scale selection       before: {rate(scales(legacy_get_scale_for_dissonance_weighted)):>12,.0f} /s")
+    print(f"scale selection       after:  {rate(scales(ScaleManager.get_scale_for_dissonance_weighted)):>12,.0f} /s")
+
+    with mock.patch.object(generator, "get_note_duration", legacy_get_note_duration), \
+            mock.patch.object(
+                ScaleManager, "get_scale_for_dissonance_weighted",
+                staticmethod(legacy_get_scale_for_dissonance_weighted)
+            ):
+        before = rate(notes)
+    after = rate(notes)
+    print(f"generate_next_notes   before: {before:>12,.0f} notes/s")
+    print(f"generate_next_notes   after:  {after:>12,.0f} notes/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Micro-benchmarks of the MusicGenerator hot paths.
+
+Run from the app directory:
+
+    python -m benchmarks.bench_generator [--seconds 0.5] [--json results.json]
+"""
+import argparse
+import random
+from typing import Dict, List
+
+from benchmarks.common import GLOBAL_PARAMS, PARAMS, per_call_us, write_json
+from music_generator import MusicGenerator
+from music_generator.scale_manager import ScaleManager
+from music_generator.tone_row import get_snap_table
+
+DURATIONS = (1, 16, 256)
+CHORD_PROBABILITIES = (0, 50, 100)
+BATCH_VOICES = (1, 8, 32)
+BATCH_DURATION = 16
+SEED = 1234
+
+
+def bench_helpers(generator: MusicGenerator, seconds: float) -> List[Dict]:
+    _, scale_pcs = ScaleManager.get_scale_for_dissonance_weighted(GLOBAL_PARAMS["dissonanceLevel"])
+    row = generator.generate_new_sequence()
+    notes = [random.randrange(36, 96) for _ in range(1024)]
+    position = iter(range(1 << 62))
+
+    def next_note() -> int:
+        return notes[next(position) & 1023]
+
+    cases = {
+        "snap_note": lambda: generator.snap_note(next_note(), scale_pcs),
+        "adjust_note_to_range": lambda: generator.adjust_note_to_range(next_note(), 48, 84),
+        "get_note_duration": lambda: generator.get_note_duration(next_note()),
+        "inversion": lambda: generator.inversion(row),
+        "generate_new_sequence": generator.generate_new_sequence,
+    }
+    return [
+        {"name": name, "us_per_call": per_call_us(func, seconds)}
+        for name, func in cases.items()
+    ]
+
+
+def bench_generate_next_notes(generator: MusicGenerator, seconds: float) -> List[Dict]:
+    results = []
+    for chord_probability in CHORD_PROBABILITIES:
+        params = dict(PARAMS, chordProbability=chord_probability)
+        for duration in DURATIONS:
+            us = per_call_us(
+                lambda: generator.generate_next_notes("bench", 1, params, GLOBAL_PARAMS, duration),
+                seconds
+            )
+            results.append({
+                "name": "generate_next_notes",
+                "duration": duration,
+                "chordProbability": chord_probability,
+                "us_per_call": us,
+                "events_per_second": duration / us * 1e6,
+            })
+    return results
+
+
+def bench_generate_batch(generator: MusicGenerator, seconds: float) -> List[Dict]:
+    """Compare generate_notes_batch with one generate_next_notes call per voice."""
+    results = []
+    for voice_count in BATCH_VOICES:
+        voices = [
+            {"voiceId": voice_id, "params": PARAMS, "duration": BATCH_DURATION}
+            for voice_id in range(1, voice_count + 1)
+        ]
+
+        def scalar() -> None:
+            for voice in voices:
+                generator.generate_next_notes("bench", voice["voiceId"], PARAMS, GLOBAL_PARAMS, BATCH_DURATION)
+
+        cases = {
+            "generate_notes_batch": lambda: generator.generate_notes_batch("bench", voices, GLOBAL_PARAMS),
+            "generate_next_notes_per_voice": scalar,
+        }
+        for name, func in cases.items():
+            us = per_call_us(func, seconds)
+            results.append({
+                "name": name,
+                "voices": voice_count,
+                "duration": BATCH_DURATION,
+                "us_per_call": us,
+                "events_per_second": voice_count * BATCH_DURATION / us * 1e6,
+            })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=0.5, help="Time per case")
+    parser.add_argument("--json", help="Write results as JSON to a file, or - for stdout")
+    args = parser.parse_args()
+
+    random.seed(SEED)
+    generator = MusicGenerator()
+    generator.seed_client("bench", SEED)
+
+    results = (
+        bench_helpers(generator, args.seconds)
+        + bench_generate_next_notes(generator, args.seconds)
+        + bench_generate_batch(generator, args.seconds)
+    )
+    cache = get_snap_table.cache_info()
+    results.append({
+        "name": "snap_table_cache",
+        "hits": cache.hits,
+        "misses": cache.misses,
+        "hit_rate": cache.hits / max(1, cache.hits + cache.misses),
+    })
+    for result in results:
+        label = result["name"]
+        if "voices" in result:
+            label += f" voices={result['voices']} duration={result['duration']}"
+            print(f"{label:<52} {result['us_per_call']:>10.2f} us {result['events_per_second']:>12,.0f} events/s")
+        elif "duration" in result:
+            label += f" duration={result['duration']} chord={result['chordProbability']}"
+            print(f"{label:<52} {result['us_per_call']:>10.2f} us {result['events_per_second']:>12,.0f} events/s")
+        elif "hit_rate" in result:
+            print(f"{label:<52} {result['hit_rate']:>10.1%} hits ({result['hits']:,} / {result['hits'] + result['misses']:,})")
+        else:
+            print(f"{label:<52} {result['us_per_call']:>10.2f} us")
+
+    write_json(args.json, "bench_generator", {"seconds": args.seconds, "seed": SEED}, results)
+
+
+if __name__ == "__main__":
+    main()
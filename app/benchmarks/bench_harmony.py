@@ -0,0 +1,128 @@
+"""Cost and effect of steering chord groupings toward the dissonance level.
+
+Reports the cost of importing the module, of scoring a window the first
+time its pitch classes come up and of choosing a grouping after that, and
+generate_next_notes throughput and
+mean chord dissonance with the steering and with plain consecutive row
+notes. The two are alternated for a number of rounds and the fastest round
+of each is kept, so drift in the machine's speed hits both alike.
+Run from the app directory:
+
+    python -m benchmarks.bench_harmony [--seconds 0.5] [--rounds 5] [--json results.json]
+"""
+import argparse
+import importlib
+import random
+import sys
+import time
+from typing import Dict, List
+
+from benchmarks.common import GLOBAL_PARAMS, PARAMS, per_call_us, write_json
+from music_generator import MusicGenerator
+
+DURATION = 256
+DISSONANCE_LEVELS = (0.1, 0.45, 0.9)
+SEED = 1234
+
+
+def consecutive_row(row: bytes, start: int, size: int, bucket: int) -> bytes:
+    """Keep the row in order, as before the steering."""
+    return row
+
+
+def bench_import() -> Dict:
+    assert "music_generator.harmony" not in sys.modules, "harmony was imported before the first chord"
+    start = time.perf_counter()
+    importlib.import_module("music_generator.harmony")
+    return {"name": "import_harmony", "ms": (time.perf_counter() - start) * 1000}
+
+
+def bench_best_grouping(seconds: float) -> List[Dict]:
+    from music_generator import harmony
+
+    rng = random.Random(SEED)
+    windows = [bytes(rng.randrange(12) for _ in range(harmony.CHORD_WINDOW)) for _ in range(1024)]
+    position = iter(range(1 << 62))
+    return [
+        {
+            "name": "score_groupings",
+            "us_per_call": per_call_us(lambda: harmony.score_groupings(windows[next(position) & 1023], 3), seconds),
+        },
+        {
+            "name": "best_grouping",
+            "us_per_call": per_call_us(lambda: harmony.best_grouping(windows[next(position) & 1023], 3, 45), seconds),
+        },
+    ]
+
+
+def bench_generation(seconds: float, rounds: int) -> List[Dict]:
+    from music_generator import harmony
+
+    steer_row = harmony.steer_row
+    results = []
+    params = dict(PARAMS, chordProbability=100)
+    for level in DISSONANCE_LEVELS:
+        global_params = dict(GLOBAL_PARAMS, dissonanceLevel=level)
+        generators = {}
+        times: Dict[bool, List[float]] = {False: [], True: []}
+        for _ in range(rounds):
+            for steering in (False, True):
+                harmony.steer_row = steer_row if steering else consecutive_row
+                generator = generators.setdefault(steering, MusicGenerator(rng=random.Random(SEED)))
+                times[steering].append(per_call_us(
+                    lambda: generator.generate_next_notes("bench", 1, params, global_params, DURATION),
+                    seconds / rounds
+                ))
+        for steering in (False, True):
+            harmony.steer_row = steer_row if steering else consecutive_row
+            generator = MusicGenerator(rng=random.Random(SEED))
+            notes_data = generator.generate_next_notes("bench", 1, params, global_params, 4096)
+            chords = [note_data["notes"] for note_data in notes_data if len(note_data["notes"]) > 1]
+            us = min(times[steering])
+            results.append({
+                "name": "generate_next_notes",
+                "steering": steering,
+                "dissonanceLevel": level,
+                "events_per_second": DURATION / us * 1e6,
+                "us_per_event": us / DURATION,
+                "mean_chord_dissonance": sum(
+                    harmony.dissonance(harmony.pitch_class_mask(chord)) for chord in chords
+                ) / max(len(chords), 1),
+            })
+    harmony.steer_row = steer_row
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=0.5, help="Time per case")
+    parser.add_argument("--rounds", type=int, default=5, help="Alternating rounds per dissonance level")
+    parser.add_argument("--json", help="Write results as JSON to a file, or - for stdout")
+    args = parser.parse_args()
+
+    imported = bench_import()
+    print(f"{imported['name']:<24} {imported['ms']:>10.2f} ms")
+    grouping = bench_best_grouping(args.seconds)
+    for result in grouping:
+        print(f"{result['name']:<24} {result['us_per_call']:>10.2f} us")
+    generation = bench_generation(args.seconds, args.rounds)
+    for result in generation:
+        label = "steered" if result["steering"] else "consecutive"
+        print(
+            f"{label:<12} dissonance={result['dissonanceLevel']:<5} "
+            f"{result['us_per_event']:>7.2f} us/event {result['events_per_second']:>10,.0f} events/s "
+            f"chord dissonance {result['mean_chord_dissonance']:.3f}"
+        )
+    for consecutive, steered in zip(generation[::2], generation[1::2]):
+        overhead = steered["us_per_event"] / consecutive["us_per_event"] - 1
+        print(f"steering overhead at dissonance={steered['dissonanceLevel']:<5} {overhead:>+7.1%}")
+
+    write_json(
+        args.json, "bench_harmony",
+        {"seconds": args.seconds, "rounds": args.rounds, "duration": DURATION, "seed": SEED},
+        [imported] + grouping + generation
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Benchmark the binary note_data encoding against JSON.
+
+Run from the app directory:
+
+    python -m benchmarks.bench_protocol
+"""
+import json
+
+from core.protocol import decode_note_data, encode_note_data
+from core.websocket import encode_message
+from music_generator import MusicGenerator
+from benchmarks.common import GLOBAL_PARAMS, PARAMS, per_call_us
+
+
+def main() -> None:
+    generator = MusicGenerator()
+    print(f"{'events':>7} {'json B':>9} {'binary B':>9} {'ratio':>6} "
+          f"{'json enc us':>12} {'bin enc us':>11} {'json dec us':>12} {'bin dec us':>11}")
+    for events in (4, 64, 1024, 16384):
+        notes_data = generator.generate_next_notes("bench", 1, PARAMS, GLOBAL_PARAMS, events)
+        message = {"type": "note_data", "voiceId": 1, "noteData": notes_data}
+        text = encode_message(message)
+        frame = encode_note_data(1, notes_data)
+        print(
+            f"{events:>7} {len(text):>9} {len(frame):>9} {len(text) / len(frame):>6.1f} "
+            f"{per_call_us(lambda: encode_message(message)):>12.1f} "
+            f"{per_call_us(lambda: encode_note_data(1, notes_data)):>11.1f} "
+            f"{per_call_us(lambda: json.loads(text)):>12.1f} "
+            f"{per_call_us(lambda: decode_note_data(frame)):>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
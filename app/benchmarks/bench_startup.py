@@ -0,0 +1,96 @@
+"""Cold-start benchmark of a worker.
+
+Starts fresh interpreters that import `main`, run the app lifespan and accept
+one websocket client (in-process, as in `load_websocket`), and reports the
+time from spawning the process to each step plus the resident memory of the
+idle worker afterwards. Run from the app directory:
+
+    python -m benchmarks.bench_startup [--runs 5] [--json results.json]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from benchmarks.common import write_json
+
+STEPS = ("imported", "ready", "first_accept", "first_response")
+
+
+async def _child_steps(marks: Dict[str, float]) -> None:
+    from main import app
+
+    marks["imported"] = time.time()
+    from benchmarks.load_websocket import SimulatedClient
+    async with app.router.lifespan_context(app):
+        marks["ready"] = time.time()
+        client = SimulatedClient(app, "startup")
+        await client.connect()
+        marks["first_accept"] = time.time()
+        await client.send({"type": "init"})
+        await client.receive()
+        marks["first_response"] = time.time()
+        await client.close()
+
+
+def child() -> None:
+    """Measure one cold start and print it as JSON."""
+    import asyncio
+    from api.routes.health import resident_memory
+
+    marks: Dict[str, float] = {}
+    asyncio.run(_child_steps(marks))
+    marks["rss_bytes"] = resident_memory()
+    print(json.dumps(marks))
+
+
+def measure(runs: int) -> List[Dict[str, float]]:
+    """Spawn a cold worker per run.
+
+    Args:
+        runs (int): Number of runs
+    Returns:
+        List[Dict[str, float]]: Seconds from spawn to each step and RSS per run
+    """
+    results = []
+    for _ in range(runs):
+        spawned = time.time()
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_startup", "--child"],
+            check=True, capture_output=True, text=True
+        ).stdout
+        marks = json.loads(output.strip().splitlines()[-1])
+        result = {f"{step}_s": marks[step] - spawned for step in STEPS}
+        result["rss_mb"] = marks["rss_bytes"] / 2 ** 20 if marks["rss_bytes"] else None
+        results.append(result)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="Write results as JSON to a file, or - for stdout")
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    runs = measure(args.runs)
+    median = {}
+    for key in runs[0]:
+        values = sorted(run[key] for run in runs if run[key] is not None)
+        median[key] = values[len(values) // 2] if values else None
+    for step in STEPS:
+        print(f"{step:<16} {median[step + '_s'] * 1000:>8.1f} ms")
+    if median["rss_mb"] is not None:
+        print(f"{'idle rss':<16} {median['rss_mb']:>8.1f} MB")
+
+    write_json(args.json, "bench_startup", {"runs": args.runs}, {"median": median, "runs": runs})
+
+
+if __name__ == "__main__":
+    main()
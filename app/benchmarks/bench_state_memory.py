@@ -0,0 +1,91 @@
+"""Measure memory per voice of the previous and the compact VoiceState.
+
+Run from the app directory:
+
+    python -m benchmarks.bench_state_memory [--voices 10000]
+"""
+import argparse
+import random
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, List
+
+from music_generator import MusicGenerator
+from music_generator.state_store import VoiceStateStore
+
+PARAMS = {
+    "duration": 50,
+    "velocity": 0.7,
+    "velocityVariation": 20,
+    "tempo": 120,
+    "rest": False,
+    "restProbability": 0,
+    "chordProbability": 30,
+    "rangeLower": 48,
+    "rangeUpper": 84,
+}
+GLOBAL_PARAMS = {"dissonanceLevel": 0.45}
+
+
+@dataclass
+class LegacyVoiceState:
+    """VoiceState before the compact layout: five lists of MIDI notes."""
+    melody_row: List[int]
+    base_row: List[int]
+    row_retro: List[int]
+    row_inverted: List[int]
+    row_retro_inverted: List[int]
+    sequence_index: int = 0
+
+
+def legacy_voice() -> LegacyVoiceState:
+    base_row = random.sample(range(60, 72), 12)
+    inverted = [(((base_row[0] - (note - base_row[0])) - 60 + 12) % 12) + 60 for note in base_row]
+    return LegacyVoiceState(
+        melody_row=[note + 12 for note in base_row],
+        base_row=base_row,
+        row_retro=base_row[::-1],
+        row_inverted=inverted,
+        row_retro_inverted=inverted[::-1],
+    )
+
+
+def bytes_per_voice(build: Callable[[int], object], voices: int) -> float:
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    keep = build(voices)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del keep
+    return (after - before) / voices
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--voices", type=int, default=10000)
+    args = parser.parse_args()
+
+    def build_legacy(voices: int) -> dict:
+        # Same shape as the previous client_states: {client: {voice: state}}
+        states = {}
+        for i in range(voices):
+            states.setdefault(f"client-{i // 8}", {})[i % 8] = legacy_voice()
+        return states
+
+    def build_compact(voices: int) -> MusicGenerator:
+        generator = MusicGenerator(VoiceStateStore(max_clients=voices, max_voices_per_client=8))
+        for i in range(voices):
+            # One note fills the melody row, like a voice that has been played
+            generator.generate_next_notes(f"client-{i // 8}", i % 8, PARAMS, GLOBAL_PARAMS, 1)
+        return generator
+
+    # Warm up caches shared by all voices so they are not counted per voice
+    build_compact(8)
+    legacy = bytes_per_voice(build_legacy, args.voices)
+    compact = bytes_per_voice(build_compact, args.voices)
+    print(f"legacy VoiceState:  {legacy:8.0f} bytes/voice")
+    print(f"compact VoiceState: {compact:8.0f} bytes/voice ({legacy / compact:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Shared parameters and helpers for the benchmarks."""
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+PARAMS = {
+    "duration": 80,
+    "velocity": 0.7,
+    "velocityVariation": 20,
+    "tempo": 120,
+    "rest": True,
+    "restProbability": 20,
+    "chordProbability": 60,
+    "rangeLower": 48,
+    "rangeUpper": 84,
+}
+GLOBAL_PARAMS = {"dissonanceLevel": 0.45, "tempoFactor": 1.0, "volumeFactor": 1.0}
+
+
+def per_call_us(func: Callable[[], object], seconds: float = 0.5) -> float:
+    """Call a function repeatedly for a while.
+
+    Args:
+        func (Callable[[], object]): Function
+        seconds (float): Time to spend
+    Returns:
+        float: Mean microseconds per call
+    """
+    calls = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        func()
+        calls += 1
+    return elapsed / calls * 1e6
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """Summarize latencies in seconds as milliseconds.
+
+    Args:
+        samples (List[float]): Latencies in seconds
+    Returns:
+        Dict[str, float]: p50, p90, p99, max and mean in milliseconds
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    return {
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p90_ms": percentile(ordered, 90) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+    }
+
+
+def write_json(path: Optional[str], benchmark: str, config: Dict, results: object) -> None:
+    """Write results for regression tracking, "-" meaning stdout.
+
+    Args:
+        path (Optional[str]): Output file, nothing is written when None
+        benchmark (str): Benchmark name
+        config (Dict): Parameters of the run
+        results (object): JSON-serializable results
+    """
+    if path is None:
+        return
+    document = {
+        "benchmark": benchmark,
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": config,
+        "results": results,
+    }
+    text = json.dumps(document, indent=2)
+    if path == "-":
+        print(text)
+    else:
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
@@ -0,0 +1,97 @@
+"""Load test for the generation executor backends.
+
+A few clients keep requesting large batches back to back while many
+clients request a handful of notes at a steady pace; the latency of the
+small requests is reported for each backend. Small clients that hash to
+the same shard as a large one queue behind it by design (per-client state
+affinity), so use more workers than large clients. Run from the app directory:
+
+    python -m benchmarks.load_executor [--seconds 5] [--workers 4]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+from core.executor import BACKENDS, GenerationExecutor
+from music_generator import MusicGenerator
+from benchmarks.common import GLOBAL_PARAMS, PARAMS, percentile
+
+
+async def client_loop(
+    executor: GenerationExecutor,
+    client_id: str,
+    duration: int,
+    interval: float,
+    until: float,
+    latencies: List[float]
+) -> None:
+    # Latency is measured from the scheduled send time, so time spent
+    # waiting for a blocked event loop counts against the request
+    scheduled = time.perf_counter()
+    while scheduled < until:
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        await executor.call("generate_next_notes", client_id, 0, PARAMS, GLOBAL_PARAMS, duration)
+        latencies.append(time.perf_counter() - scheduled)
+        scheduled = scheduled + interval if interval else time.perf_counter()
+
+
+async def run_backend(backend: str, args: argparse.Namespace) -> Dict[str, float]:
+    executor = GenerationExecutor(MusicGenerator(), backend=backend, workers=args.workers)
+    # Warm up worker processes before measuring
+    await asyncio.gather(*(
+        executor.call("init_voice_state", f"client-{i}", 0)
+        for i in range(args.small_clients + args.large_clients)
+    ))
+    large_ids = [f"client-{args.small_clients + i}" for i in range(args.large_clients)]
+    busy_shards = {executor.shard_for(client_id) for client_id in large_ids}
+    until = time.perf_counter() + args.seconds
+    small: Dict[str, List[float]] = {f"client-{i}": [] for i in range(args.small_clients)}
+    large: List[float] = []
+    await asyncio.gather(
+        *(client_loop(executor, client_id, args.small_duration, args.interval, until, latencies)
+          for client_id, latencies in small.items()),
+        *(client_loop(executor, client_id, args.large_duration, 0.0, until, large)
+          for client_id in large_ids)
+    )
+    executor.shutdown()
+    all_small = [latency for latencies in small.values() for latency in latencies]
+    isolated = [
+        latency for client_id, latencies in small.items()
+        if executor.shard_for(client_id) not in busy_shards
+        for latency in latencies
+    ] or [float("nan")]
+    return {
+        "small_requests": len(all_small),
+        "small_p50_ms": statistics.median(all_small) * 1000,
+        "small_p99_ms": percentile(all_small, 99) * 1000,
+        "isolated_p99_ms": percentile(isolated, 99) * 1000,
+        "large_requests": len(large),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--small-clients", type=int, default=16)
+    parser.add_argument("--large-clients", type=int, default=2)
+    parser.add_argument("--small-duration", type=int, default=4)
+    parser.add_argument("--large-duration", type=int, default=20000)
+    parser.add_argument("--interval", type=float, default=0.05, help="Seconds between small requests")
+    parser.add_argument("--backend", choices=BACKENDS, action="append")
+    args = parser.parse_args()
+
+    for backend in args.backend or BACKENDS:
+        result = asyncio.run(run_backend(backend, args))
+        print(
+            f"{backend:<8} small p50 {result['small_p50_ms']:8.2f} ms  "
+            f"p99 {result['small_p99_ms']:8.2f} ms  "
+            f"p99 on shards without large clients {result['isolated_p99_ms']:8.2f} ms  "
+            f"({result['small_requests']} small / {result['large_requests']} large requests)"
+        )
+
+
+if __name__ == "__main__":
+    main()
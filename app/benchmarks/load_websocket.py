@@ -0,0 +1,204 @@
+"""Load generator for the websocket generation path.
+
+Opens simulated clients against `/ws/{client_id}` by calling the ASGI app
+in-process (no sockets), so the measurement covers routing, JSON handling,
+the generation executor and the outbound queues. Each client initializes,
+adds its voices and then requests notes for a random voice, waiting for the
+answer before the next request (plus an optional think time); with
+`--batch` each request refills all voices at once. Admission limits are
+disabled unless `--admission` is given, in which case rejected requests are
+counted separately. Run from the app directory:
+
+    python -m benchmarks.load_websocket [--clients 50] [--seconds 10] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import GLOBAL_PARAMS, PARAMS, latency_summary, write_json
+from core.protocol import NOTE_DATA_BATCH_KIND, decode_note_data, decode_note_data_batch
+
+
+class SimulatedClient:
+    """One websocket connection driven through the ASGI interface."""
+
+    def __init__(self, app: Any, client_id: str):
+        self.app = app
+        self.client_id = client_id
+        self.inbound: asyncio.Queue = asyncio.Queue()
+        self.outbound: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        path = f"/ws/{self.client_id}"
+        scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [],
+            "client": ("127.0.0.1", 0),
+            "server": ("testserver", 80),
+            "subprotocols": [],
+        }
+        self.inbound.put_nowait({"type": "websocket.connect"})
+        self.task = asyncio.create_task(self.app(scope, self.inbound.get, self.outbound.put))
+        message = await self.outbound.get()
+        if message["type"] != "websocket.accept":
+            raise RuntimeError(f"Connection of {self.client_id} refused: {message}")
+
+    async def send(self, data: Dict) -> None:
+        await self.inbound.put({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def receive(self) -> Dict:
+        """Receive the next message, decoding binary note_data frames.
+
+        Returns:
+            Dict: Message
+        """
+        message = await self.outbound.get()
+        if message["type"] == "websocket.close":
+            raise ConnectionError(f"{self.client_id} closed: {message.get('code')}")
+        frame = message.get("bytes")
+        if frame is not None:
+            if frame[0] == NOTE_DATA_BATCH_KIND:
+                return {"type": "note_data_batch", "voices": decode_note_data_batch(frame)}
+            voice_id, notes_data = decode_note_data(frame)
+            return {"type": "note_data", "voiceId": voice_id, "noteData": notes_data}
+        return json.loads(message["text"])
+
+    async def close(self) -> None:
+        await self.inbound.put({"type": "websocket.disconnect", "code": 1000})
+        if self.task is not None:
+            await self.task
+
+
+async def run_client(
+    app: Any,
+    index: int,
+    args: argparse.Namespace,
+    deadline: float,
+    stats: Dict[str, Any]
+) -> None:
+    client = SimulatedClient(app, f"load-{index}")
+    await client.connect()
+    rng = random.Random(index)
+    try:
+        await client.send({"type": "init", "encoding": args.encoding, "seed": index})
+        await client.receive()
+        for voice_id in range(args.voices):
+            await client.send({"type": "voice_added", "voiceId": voice_id})
+            await client.receive()
+
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            if args.batch:
+                # Refill every voice with one message
+                await client.send({
+                    "type": "generate_notes_batch",
+                    "voices": [
+                        {
+                            "voiceId": voice_id,
+                            "params": dict(PARAMS, chordProbability=rng.choice((0, 30, 60, 90))),
+                            "duration": args.duration,
+                        }
+                        for voice_id in range(args.voices)
+                    ],
+                    "globalParams": GLOBAL_PARAMS,
+                })
+            else:
+                await client.send({
+                    "type": "generate_notes",
+                    "voiceId": rng.randrange(args.voices),
+                    "params": dict(PARAMS, chordProbability=rng.choice((0, 30, 60, 90))),
+                    "globalParams": GLOBAL_PARAMS,
+                    "duration": args.duration,
+                })
+            response = await client.receive()
+            stats["latencies"].append(time.perf_counter() - start)
+            if response.get("type") == "note_data":
+                stats["events"] += len(response["noteData"])
+            elif response.get("type") == "note_data_batch":
+                stats["events"] += sum(len(voice["noteData"]) for voice in response["voices"])
+            elif response.get("code") == "rate_limited":
+                stats["rejected"] += 1
+            else:
+                stats["errors"] += 1
+            if args.think:
+                await asyncio.sleep(rng.uniform(0, 2 * args.think))
+    except ConnectionError:
+        stats["errors"] += 1
+    finally:
+        await client.close()
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from core import admission_controller
+    from main import app
+
+    if not args.admission:
+        admission_controller.events_per_second = 0
+        admission_controller.max_concurrent = 0
+
+    stats: Dict[str, Any] = {"latencies": [], "events": 0, "errors": 0, "rejected": 0}
+    async with app.router.lifespan_context(app):
+        start = time.perf_counter()
+        deadline = start + args.seconds
+        await asyncio.gather(*(
+            run_client(app, index, args, deadline, stats) for index in range(args.clients)
+        ))
+        elapsed = time.perf_counter() - start
+
+    latencies: List[float] = stats["latencies"]
+    return {
+        "requests": len(latencies),
+        "errors": stats["errors"],
+        "rejected": stats["rejected"],
+        "elapsed_s": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "events_per_second": stats["events"] / elapsed,
+        "latency": latency_summary(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Websocket load generator")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--voices", type=int, default=4, help="Voices per client")
+    parser.add_argument("--duration", type=int, default=8, help="Events per generate_notes request")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--think", type=float, default=0.0, help="Mean pause between requests in seconds")
+    parser.add_argument("--encoding", choices=("json", "binary"), default="json")
+    parser.add_argument(
+        "--batch", action="store_true",
+        help="Refill all voices with one generate_notes_batch instead of one voice per generate_notes"
+    )
+    parser.add_argument(
+        "--admission", action="store_true",
+        help="Keep the admission limits of the environment instead of disabling them"
+    )
+    parser.add_argument("--json", help="Write results as JSON to a file, or - for stdout")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    latency = results["latency"]
+    print(f"clients={args.clients} voices={args.voices} duration={args.duration} "
+          f"encoding={args.encoding} batch={args.batch}")
+    print(f"requests: {results['requests']:,} ({results['requests_per_second']:,.0f}/s), "
+          f"events: {results['events_per_second']:,.0f}/s, errors: {results['errors']}, "
+          f"rejected: {results['rejected']}")
+    if latency:
+        print(f"latency ms: p50 {latency['p50_ms']:.2f}  p90 {latency['p90_ms']:.2f}  "
+              f"p99 {latency['p99_ms']:.2f}  max {latency['max_ms']:.2f}")
+
+    write_json(args.json, "load_websocket", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
+from core.admission import admission_controller
 from core.websocket import connection_manager
+from core.state_backend import state_backend
 
-__all__ = ["connection_manager"]
-
+__all__ = ["admission_controller", "connection_manager", "state_backend"]
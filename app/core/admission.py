@@ -0,0 +1,245 @@
+"""Admission control for generation requests.
+
+Every client gets a token bucket of generated events (notes, chords and
+rests) refilled at `events_per_second`, a cap on the events of one request
+and on its number of voices, and the worker caps the generation calls in
+flight over all clients. Requests over a limit are rejected right away with
+`RateLimited` instead of being queued, so one misbehaving tab cannot take
+over a worker's CPU or memory. A limit of 0 disables it.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Hashable, Iterator, Optional, Set
+
+from core.metrics import metrics
+
+REJECTED = metrics.counter("admission_rejected_total", "Requests rejected by admission control", ("reason",))
+
+
+class RateLimited(Exception):
+    """A request was rejected by admission control."""
+
+    def __init__(self, reason: str, message: str, retry_after: Optional[float] = None):
+        """Initialize the rejection.
+
+        Args:
+            reason (str): rate, duration, voices or overloaded
+            message (str): Human-readable explanation
+            retry_after (Optional[float]): Seconds until the request could pass, None if it never will as is
+        """
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Tokens refilled at a constant rate up to a burst size."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> float:
+        """Get the current tokens, negative while in debt."""
+        self._refill()
+        return self.tokens
+
+    def take(self, amount: float) -> float:
+        """Take tokens if enough are available.
+
+        Args:
+            amount (float): Tokens, not negative
+        Returns:
+            float: 0 when taken, otherwise seconds until enough are available
+        """
+        if amount < 0:
+            raise ValueError(f"Cannot take a negative number of tokens: {amount}")
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def charge(self, amount: float) -> None:
+        """Take tokens unconditionally, going into debt for costs only known afterwards.
+
+        Args:
+            amount (float): Tokens, not negative
+        """
+        if amount < 0:
+            raise ValueError(f"Cannot charge a negative number of tokens: {amount}")
+        self._refill()
+        self.tokens -= amount
+
+
+class ClientAdmission:
+    __slots__ = ("bucket", "voices")
+
+    def __init__(self, bucket: Optional[TokenBucket]):
+        self.bucket = bucket
+        self.voices: Set[Hashable] = set()
+
+
+class AdmissionController:
+    """Per-client and per-worker limits of generation requests."""
+
+    def __init__(
+        self,
+        events_per_second: float = 2000,
+        burst: float = 4096,
+        max_duration: int = 1024,
+        max_voices: int = 32,
+        max_concurrent: int = 256
+    ):
+        """Initialize the controller.
+
+        Args:
+            events_per_second (float): Events a client may have generated per second on average
+            burst (float): Events a client may have generated at once after idling
+            max_duration (int): Events of one voice in one request
+            max_voices (int): Voices per client, at most the voice state store's
+                `max_voices_per_client` or admitted voices lose their state
+            max_concurrent (int): Generation calls in flight over all clients of the worker
+        """
+        self.events_per_second = events_per_second
+        # A request of max_duration events must be able to pass
+        self.burst = max(burst, max_duration)
+        self.max_duration = max_duration
+        self.max_voices = max_voices
+        self.max_concurrent = max_concurrent
+        self.clients: Dict[str, ClientAdmission] = {}
+        self.in_flight = 0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """Create a controller configured by environment variables.
+
+        ADMISSION_EVENTS_PER_SECOND (2000), ADMISSION_BURST (4096),
+        ADMISSION_MAX_DURATION (1024), ADMISSION_MAX_VOICES and
+        ADMISSION_MAX_CONCURRENT (256); 0 disables a limit. The voice limit
+        defaults to, and never exceeds, STATE_MAX_VOICES (32), the voices per
+        client the voice state store keeps.
+
+        Returns:
+            AdmissionController: Controller
+        """
+        store_voices = int(os.getenv("STATE_MAX_VOICES", "32"))
+        max_voices = int(os.getenv("ADMISSION_MAX_VOICES", str(store_voices)))
+        return cls(
+            events_per_second=float(os.getenv("ADMISSION_EVENTS_PER_SECOND", "2000")),
+            burst=float(os.getenv("ADMISSION_BURST", "4096")),
+            max_duration=int(os.getenv("ADMISSION_MAX_DURATION", "1024")),
+            max_voices=min(max_voices, store_voices) if max_voices else store_voices,
+            max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "256"))
+        )
+
+    def _client(self, client_id: str) -> ClientAdmission:
+        client = self.clients.get(client_id)
+        if client is None:
+            bucket = TokenBucket(self.events_per_second, self.burst) if self.events_per_second > 0 else None
+            client = self.clients[client_id] = ClientAdmission(bucket)
+        return client
+
+    def _reject(self, reason: str, message: str, retry_after: Optional[float] = None) -> RateLimited:
+        REJECTED.inc(labels=(reason,))
+        return RateLimited(reason, message, retry_after)
+
+    def admit_events(self, client_id: str, *durations: int) -> None:
+        """Admit a request for events, taking them all or none.
+
+        Args:
+            client_id (str): Client ID
+            *durations (int): Requested events per voice, not negative
+        """
+        if any(duration < 0 for duration in durations):
+            raise ValueError("Requested events cannot be negative")
+        if self.max_duration and any(duration > self.max_duration for duration in durations):
+            raise self._reject("duration", f"At most {self.max_duration} events per voice and request")
+        bucket = self._client(client_id).bucket
+        if bucket is not None:
+            wait = bucket.take(sum(durations))
+            if wait:
+                raise self._reject("rate", "Too many events requested, slow down", wait)
+
+    def admit_open_ended(self, client_id: str) -> None:
+        """Admit a request whose number of events is only known afterwards.
+
+        It passes while the client has tokens left; `charge` bills it after.
+
+        Args:
+            client_id (str): Client ID
+        """
+        bucket = self._client(client_id).bucket
+        if bucket is not None and (tokens := bucket.available()) <= 0:
+            raise self._reject("rate", "Too many events requested, slow down", (1 - tokens) / bucket.rate)
+
+    def charge(self, client_id: str, events: int) -> None:
+        """Bill events generated by an open-ended request.
+
+        Args:
+            client_id (str): Client ID
+            events (int): Generated events
+        """
+        bucket = self._client(client_id).bucket
+        if bucket is not None:
+            bucket.charge(events)
+
+    def admit_voices(self, client_id: str, *voice_ids: Hashable) -> None:
+        """Admit a request touching voices, counting new ones against the limit.
+
+        Args:
+            client_id (str): Client ID
+            *voice_ids (Hashable): Voice IDs
+        """
+        voices = self._client(client_id).voices
+        new_voices = set(voice_ids) - voices
+        if self.max_voices and len(voices) + len(new_voices) > self.max_voices:
+            raise self._reject("voices", f"At most {self.max_voices} voices per client")
+        voices.update(new_voices)
+
+    def track_voice(self, client_id: str, voice_id: Hashable) -> None:
+        """Count a voice that exists already, e.g. one restored from the state backend."""
+        self._client(client_id).voices.add(voice_id)
+
+    def remove_voice(self, client_id: str, voice_id: Hashable) -> None:
+        client = self.clients.get(client_id)
+        if client is not None:
+            client.voices.discard(voice_id)
+
+    def rename_voice(self, client_id: str, old_id: Hashable, new_id: Hashable) -> None:
+        client = self.clients.get(client_id)
+        if client is not None and old_id in client.voices:
+            client.voices.discard(old_id)
+            client.voices.add(new_id)
+
+    def remove_client(self, client_id: str) -> None:
+        self.clients.pop(client_id, None)
+
+    @contextmanager
+    def generation_slot(self) -> Iterator[None]:
+        """Hold one of the worker's generation slots for the duration of a call."""
+        if self.max_concurrent and self.in_flight >= self.max_concurrent:
+            raise self._reject("overloaded", "Server busy, try again shortly", 0.1)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+
+admission_controller = AdmissionController.from_env()
+
+metrics.gauge_callback(
+    "admission_in_flight", "Generation calls holding a slot", lambda: admission_controller.in_flight
+)
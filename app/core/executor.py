@@ -0,0 +1,191 @@
+import asyncio
+import os
+import zlib
+from concurrent.futures import Executor
+from typing import Any, Dict, Iterable, List, Optional, TYPE_CHECKING
+from music_generator import MusicGenerator
+from core.metrics import metrics
+
+if TYPE_CHECKING:
+    from music_generator.replay import SessionRecorder
+
+BACKENDS = ("inline", "thread", "process")
+# Methods whose results are generated events, counted in the metrics
+GENERATING_METHODS = ("generate_next_notes", "generate_notes_batch", "fill_until", "generate_batch")
+
+GENERATION_SECONDS = metrics.histogram(
+    "generation_seconds", "Time of a generator call including waiting for its shard", ("method",)
+)
+GENERATED_EVENTS = metrics.counter("generated_events_total", "Generated events (notes, chords and rests)")
+GENERATED_NOTES = metrics.counter("generated_notes_total", "Generated notes")
+
+# MusicGenerator owned by a process pool worker
+_worker_generator: Optional[MusicGenerator] = None
+
+
+def _init_worker() -> None:
+    global _worker_generator
+    _worker_generator = MusicGenerator()
+
+
+def _call_worker(method: str, client_id: str, args: tuple) -> Any:
+    return getattr(_worker_generator, method)(client_id, *args)
+
+
+def _voice_events(method: str, result: Any) -> Iterable[List[Dict]]:
+    """Get the events of each voice from the result of a generating method."""
+    if method == "generate_notes_batch":
+        return (voice["noteData"] for voice in result)
+    if method == "generate_batch":
+        return result.values()
+    return (result,)
+
+
+class GenerationExecutor:
+    """Run MusicGenerator calls off the event loop.
+
+    Backends:
+        inline: call the generator directly on the event loop
+        thread: one single-thread executor per shard, sharing the generator
+        process: one single-process executor per shard, each owning the
+            generator state of the clients assigned to it
+
+    A client is always routed to the same shard, so its calls run in order
+    and, for the process backend, against the process holding its state.
+    Each shard admits at most `max_pending` calls; further callers wait
+    for a slot, which pushes back on the sockets producing the work.
+    """
+
+    def __init__(
+        self,
+        music_generator: MusicGenerator,
+        backend: str = "inline",
+        workers: int = 1,
+        max_pending: int = 64,
+        recorder: Optional["SessionRecorder"] = None
+    ):
+        """Initialize the executor.
+
+        Args:
+            music_generator (MusicGenerator): Generator used by the inline and thread backends
+            backend (str): inline, thread or process
+            workers (int): Number of shards
+            max_pending (int): Calls admitted per shard before callers wait
+            recorder (Optional[SessionRecorder]): Records every call for replay
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown generation backend: {backend}")
+        self.music_generator = music_generator
+        self.backend = backend
+        self.workers = max(1, workers) if backend != "inline" else 1
+        self.max_pending = max_pending
+        self.recorder = recorder
+        self._executors: List[Executor] = []
+        self._slots: List[Optional[asyncio.Semaphore]] = [None] * self.workers
+        self.pending = [0] * self.workers
+
+    @classmethod
+    def from_env(cls, music_generator: MusicGenerator) -> "GenerationExecutor":
+        """Create an executor configured by environment variables.
+
+        GENERATION_BACKEND (inline), GENERATION_WORKERS (CPU count),
+        GENERATION_MAX_PENDING (64) and SESSION_RECORD_PATH (unset, no recording).
+
+        Args:
+            music_generator (MusicGenerator): Generator used by the inline and thread backends
+        Returns:
+            GenerationExecutor: Executor
+        """
+        recorder = None
+        if os.getenv("SESSION_RECORD_PATH"):
+            # Only import the replay tooling when recording
+            from music_generator.replay import SessionRecorder
+            recorder = SessionRecorder.from_env()
+        return cls(
+            music_generator,
+            backend=os.getenv("GENERATION_BACKEND", "inline"),
+            workers=int(os.getenv("GENERATION_WORKERS", str(os.cpu_count() or 1))),
+            max_pending=int(os.getenv("GENERATION_MAX_PENDING", "64")),
+            recorder=recorder
+        )
+
+    def shard_for(self, client_id: str) -> int:
+        """Get the shard a client is pinned to.
+
+        Args:
+            client_id (str): Client ID
+        Returns:
+            int: Shard index
+        """
+        return zlib.crc32(client_id.encode()) % self.workers
+
+    def _get_executor(self, shard: int) -> Executor:
+        if not self._executors:
+            # Imported on first use: the process pool pulls in multiprocessing
+            if self.backend == "thread":
+                from concurrent.futures import ThreadPoolExecutor
+                self._executors = [
+                    ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"generation-{i}")
+                    for i in range(self.workers)
+                ]
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+                self._executors = [
+                    ProcessPoolExecutor(max_workers=1, initializer=_init_worker)
+                    for _ in range(self.workers)
+                ]
+        return self._executors[shard]
+
+    async def call(self, method: str, client_id: str, *args) -> Any:
+        """Call a MusicGenerator method for a client.
+
+        Args:
+            method (str): Method name, e.g. "generate_next_notes"
+            client_id (str): Client ID, passed as the first argument
+            *args: Remaining arguments
+        Returns:
+            Any: Result of the method
+        """
+        generating = method in GENERATING_METHODS
+        start = GENERATION_SECONDS.start() if generating else None
+        result = await self._call(method, client_id, args)
+        if generating:
+            GENERATION_SECONDS.stop(start, (method,))
+            for notes_data in _voice_events(method, result):
+                GENERATED_EVENTS.inc(len(notes_data))
+                GENERATED_NOTES.inc(sum(len(note_data["notes"]) for note_data in notes_data))
+        if self.recorder is not None:
+            # Calls of a client run in order on its shard, so they are recorded in order
+            self.recorder.record(client_id, method, args, result)
+        return result
+
+    async def _call(self, method: str, client_id: str, args: tuple) -> Any:
+        if self.backend == "inline":
+            return getattr(self.music_generator, method)(client_id, *args)
+
+        shard = self.shard_for(client_id)
+        slots = self._slots[shard]
+        if slots is None:
+            # Created lazily so the semaphore binds to the running loop
+            slots = self._slots[shard] = asyncio.Semaphore(self.max_pending)
+
+        async with slots:
+            self.pending[shard] += 1
+            try:
+                loop = asyncio.get_running_loop()
+                executor = self._get_executor(shard)
+                if self.backend == "thread":
+                    return await loop.run_in_executor(
+                        executor, lambda: getattr(self.music_generator, method)(client_id, *args)
+                    )
+                return await loop.run_in_executor(executor, _call_worker, method, client_id, args)
+            finally:
+                self.pending[shard] -= 1
+
+    def shutdown(self) -> None:
+        """Stop all workers."""
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = []
+        if self.recorder is not None:
+            self.recorder.close()
@@ -0,0 +1,237 @@
+"""In-process metrics with Prometheus text exposition.
+
+Updates are plain dictionary and list operations without locks. On the
+event loop they are exact; increments from executor threads may very rarely
+be lost, which is acceptable for monitoring. Histograms can time only every
+Nth call (METRICS_TIMING_SAMPLE) to keep `perf_counter` calls off hot paths.
+"""
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[str, ...]
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+TIMING_SAMPLE = max(1, int(os.getenv("METRICS_TIMING_SAMPLE", "1")))
+
+
+def _format_labels(names: Tuple[str, ...], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing value per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, labels: Labels = ()) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, labels: Labels = ()) -> float:
+        return self.values.get(labels, 0)
+
+    def expose(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in self.values.items()
+        ]
+
+
+class Histogram:
+    """Distribution of observed values in fixed buckets per label combination."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+        sample_every: int = TIMING_SAMPLE
+    ):
+        """Initialize the histogram.
+
+        Args:
+            name (str): Metric name
+            description (str): Description
+            label_names (Tuple[str, ...]): Label names
+            buckets (Tuple[float, ...]): Upper bounds, ascending
+            sample_every (int): Time only every Nth call to `start`
+        """
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self.sample_every = sample_every
+        # Per labels: [count per bucket (+Inf last), sum]
+        self.values: Dict[Labels, List] = {}
+        self._calls = 0
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def start(self) -> Optional[float]:
+        """Start timing a call unless it is skipped by sampling.
+
+        Returns:
+            Optional[float]: Start time to pass to `stop`, None when not sampled
+        """
+        self._calls += 1
+        if self._calls % self.sample_every:
+            return None
+        return time.perf_counter()
+
+    def stop(self, start: Optional[float], labels: Labels = ()) -> None:
+        """Observe the time since `start`, if it was sampled.
+
+        Args:
+            start (Optional[float]): Result of `start`
+            labels (Labels): Label values
+        """
+        if start is not None:
+            self.observe(time.perf_counter() - start, labels)
+
+    def expose(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """Gauge or counter read from existing state when metrics are collected."""
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        kind: str,
+        func: Callable[[], Union[float, Dict[Labels, float]]],
+        label_names: Tuple[str, ...] = ()
+    ):
+        """Initialize the metric.
+
+        Args:
+            name (str): Metric name
+            description (str): Description
+            kind (str): gauge or counter
+            func (Callable): Returns the value, or values by label values
+            label_names (Tuple[str, ...]): Label names
+        """
+        self.name = name
+        self.description = description
+        self.kind = kind
+        self.func = func
+        self.label_names = label_names
+
+    def expose(self) -> List[str]:
+        values = self.func()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in values.items()
+        ]
+
+
+class MetricsRegistry:
+    """Named metrics exposed together."""
+
+    def __init__(self):
+        self.metrics: Dict[str, Union[Counter, Histogram, CallbackMetric]] = {}
+        # Metrics whose collection failed, logged once rather than on every scrape
+        self.failed: Set[str] = set()
+
+    def _register(self, metric):
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            # Registering a name again returns the metric already collecting it
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, description, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        label_names: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+        sample_every: int = TIMING_SAMPLE
+    ) -> Histogram:
+        return self._register(Histogram(name, description, label_names, buckets, sample_every))
+
+    def gauge_callback(
+        self,
+        name: str,
+        description: str,
+        func: Callable[[], Union[float, Dict[Labels, float]]],
+        label_names: Tuple[str, ...] = ()
+    ) -> CallbackMetric:
+        """Register a gauge computed at collection time, replacing an earlier one."""
+        metric = self.metrics[name] = CallbackMetric(name, description, "gauge", func, label_names)
+        return metric
+
+    def counter_callback(
+        self,
+        name: str,
+        description: str,
+        func: Callable[[], Union[float, Dict[Labels, float]]],
+        label_names: Tuple[str, ...] = ()
+    ) -> CallbackMetric:
+        """Register a counter kept elsewhere and read at collection time, replacing an earlier one."""
+        metric = self.metrics[name] = CallbackMetric(name, description, "counter", func, label_names)
+        return metric
+
+    def expose(self) -> str:
+        """Render all metrics in the Prometheus text format (version 0.0.4).
+
+        Returns:
+            str: Exposition
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.expose())
+            except Exception:
+                if metric.name not in self.failed:
+                    self.failed.add(metric.name)
+                    logger.exception("Error collecting metric %s", metric.name)
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,209 @@
+"""Compact binary encoding for `note_data` and `note_data_batch` frames.
+
+Negotiated with `"encoding": "binary"` in the `init` message; every other
+message stays JSON. All values are little-endian:
+
+    frame   := kind:u8 (=1) version:u8 (=2) voice
+    batch   := kind:u8 (=2) version:u8 (=2) voice_count:u16 voice*
+    room    := kind:u8 (=3) version:u8 (=2) length:u16 utf8 voice
+    voice   := voice_id beat:f64 time:f64 event_count:u32 event*
+    voice_id:= 0:u8 id:i64 | 1:u8 length:u16 utf8
+    event   := duration:u8 note_count:u8 velocity:f32 tempo:f32 note:u8*
+
+`duration` indexes DURATION_CODES. `beat` and `time` are the start of the
+first event on the voice's clock; events are contiguous, so the decoder
+derives the start of every other event from the durations and tempos (the
+times within microseconds of the server's, as tempos are float32). Version 1
+frames, without the clock, are still decoded. `room` frames are the
+`note_data` frames of a room's shared stream, prefixed with the room ID.
+"""
+import struct
+from typing import Dict, List, Tuple, Union
+
+from music_generator import NOTE_DURATION_BEATS
+
+ENCODINGS = ("json", "binary")
+NOTE_DATA_KIND = 1
+NOTE_DATA_BATCH_KIND = 2
+ROOM_NOTE_DATA_KIND = 3
+PROTOCOL_VERSION = 2
+DURATION_CODES = ('2n', '4n', '8n', '16n', '32n', '1n')
+
+_DURATION_INDEX = {duration: index for index, duration in enumerate(DURATION_CODES)}
+_HEADER = struct.Struct("<BB")
+_ID_TYPE = struct.Struct("<B")
+_INT_ID = struct.Struct("<q")
+_STR_ID = struct.Struct("<H")
+_CLOCK = struct.Struct("<dd")
+_COUNT = struct.Struct("<I")
+_VOICE_COUNT = struct.Struct("<H")
+_EVENT = struct.Struct("<BBff")
+
+
+def _encode_voice(parts: List[bytes], voice_id: Union[int, str], notes_data: List[Dict]) -> None:
+    if isinstance(voice_id, int):
+        parts.append(_ID_TYPE.pack(0))
+        parts.append(_INT_ID.pack(voice_id))
+    else:
+        encoded_id = str(voice_id).encode()
+        parts.append(_ID_TYPE.pack(1))
+        parts.append(_STR_ID.pack(len(encoded_id)))
+        parts.append(encoded_id)
+    if notes_data:
+        first = notes_data[0]
+        parts.append(_CLOCK.pack(first.get("beat", 0.0), first.get("time", 0.0)))
+    else:
+        parts.append(_CLOCK.pack(0.0, 0.0))
+    parts.append(_COUNT.pack(len(notes_data)))
+    pack_event = _EVENT.pack
+    duration_index = _DURATION_INDEX
+    for note_data in notes_data:
+        notes = note_data["notes"]
+        parts.append(pack_event(
+            duration_index[note_data["duration"]],
+            len(notes),
+            note_data["velocity"],
+            note_data["tempo"]
+        ))
+        parts.append(bytes(notes))
+
+
+def _decode_voice(frame: bytes, offset: int, version: int) -> Tuple[Union[int, str], List[Dict], int]:
+    id_type, = _ID_TYPE.unpack_from(frame, offset)
+    offset += _ID_TYPE.size
+    if id_type == 0:
+        voice_id, = _INT_ID.unpack_from(frame, offset)
+        offset += _INT_ID.size
+    else:
+        length, = _STR_ID.unpack_from(frame, offset)
+        offset += _STR_ID.size
+        voice_id = frame[offset:offset + length].decode()
+        offset += length
+    clock = None
+    if version >= 2:
+        clock = _CLOCK.unpack_from(frame, offset)
+        offset += _CLOCK.size
+    count, = _COUNT.unpack_from(frame, offset)
+    offset += _COUNT.size
+
+    notes_data = []
+    unpack_event = _EVENT.unpack_from
+    event_size = _EVENT.size
+    for _ in range(count):
+        duration, note_count, velocity, tempo = unpack_event(frame, offset)
+        offset += event_size
+        note_data = {
+            "notes": list(frame[offset:offset + note_count]),
+            "duration": DURATION_CODES[duration],
+            "velocity": velocity,
+            "tempo": tempo
+        }
+        if clock is not None:
+            beat, seconds = clock
+            note_data["beat"] = beat
+            note_data["time"] = seconds
+            beats = NOTE_DURATION_BEATS[note_data["duration"]]
+            clock = (beat + beats, seconds + beats * 60 / max(tempo, 1.0))
+        notes_data.append(note_data)
+        offset += note_count
+    return voice_id, notes_data, offset
+
+
+def _check_header(frame: bytes, expected_kind: int) -> int:
+    kind, version = _HEADER.unpack_from(frame, 0)
+    if kind != expected_kind or version not in (1, PROTOCOL_VERSION):
+        raise ValueError(f"Unsupported frame kind {kind} version {version}")
+    return version
+
+
+def encode_note_data(voice_id: Union[int, str], notes_data: List[Dict]) -> bytes:
+    """Encode a note_data frame.
+
+    Args:
+        voice_id (Union[int, str]): Voice ID
+        notes_data (List[Dict]): Events with notes, duration, velocity and tempo
+    Returns:
+        bytes: Frame
+    """
+    parts = [_HEADER.pack(NOTE_DATA_KIND, PROTOCOL_VERSION)]
+    _encode_voice(parts, voice_id, notes_data)
+    return b"".join(parts)
+
+
+def decode_note_data(frame: bytes) -> Tuple[Union[int, str], List[Dict]]:
+    """Decode a note_data frame.
+
+    Velocities and tempos come back with float32 precision.
+
+    Args:
+        frame (bytes): Frame
+    Returns:
+        Tuple[Union[int, str], List[Dict]]: Voice ID and events
+    """
+    version = _check_header(frame, NOTE_DATA_KIND)
+    voice_id, notes_data, _ = _decode_voice(frame, _HEADER.size, version)
+    return voice_id, notes_data
+
+
+def encode_note_data_batch(voices: List[Dict]) -> bytes:
+    """Encode a note_data_batch frame.
+
+    Args:
+        voices (List[Dict]): voiceId and noteData per voice
+    Returns:
+        bytes: Frame
+    """
+    parts = [_HEADER.pack(NOTE_DATA_BATCH_KIND, PROTOCOL_VERSION), _VOICE_COUNT.pack(len(voices))]
+    for voice in voices:
+        _encode_voice(parts, voice["voiceId"], voice["noteData"])
+    return b"".join(parts)
+
+
+def decode_note_data_batch(frame: bytes) -> List[Dict]:
+    """Decode a note_data_batch frame.
+
+    Args:
+        frame (bytes): Frame
+    Returns:
+        List[Dict]: voiceId and noteData per voice
+    """
+    version = _check_header(frame, NOTE_DATA_BATCH_KIND)
+    count, = _VOICE_COUNT.unpack_from(frame, _HEADER.size)
+    offset = _HEADER.size + _VOICE_COUNT.size
+    voices = []
+    for _ in range(count):
+        voice_id, notes_data, offset = _decode_voice(frame, offset, version)
+        voices.append({"voiceId": voice_id, "noteData": notes_data})
+    return voices
+
+
+def encode_room_note_data(room_id: str, voice_id: Union[int, str], notes_data: List[Dict]) -> bytes:
+    """Encode a note_data frame of a room's stream.
+
+    Args:
+        room_id (str): Room ID
+        voice_id (Union[int, str]): Voice ID
+        notes_data (List[Dict]): Events with notes, duration, velocity and tempo
+    Returns:
+        bytes: Frame
+    """
+    encoded_id = room_id.encode()
+    parts = [_HEADER.pack(ROOM_NOTE_DATA_KIND, PROTOCOL_VERSION), _STR_ID.pack(len(encoded_id)), encoded_id]
+    _encode_voice(parts, voice_id, notes_data)
+    return b"".join(parts)
+
+
+def decode_room_note_data(frame: bytes) -> Tuple[str, Union[int, str], List[Dict]]:
+    """Decode a note_data frame of a room's stream.
+
+    Args:
+        frame (bytes): Frame
+    Returns:
+        Tuple[str, Union[int, str], List[Dict]]: Room ID, voice ID and events
+    """
+    version = _check_header(frame, ROOM_NOTE_DATA_KIND)
+    length, = _STR_ID.unpack_from(frame, _HEADER.size)
+    offset = _HEADER.size + _STR_ID.size
+    room_id = frame[offset:offset + length].decode()
+    voice_id, notes_data, _ = _decode_voice(frame, offset + length, version)
+    return room_id, voice_id, notes_data
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+from core.state_backend import (
+    MessageHandler,
+    StateBackend,
+    decode_voice_field,
+    encode_voice_field
+)
+
+
+# Seconds before the subscriber reconnects, doubling up to the maximum
+RESUBSCRIBE_DELAY = 1.0
+RESUBSCRIBE_MAX_DELAY = 30.0
+
+
+class RedisError(Exception):
+    pass
+
+
+def encode_command(*args) -> bytes:
+    """Encode a command as a RESP array of bulk strings."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    """Read one RESP2 reply.
+
+    Args:
+        reader (asyncio.StreamReader): Connection reader
+    Returns:
+        Any: str for simple strings, int, bytes or None for bulk strings, list for arrays
+    """
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by server")
+    prefix, payload = line[:1], line[1:-2]
+    if prefix == b"+":
+        return payload.decode()
+    if prefix == b"-":
+        raise RedisError(payload.decode())
+    if prefix == b":":
+        return int(payload)
+    if prefix == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if prefix == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RedisError(f"Unexpected reply: {line!r}")
+
+
+class RedisConnection:
+    """A single connection speaking the Redis protocol (RESP2)."""
+
+    def __init__(self, host: str, port: int, db: int = 0, password: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._execute("AUTH", self.password)
+        if self.db:
+            await self._execute("SELECT", self.db)
+
+    async def _execute(self, *args) -> Any:
+        self.writer.write(encode_command(*args))
+        await self.writer.drain()
+        return await read_reply(self.reader)
+
+    async def execute(self, *args) -> Any:
+        """Send a command and wait for its reply, connecting on first use.
+
+        Args:
+            *args: Command name and arguments
+        Returns:
+            Any: Reply
+        """
+        replies = await self.pipeline(args)
+        return replies[0]
+
+    async def pipeline(self, *commands: Sequence) -> List[Any]:
+        """Send several commands in one write and wait for all their replies.
+
+        Every reply is read even when one is an error, so the connection
+        stays in step; the first error is raised afterwards. The connection
+        is closed when the exchange fails or is cancelled part way.
+
+        Args:
+            *commands (Sequence): Command name and arguments of each command
+        Returns:
+            List[Any]: Replies in command order
+        """
+        async with self._lock:
+            replies = []
+            error = None
+            try:
+                if self.writer is None or self.writer.is_closing():
+                    await self.connect()
+                self.writer.write(b"".join(encode_command(*command) for command in commands))
+                await self.writer.drain()
+                for _ in commands:
+                    try:
+                        replies.append(await read_reply(self.reader))
+                    except RedisError as e:
+                        replies.append(e)
+                        error = error or e
+            except BaseException:
+                # A broken, cancelled or timed out exchange leaves replies
+                # unread; drop the connection so the next command reconnects
+                # instead of reading them as its own
+                self.close()
+                raise
+        if error is not None:
+            raise error
+        return replies
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class RedisBackend(StateBackend):
+    """State and pub/sub backend on a Redis-protocol server.
+
+    Voice states of a client live in one hash (`<prefix>:client:<id>`,
+    field = JSON-encoded voice ID) that expires `ttl_seconds` after the last
+    write. Subscriptions share one extra connection read by a background task.
+    """
+
+    shared = True
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        prefix: str = "twelve-tones",
+        ttl_seconds: int = 3600
+    ):
+        self.connection = RedisConnection(host, port, db, password)
+        self.subscriber = RedisConnection(host, port, db, password)
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.handlers: Dict[str, List[MessageHandler]] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        """Create a backend from a redis://[:password@]host[:port][/db] URL.
+
+        Args:
+            url (str): URL
+        Returns:
+            RedisBackend: Backend
+        """
+        parsed = urlparse(url)
+        return cls(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip("/") or 0),
+            password=parsed.password,
+            ttl_seconds=int(float(os.getenv("STATE_TTL_SECONDS", "3600")))
+        )
+
+    def _client_key(self, client_id: str) -> str:
+        return f"{self.prefix}:client:{client_id}"
+
+    async def save_voice(self, client_id: str, voice_id: Any, data: bytes) -> None:
+        key = self._client_key(client_id)
+        # One round trip for the write and its expiry
+        await self.connection.pipeline(
+            ("HSET", key, encode_voice_field(voice_id), data),
+            ("EXPIRE", key, self.ttl_seconds)
+        )
+
+    async def load_client(self, client_id: str) -> Dict[Any, bytes]:
+        reply = await self.connection.execute("HGETALL", self._client_key(client_id)) or []
+        return {
+            decode_voice_field(reply[i].decode()): reply[i + 1]
+            for i in range(0, len(reply), 2)
+        }
+
+    async def delete_voice(self, client_id: str, voice_id: Any) -> None:
+        await self.connection.execute("HDEL", self._client_key(client_id), encode_voice_field(voice_id))
+
+    async def delete_client(self, client_id: str) -> None:
+        await self.connection.execute("DEL", self._client_key(client_id))
+
+    async def publish(self, channel: str, message: Dict) -> int:
+        return await self.connection.execute("PUBLISH", channel, json.dumps(message))
+
+    async def subscribe(self, channel: str, handler: MessageHandler) -> None:
+        first = channel not in self.handlers
+        self.handlers.setdefault(channel, []).append(handler)
+        if not first:
+            return
+        if self.subscriber.writer is None:
+            await self.subscriber.connect()
+        self.subscriber.writer.write(encode_command("SUBSCRIBE", channel))
+        await self.subscriber.writer.drain()
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _resubscribe(self) -> None:
+        """Reconnect the subscriber connection until all channels are subscribed again.
+
+        Retries start after RESUBSCRIBE_DELAY seconds and back off to
+        RESUBSCRIBE_MAX_DELAY.
+        """
+        self.subscriber.close()
+        delay = RESUBSCRIBE_DELAY
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.subscriber.connect()
+                self.subscriber.writer.write(encode_command("SUBSCRIBE", *self.handlers))
+                await self.subscriber.writer.drain()
+                return
+            except (OSError, asyncio.IncompleteReadError, RedisError) as e:
+                print(f"Error reconnecting subscriber: {e}")
+                self.subscriber.close()
+                delay = min(delay * 2, RESUBSCRIBE_MAX_DELAY)
+
+    async def _listen(self) -> None:
+        """Dispatch published messages to the channel handlers."""
+        while True:
+            try:
+                reply = await read_reply(self.subscriber.reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self._resubscribe()
+                continue
+            except RedisError as e:
+                # An error reply or a garbled stream leaves the subscription in
+                # an unknown state, so start it over
+                print(f"Error reading subscriber: {e}")
+                await self._resubscribe()
+                continue
+            if not isinstance(reply, list) or len(reply) != 3 or reply[0] != b"message":
+                # Subscription confirmations
+                continue
+            channel = reply[1].decode()
+            try:
+                message = json.loads(reply[2])
+            except ValueError as e:
+                print(f"Error decoding message on {channel}: {e}")
+                continue
+            for handler in self.handlers.get(channel, []):
+                try:
+                    await handler(message)
+                except Exception as e:
+                    print(f"Error handling message on {channel}: {e}")
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        self.connection.close()
+        self.subscriber.close()
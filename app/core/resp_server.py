@@ -0,0 +1,235 @@
+"""Minimal in-memory server speaking the Redis protocol.
+
+Implements only what `RedisBackend` uses (hashes with expiry and pub/sub),
+for local development and for checking the backend without Redis.
+`python -m core.resp_server --port 6379` serves workers started with
+`STATE_BACKEND_URL=redis://localhost:6379`; `python -m core.resp_server --check`
+runs a save / load / expiry / delete / publish round trip of `RedisBackend`
+against an in-process instance and exits non-zero when it fails.
+"""
+import asyncio
+import math
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from core.redis_backend import RedisBackend, read_reply
+
+
+def encode_reply(value) -> bytes:
+    """Encode a reply: int, bytes, None (nil), list (array) or Exception (error)."""
+    if isinstance(value, Exception):
+        return b"-ERR %s\r\n" % str(value).encode()
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode_reply(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class RespServer:
+    """Hashes with expiry and pub/sub channels, served over TCP."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        """Initialize the server.
+
+        Args:
+            clock (Callable[[], float]): Time source in seconds, for expiry
+        """
+        self.clock = clock
+        self.hashes: Dict[bytes, Dict[bytes, bytes]] = {}
+        self.expires: Dict[bytes, float] = {}
+        self.channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.connections: Set[asyncio.Task] = set()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Start listening.
+
+        Args:
+            host (str): Host
+            port (int): Port, 0 for any free one
+        Returns:
+            int: Port listened on
+        """
+        self.server = await asyncio.start_server(self._serve, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.connections:
+            # Connections whose client hung up end on their own; cut the rest
+            _, pending = await asyncio.wait(self.connections, timeout=1.0)
+            for task in pending:
+                task.cancel()
+
+    def _get_hash(self, key: bytes) -> Optional[Dict[bytes, bytes]]:
+        expires = self.expires.get(key)
+        if expires is not None and self.clock() >= expires:
+            self.hashes.pop(key, None)
+            del self.expires[key]
+        return self.hashes.get(key)
+
+    def _delete(self, key: bytes) -> int:
+        self.expires.pop(key, None)
+        return 1 if self.hashes.pop(key, None) is not None else 0
+
+    def execute(self, args: List[bytes]):
+        """Run one command other than SUBSCRIBE.
+
+        Args:
+            args (List[bytes]): Command name and arguments
+        Returns:
+            Reply value for `encode_reply`
+        """
+        name = args[0].upper()
+        if name == b"PING":
+            return b"PONG"
+        if name in (b"AUTH", b"SELECT"):
+            return b"OK"
+        if name == b"HSET":
+            fields = self._get_hash(args[1])
+            if fields is None:
+                fields = self.hashes[args[1]] = {}
+            added = 0
+            for field, value in zip(args[2::2], args[3::2]):
+                added += field not in fields
+                fields[field] = value
+            return added
+        if name == b"HGETALL":
+            fields = self._get_hash(args[1]) or {}
+            return [item for field, value in fields.items() for item in (field, value)]
+        if name == b"HDEL":
+            fields = self._get_hash(args[1]) or {}
+            removed = sum(fields.pop(field, None) is not None for field in args[2:])
+            if not fields:
+                self._delete(args[1])
+            return removed
+        if name == b"DEL":
+            return sum(self._delete(key) for key in args[1:] if self._get_hash(key) is not None)
+        if name == b"EXPIRE":
+            if self._get_hash(args[1]) is None:
+                return 0
+            self.expires[args[1]] = self.clock() + int(args[2])
+            return 1
+        if name == b"TTL":
+            if self._get_hash(args[1]) is None:
+                return -2
+            expires = self.expires.get(args[1])
+            return -1 if expires is None else math.ceil(expires - self.clock())
+        if name == b"PUBLISH":
+            subscribers = self.channels.get(args[1], set())
+            message = encode_reply([b"message", args[1], args[2]])
+            for subscriber in subscribers:
+                subscriber.write(message)
+            return len(subscribers)
+        return RuntimeError(f"unknown command '{args[0].decode()}'")
+
+    def subscribe(self, channels: List[bytes], writer: asyncio.StreamWriter) -> bytes:
+        """Subscribe a connection to channels.
+
+        Args:
+            channels (List[bytes]): Channels
+            writer (asyncio.StreamWriter): Connection
+        Returns:
+            bytes: One encoded confirmation per channel
+        """
+        replies = []
+        for channel in channels:
+            self.channels.setdefault(channel, set()).add(writer)
+            count = sum(writer in subscribers for subscribers in self.channels.values())
+            replies.append(encode_reply([b"subscribe", channel, count]))
+        return b"".join(replies)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections.add(asyncio.current_task())
+        try:
+            while True:
+                args = await read_reply(reader)
+                if args[0].upper() == b"SUBSCRIBE":
+                    writer.write(self.subscribe(args[1:], writer))
+                else:
+                    writer.write(encode_reply(self.execute(args)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.discard(asyncio.current_task())
+            for subscribers in self.channels.values():
+                subscribers.discard(writer)
+            writer.close()
+
+
+async def check() -> List[str]:
+    """Run RedisBackend against an in-process server.
+
+    Returns:
+        List[str]: Failed checks, empty when all passed
+    """
+    now = [0.0]
+    server = RespServer(clock=lambda: now[0])
+    backend = RedisBackend(port=await server.start(), ttl_seconds=60)
+    failures = []
+
+    def expect(condition: bool, name: str) -> None:
+        print(f"{'ok  ' if condition else 'FAIL'} {name}")
+        if not condition:
+            failures.append(name)
+
+    try:
+        await backend.save_voice("client", 1, b"first")
+        await backend.save_voice("client", "lead", b"second")
+        expect(await backend.load_client("client") == {1: b"first", "lead": b"second"}, "save and load")
+        ttl = await backend.connection.execute("TTL", backend._client_key("client"))
+        expect(ttl == 60, "expiry set with the write")
+        now[0] = 30.0
+        await backend.save_voice("client", 1, b"third")
+        now[0] = 80.0
+        expect(await backend.load_client("client") == {1: b"third", "lead": b"second"}, "expiry renewed by a write")
+        now[0] = 91.0
+        expect(await backend.load_client("client") == {}, "expired after the TTL")
+        await backend.save_voice("client", 1, b"first")
+        await backend.delete_voice("client", 1)
+        expect(await backend.load_client("client") == {}, "delete voice")
+        await backend.save_voice("client", 2, b"second")
+        await backend.delete_client("client")
+        expect(await backend.load_client("client") == {}, "delete client")
+
+        received = asyncio.Queue()
+        await backend.subscribe("channel", received.put)
+        while not server.channels.get(b"channel"):
+            await asyncio.sleep(0.01)
+        expect(await backend.publish("channel", {"value": 1}) == 1, "publish reaches the subscriber")
+        expect(await asyncio.wait_for(received.get(), 1.0) == {"value": 1}, "subscriber receives the message")
+    finally:
+        await backend.close()
+        await server.close()
+    return failures
+
+
+async def serve(host: str, port: int) -> None:
+    server = RespServer()
+    await server.start(host, port)
+    print(f"Serving the Redis protocol on {host}:{port}")
+    await server.server.serve_forever()
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Minimal in-memory server speaking the Redis protocol")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--check", action="store_true", help="Check RedisBackend against an in-process server and exit")
+    args = parser.parse_args()
+    if args.check:
+        raise SystemExit(1 if asyncio.run(check()) else 0)
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
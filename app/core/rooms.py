@@ -0,0 +1,187 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from core.admission import AdmissionController
+from core.streaming import DEFAULT_LOOKAHEAD_SECONDS, NoteStreamer
+
+# Client IDs come from a single /ws/{client_id} path segment and never
+# contain "/", so room keys cannot collide with a connected client's ID
+ROOM_KEY_PREFIX = "room/"
+
+
+class RoomError(Exception):
+    """A room request the client is not allowed to make."""
+
+
+class Room:
+    """Listeners sharing the streams of one room.
+
+    The client that created the room is its host and the only one that may
+    start, update or stop its voices; the others listen.
+    """
+
+    def __init__(self, room_id: str, host: str):
+        self.room_id = room_id
+        self.host = host
+        self.members: Set[str] = set()
+        # Global factors set for the room, applied to every voice's generation
+        self.factors: Dict[str, float] = {}
+
+    @property
+    def key(self) -> str:
+        """Client ID under which the room's voices are generated and streamed."""
+        return ROOM_KEY_PREFIX + self.room_id
+
+
+class RoomManager:
+    """Generate each room's streams once and fan them out to its members.
+
+    The voices of a room are streamed by a NoteStreamer under the room's key,
+    so generation state and cost are per room, not per listener. The
+    streamer hands every frame to `send_note_data`, which queues it for all
+    members through `ConnectionManager.broadcast`, serialized once per
+    encoding in use.
+    """
+
+    def __init__(
+        self,
+        connection_manager,
+        generate: Callable[..., Awaitable[List[Dict]]],
+        admission: Optional[AdmissionController] = None
+    ):
+        """Initialize the manager.
+
+        Args:
+            connection_manager: Connection manager of the members
+            generate (Callable[..., Awaitable[List[Dict]]]): Coroutine function
+                with the signature of `MusicGenerator.generate_next_notes`
+            admission (Optional[AdmissionController]): Admission controller
+                billed for the room's refills, under the room's key
+        """
+        self.connection_manager = connection_manager
+        self.streamer = NoteStreamer(self, generate, admission)
+        self.rooms: Dict[str, Room] = {}
+        self.client_rooms: Dict[str, str] = {}
+
+    def join(self, client_id: str, room_id: str) -> Room:
+        """Add a client to a room, creating it with the client as host.
+
+        A client is in at most one room and must `leave` its current one first.
+
+        Args:
+            client_id (str): Client ID
+            room_id (str): Room ID
+        Returns:
+            Room: Room
+        """
+        if self.client_rooms.get(client_id) not in (None, room_id):
+            raise RoomError(f"Already in room {self.client_rooms[client_id]}")
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = Room(room_id, client_id)
+        room.members.add(client_id)
+        self.client_rooms[client_id] = room_id
+        return room
+
+    def leave(self, client_id: str) -> Optional[Room]:
+        """Remove a client from its room, closing the room when it was the last member.
+
+        Args:
+            client_id (str): Client ID
+        Returns:
+            Optional[Room]: The room if it was closed; its generation state is the caller's to release
+        """
+        room_id = self.client_rooms.pop(client_id, None)
+        room = self.rooms.get(room_id) if room_id is not None else None
+        if room is None:
+            return None
+        room.members.discard(client_id)
+        if room.members:
+            if room.host == client_id:
+                # Hand the room over instead of leaving it without control
+                room.host = min(room.members)
+            return None
+        self.streamer.stop_client(room.key)
+        del self.rooms[room_id]
+        return room
+
+    def host_room(self, client_id: str, room_id: str) -> Room:
+        """Get a room the client may control.
+
+        Args:
+            client_id (str): Client ID
+            room_id (str): Room ID
+        Returns:
+            Room: Room
+        """
+        room = self.rooms.get(room_id)
+        if room is None or client_id not in room.members:
+            raise RoomError(f"Not a member of room {room_id}")
+        if room.host != client_id:
+            raise RoomError(f"Only the host of room {room_id} controls its voices")
+        return room
+
+    def start_voice(
+        self,
+        room: Room,
+        voice_id: int,
+        params: Dict,
+        global_params: Dict,
+        lookahead: float = DEFAULT_LOOKAHEAD_SECONDS
+    ) -> None:
+        """Start or update a voice of a room.
+
+        Args:
+            room (Room): Room
+            voice_id (int): Voice ID
+            params (Dict): Voice parameters
+            global_params (Dict): Global parameters, overridden by the room's factors
+            lookahead (float): Seconds of music to keep buffered
+        """
+        self.streamer.start_voice(room.key, voice_id, params, {**global_params, **room.factors}, lookahead)
+
+    def stop_voice(self, room: Room, voice_id: int) -> None:
+        self.streamer.stop_voice(room.key, voice_id)
+
+    def set_factor(self, room_id: str, name: str, value: float) -> Optional[Room]:
+        """Apply a global factor to the generation of a room's voices.
+
+        Args:
+            room_id (str): Room ID
+            name (str): Factor name, e.g. volumeFactor
+            value (float): Value
+        Returns:
+            Optional[Room]: The room, None if it is not on this worker
+        """
+        room = self.rooms.get(room_id)
+        if room is None:
+            return None
+        room.factors[name] = value
+        stream = self.streamer.streams.get(room.key)
+        if stream is not None:
+            for voice in stream.voices.values():
+                voice.global_params = {**voice.global_params, name: value}
+        return room
+
+    async def broadcast(self, room_id: str, message: Dict) -> Dict[str, int]:
+        """Queue a message for every member of a room.
+
+        Args:
+            room_id (str): Room ID
+            message (Dict): Message
+        Returns:
+            Dict[str, int]: Delivery stats of `ConnectionManager.broadcast`
+        """
+        room = self.rooms.get(room_id)
+        members = list(room.members) if room is not None else []
+        return await self.connection_manager.broadcast(message, members)
+
+    async def send_note_data(self, room_key: str, message: Dict) -> None:
+        """Fan a frame of the room streamer out to the room's members, tagged with the room ID."""
+        room_id = room_key[len(ROOM_KEY_PREFIX):]
+        await self.broadcast(room_id, {**message, "roomId": room_id})
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rooms": len(self.rooms),
+            "listeners": sum(len(room.members) for room in self.rooms.values()),
+            "voices": sum(len(stream.voices) for stream in self.streamer.streams.values()),
+        }
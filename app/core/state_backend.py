@@ -0,0 +1,147 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+MessageHandler = Callable[[Dict], Awaitable[None]]
+
+# Pub/sub channel carrying global factor updates between workers
+FACTOR_CHANNEL = "twelve-tones:global-factors"
+
+
+def encode_voice_field(voice_id: Any) -> str:
+    """Encode a voice ID as a hash field, keeping int and str IDs apart."""
+    return json.dumps(voice_id)
+
+
+def decode_voice_field(field: str) -> Any:
+    """Decode a hash field written by `encode_voice_field`."""
+    return json.loads(field)
+
+
+class StateBackend(ABC):
+    """Storage for serialized voice states plus a pub/sub channel.
+
+    `shared` tells whether other workers see the same data; when it is
+    False the in-process state is authoritative and callers may skip
+    saving and publishing altogether.
+    """
+
+    shared = False
+
+    @abstractmethod
+    async def save_voice(self, client_id: str, voice_id: Any, data: bytes) -> None:
+        """Store a serialized voice state.
+
+        Args:
+            client_id (str): Client ID
+            voice_id (Any): Voice ID
+            data (bytes): Serialized state
+        """
+
+    @abstractmethod
+    async def load_client(self, client_id: str) -> Dict[Any, bytes]:
+        """Load all serialized voice states of a client.
+
+        Args:
+            client_id (str): Client ID
+        Returns:
+            Dict[Any, bytes]: Serialized states by voice ID
+        """
+
+    @abstractmethod
+    async def delete_voice(self, client_id: str, voice_id: Any) -> None:
+        """Delete a voice state.
+
+        Args:
+            client_id (str): Client ID
+            voice_id (Any): Voice ID
+        """
+
+    @abstractmethod
+    async def delete_client(self, client_id: str) -> None:
+        """Delete all voice states of a client.
+
+        Args:
+            client_id (str): Client ID
+        """
+
+    @abstractmethod
+    async def publish(self, channel: str, message: Dict) -> int:
+        """Publish a message.
+
+        Args:
+            channel (str): Channel
+            message (Dict): JSON-serializable message
+        Returns:
+            int: Number of subscribers that received it
+        """
+
+    @abstractmethod
+    async def subscribe(self, channel: str, handler: MessageHandler) -> None:
+        """Call a handler for every message published on a channel.
+
+        Args:
+            channel (str): Channel
+            handler (MessageHandler): Coroutine function taking the message
+        """
+
+    async def close(self) -> None:
+        """Release connections."""
+
+
+class InMemoryBackend(StateBackend):
+    """Process-local backend, the default for a single worker."""
+
+    shared = False
+
+    def __init__(self):
+        self.clients: Dict[str, Dict[str, bytes]] = {}
+        self.handlers: Dict[str, List[MessageHandler]] = {}
+
+    async def save_voice(self, client_id: str, voice_id: Any, data: bytes) -> None:
+        self.clients.setdefault(client_id, {})[encode_voice_field(voice_id)] = data
+
+    async def load_client(self, client_id: str) -> Dict[Any, bytes]:
+        return {
+            decode_voice_field(field): data
+            for field, data in self.clients.get(client_id, {}).items()
+        }
+
+    async def delete_voice(self, client_id: str, voice_id: Any) -> None:
+        self.clients.get(client_id, {}).pop(encode_voice_field(voice_id), None)
+
+    async def delete_client(self, client_id: str) -> None:
+        self.clients.pop(client_id, None)
+
+    async def publish(self, channel: str, message: Dict) -> int:
+        handlers = self.handlers.get(channel, [])
+        for handler in handlers:
+            await handler(message)
+        return len(handlers)
+
+    async def subscribe(self, channel: str, handler: MessageHandler) -> None:
+        self.handlers.setdefault(channel, []).append(handler)
+
+
+def create_state_backend(url: Optional[str] = None) -> StateBackend:
+    """Create the backend selected by STATE_BACKEND_URL.
+
+    Empty or "memory://" selects the in-memory backend and
+    "redis://host:port/db" the Redis one.
+
+    Args:
+        url (Optional[str]): Backend URL, defaults to STATE_BACKEND_URL
+    Returns:
+        StateBackend: Backend
+    """
+    url = url if url is not None else os.getenv("STATE_BACKEND_URL", "")
+    if not url or url.startswith("memory://"):
+        return InMemoryBackend()
+    if url.startswith("redis://"):
+        from core.redis_backend import RedisBackend
+        return RedisBackend.from_url(url)
+    raise ValueError(f"Unsupported state backend URL: {url}")
+
+
+state_backend = create_state_backend()
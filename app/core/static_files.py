@@ -0,0 +1,177 @@
+"""Static frontend serving with precompressed variants.
+
+`python -m core.static_files frontend/dist` writes `.gz` (and `.br` when the
+optional `brotli` package is installed) next to every compressible asset of
+the built frontend. `PrecompressedStaticFiles` then serves the best variant
+the client accepts, so nothing is compressed per request. Vite puts content
+hashes in the names under `assets/`, which are therefore cached as immutable;
+other files are revalidated with their ETag.
+"""
+import gzip
+import mimetypes
+import os
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+# Content-Encoding and file suffix, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE_SUFFIXES = (".html", ".js", ".mjs", ".css", ".json", ".svg", ".txt", ".map", ".xml", ".wasm", ".ico")
+MIN_COMPRESS_SIZE = 1024
+IMMUTABLE_PREFIX = "assets" + os.sep
+
+
+def accepted_encodings(accept_encoding: str) -> List[str]:
+    """Parse an Accept-Encoding header, ignoring codings with q=0.
+
+    Args:
+        accept_encoding (str): Header value
+    Returns:
+        List[str]: Accepted codings in lower case
+    """
+    accepted = []
+    for item in accept_encoding.split(","):
+        coding, _, parameters = item.partition(";")
+        quality = parameters.strip().lower()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.append(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles serving `.br`/`.gz` siblings to clients that accept them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.real_directory = os.path.realpath(self.directory) if self.directory is not None else ""
+        self.variants = self._index_variants()
+
+    def _index_variants(self) -> Dict[str, List[Tuple[str, str, os.stat_result]]]:
+        """Find the precompressed files once; the build output does not change at runtime.
+
+        Returns:
+            Dict[str, List[Tuple[str, str, os.stat_result]]]: Path to (encoding, variant path, stat)
+        """
+        variants: Dict[str, List[Tuple[str, str, os.stat_result]]] = {}
+        if not os.path.isdir(self.real_directory):
+            return variants
+        # Keyed by real path, as returned by `lookup_path`
+        for root, _, files in os.walk(self.real_directory):
+            names = set(files)
+            for name in files:
+                path = os.path.join(root, name)
+                for encoding, suffix in ENCODINGS:
+                    if name + suffix in names:
+                        variant = path + suffix
+                        variants.setdefault(path, []).append((encoding, variant, os.stat(variant)))
+        return variants
+
+    def _cache_control(self, full_path: str) -> str:
+        relative = os.path.relpath(full_path, self.real_directory)
+        if relative.startswith(IMMUTABLE_PREFIX):
+            return "public, max-age=31536000, immutable"
+        return "no-cache"
+
+    def file_response(
+        self,
+        full_path: str,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        real_path = os.path.realpath(full_path)
+        headers = {"Cache-Control": self._cache_control(real_path)}
+        variant: Optional[Tuple[str, str, os.stat_result]] = None
+        variants = self.variants.get(real_path)
+        if variants:
+            headers["Vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            variant = next((v for v in variants if v[0] in accepted), None)
+
+        if variant is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        else:
+            encoding, variant_path, variant_stat = variant
+            headers["Content-Encoding"] = encoding
+            # The media type is that of the original file, and the ETag that of the variant
+            response = FileResponse(
+                variant_path,
+                status_code=status_code,
+                stat_result=variant_stat,
+                headers=headers,
+                media_type=mimetypes.guess_type(str(full_path))[0] or "text/plain"
+            )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def precompress_file(path: str, brotli_module=None) -> List[str]:
+    """Write the compressed variants of a file that are smaller than it.
+
+    Args:
+        path (str): File
+        brotli_module: The `brotli` module, or None to write only gzip
+    Returns:
+        List[str]: Written files
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    compressed = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli_module is not None:
+        compressed[".br"] = brotli_module.compress(data, quality=11)
+    written = []
+    for suffix, content in compressed.items():
+        if len(content) < len(data):
+            with open(path + suffix, "wb") as file:
+                file.write(content)
+            written.append(path + suffix)
+    return written
+
+
+def precompress_directory(directory: str) -> List[str]:
+    """Precompress the compressible files of a directory tree.
+
+    Args:
+        directory (str): Directory, e.g. frontend/dist
+    Returns:
+        List[str]: Written files
+    """
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("brotli is not installed, writing gzip only")
+    written = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(COMPRESSIBLE_SUFFIXES) and os.path.getsize(path) >= MIN_COMPRESS_SIZE:
+                written.extend(precompress_file(path, brotli))
+    return written
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precompress the built frontend")
+    parser.add_argument("directory", nargs="?", default="frontend/dist")
+    args = parser.parse_args()
+    if not os.path.isdir(args.directory):
+        print(f"{args.directory} does not exist, nothing to precompress")
+        return
+    written = precompress_directory(args.directory)
+    print(f"Wrote {len(written)} precompressed files in {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
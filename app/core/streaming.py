@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import os
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+from music_generator import get_note_seconds
+from music_generator.music_generator import FILL_MAX_EVENTS
+from core.admission import AdmissionController, RateLimited
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOOKAHEAD_SECONDS = float(os.getenv("STREAM_LOOKAHEAD_SECONDS", "2.0"))
+MAX_LOOKAHEAD_SECONDS = 30.0
+# Events generated per call while refilling a buffer
+STREAM_CHUNK_SIZE = 4
+# Bounds for the refill task's sleep between passes, in seconds
+MIN_REFILL_INTERVAL = 0.01
+MAX_REFILL_INTERVAL = 0.5
+
+
+@dataclass
+class VoiceStream:
+    params: Dict
+    global_params: Dict
+    lookahead: float
+    # Playback time (seconds since the stream started) covered by pushed notes
+    buffered_until: float = 0.0
+    # Playback time before which a rate-limited voice is not refilled
+    retry_at: float = 0.0
+
+
+@dataclass
+class ClientStream:
+    started_at: float
+    voices: Dict[int, VoiceStream] = field(default_factory=dict)
+    task: Optional[asyncio.Task] = None
+
+
+class NoteStreamer:
+    """Push generated notes ahead of playback.
+
+    Each streaming client gets one background task that keeps every voice
+    buffered `lookahead` seconds ahead of the client's playback clock, using
+    the `duration` and `tempo` of the generated events to advance it, and
+    pushes `note_data` frames through the connection manager. A voice whose
+    generation fails is stopped and reported with an `error` frame.
+
+    With admission control, refills are billed to the client's token bucket
+    and hold a generation slot like requested generation; a voice that is
+    rate limited gets a `rate_limited` error frame and is not refilled
+    again until its `retryAfter` has passed.
+    """
+
+    def __init__(
+        self,
+        connection_manager,
+        generate: Callable[..., Awaitable[List[Dict]]],
+        admission: Optional[AdmissionController] = None
+    ):
+        """Initialize the streamer.
+
+        Args:
+            connection_manager: Connection manager used to push frames
+            generate (Callable[..., Awaitable[List[Dict]]]): Coroutine function
+                with the signature of `MusicGenerator.generate_next_notes`
+            admission (Optional[AdmissionController]): Admission controller billed for refills
+        """
+        self.connection_manager = connection_manager
+        self.generate = generate
+        self.admission = admission
+        self.streams: Dict[str, ClientStream] = {}
+
+    @staticmethod
+    def get_lookahead(data: Dict, params: Dict, global_params: Dict) -> float:
+        """Get the lookahead of a `start_stream` message in seconds.
+
+        Args:
+            data (Dict): Message with optional lookaheadSeconds or lookaheadBeats
+            params (Dict): Voice parameters
+            global_params (Dict): Global parameters
+        Returns:
+            float: Lookahead in seconds, capped at MAX_LOOKAHEAD_SECONDS
+        """
+        lookahead = DEFAULT_LOOKAHEAD_SECONDS
+        if data.get("lookaheadSeconds") is not None:
+            lookahead = float(data["lookaheadSeconds"])
+        elif data.get("lookaheadBeats") is not None:
+            bpm = params["tempo"] * global_params.get("tempoFactor", 1.0)
+            lookahead = float(data["lookaheadBeats"]) * 60 / max(bpm, 1.0)
+        return max(0.0, min(MAX_LOOKAHEAD_SECONDS, lookahead))
+
+    def start_voice(
+        self,
+        client_id: str,
+        voice_id: int,
+        params: Dict,
+        global_params: Dict,
+        lookahead: float = DEFAULT_LOOKAHEAD_SECONDS
+    ) -> None:
+        """Start streaming a voice, or update the parameters of a streaming voice.
+
+        Args:
+            client_id (str): Client ID
+            voice_id (int): Voice ID
+            params (Dict): Voice parameters
+            global_params (Dict): Global parameters
+            lookahead (float): Seconds of music to keep buffered
+        """
+        loop = asyncio.get_running_loop()
+        stream = self.streams.get(client_id)
+        if stream is None:
+            stream = self.streams[client_id] = ClientStream(started_at=loop.time())
+
+        voice = stream.voices.get(voice_id)
+        if voice is None:
+            stream.voices[voice_id] = VoiceStream(
+                params=params,
+                global_params=global_params,
+                lookahead=lookahead,
+                buffered_until=loop.time() - stream.started_at
+            )
+        else:
+            voice.params = params
+            voice.global_params = global_params
+            voice.lookahead = lookahead
+
+        if stream.task is None or stream.task.done():
+            stream.task = asyncio.create_task(self._refill(client_id, stream))
+
+    def stop_voice(self, client_id: str, voice_id: int) -> None:
+        """Stop streaming a voice.
+
+        Args:
+            client_id (str): Client ID
+            voice_id (int): Voice ID
+        """
+        stream = self.streams.get(client_id)
+        if stream is None:
+            return
+        stream.voices.pop(voice_id, None)
+        if not stream.voices:
+            self.stop_client(client_id)
+
+    def rename_voice(self, client_id: str, old_id: int, new_id: int) -> None:
+        """Follow a voice ID change.
+
+        Args:
+            client_id (str): Client ID
+            old_id (int): Old voice ID
+            new_id (int): New voice ID
+        """
+        stream = self.streams.get(client_id)
+        if stream is not None and old_id in stream.voices:
+            stream.voices[new_id] = stream.voices.pop(old_id)
+
+    def stop_client(self, client_id: str) -> None:
+        """Stop all streams of a client.
+
+        Args:
+            client_id (str): Client ID
+        """
+        stream = self.streams.pop(client_id, None)
+        if stream is not None and stream.task is not None:
+            stream.task.cancel()
+
+    async def _refill(self, client_id: str, stream: ClientStream) -> None:
+        """Keep the voices of a client buffered until its stream stops.
+
+        Args:
+            client_id (str): Client ID
+            stream (ClientStream): Client stream
+        """
+        loop = asyncio.get_running_loop()
+        while stream.voices:
+            now = loop.time() - stream.started_at
+            next_refill = now + MAX_REFILL_INTERVAL
+            for voice_id, voice in list(stream.voices.items()):
+                if now < voice.retry_at:
+                    next_refill = min(next_refill, voice.retry_at)
+                    continue
+                # Refill once less than half of the lookahead is left
+                if voice.buffered_until - now < voice.lookahead / 2:
+                    try:
+                        await self._fill_voice(client_id, voice_id, voice, now, now + voice.lookahead)
+                    except RateLimited as e:
+                        voice.retry_at = now + (e.retry_after or MAX_REFILL_INTERVAL)
+                        next_refill = min(next_refill, voice.retry_at)
+                        await self.connection_manager.send_note_data(client_id, {
+                            "type": "error",
+                            "code": "rate_limited",
+                            "reason": e.reason,
+                            "message": e.message,
+                            "retryAfter": e.retry_after,
+                            "requestType": "start_stream",
+                            "voiceId": voice_id
+                        })
+                        continue
+                    except Exception as e:
+                        # The client is told below; keep the server log quiet
+                        logger.debug("Stream of voice %s of %s failed: %r", voice_id, client_id, e)
+                        stream.voices.pop(voice_id, None)
+                        if not stream.voices and self.streams.get(client_id) is stream:
+                            del self.streams[client_id]
+                        await self.connection_manager.send_note_data(client_id, {
+                            "type": "error",
+                            "code": "stream_failed",
+                            "message": str(e),
+                            "voiceId": voice_id
+                        })
+                        continue
+                next_refill = min(next_refill, voice.buffered_until - voice.lookahead / 2)
+            await asyncio.sleep(
+                min(MAX_REFILL_INTERVAL, max(MIN_REFILL_INTERVAL, next_refill - now))
+            )
+
+    async def _fill_voice(
+        self, client_id: str, voice_id: int, voice: VoiceStream, now: float, until: float
+    ) -> None:
+        """Generate notes for a voice up to a playback time and push them in one frame.
+
+        At most FILL_MAX_EVENTS events, and no more than the admission
+        controller's `max_duration`, are generated per refill.
+
+        Args:
+            client_id (str): Client ID
+            voice_id (int): Voice ID
+            voice (VoiceStream): Voice stream
+            now (float): Current playback time
+            until (float): Playback time to fill up to
+        """
+        # A voice that fell behind (e.g. the socket stalled) restarts from now
+        voice.buffered_until = max(voice.buffered_until, now)
+
+        admission = self.admission
+        max_events = FILL_MAX_EVENTS
+        if admission is not None:
+            admission.admit_open_ended(client_id)
+            if admission.max_duration:
+                max_events = min(max_events, admission.max_duration)
+
+        notes_data = []
+        with admission.generation_slot() if admission is not None else nullcontext():
+            while voice.buffered_until < until and len(notes_data) < max_events:
+                chunk = await self.generate(
+                    client_id, voice_id, voice.params, voice.global_params, STREAM_CHUNK_SIZE
+                )
+                for note_data in chunk:
+                    voice.buffered_until += get_note_seconds(note_data)
+                notes_data.extend(chunk)
+        if admission is not None:
+            admission.charge(client_id, len(notes_data))
+
+        await self.connection_manager.send_note_data(client_id, {
+            "type": "note_data",
+            "voiceId": voice_id,
+            "noteData": notes_data
+        })
@@ -1,21 +1,337 @@
-from typing import Dict
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Deque, Dict, Hashable, Iterable, Optional, Union
 from fastapi import WebSocket
+from core.metrics import metrics
+from core.protocol import ENCODINGS, encode_note_data, encode_note_data_batch, encode_room_note_data
+
+# Seconds a single send may take before the connection is considered stuck
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "2.0"))
+# Frames a connection may have waiting before it is considered stuck
+MAX_QUEUE_SIZE = int(os.getenv("WS_MAX_QUEUE_SIZE", "256"))
+# Message types where only the latest pending value matters
+SUPERSEDED_TYPES = ("volume_factor_updated", "tempo_factor_updated")
+
+
+SEND_SECONDS = metrics.histogram(
+    "ws_send_seconds", "Time to write one outbound frame to a socket", ("encoding",)
+)
+
+
+def encode_message(message: dict) -> str:
+    """Serialize a message the way WebSocket.send_json does."""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def encode_binary(message: dict) -> Optional[bytes]:
+    """Encode a message as a binary frame, if it has a binary form.
+
+    Args:
+        message (dict): Message
+    Returns:
+        Optional[bytes]: Frame, None for messages that are always JSON
+    """
+    if message["type"] == "note_data":
+        if message.get("roomId") is not None:
+            return encode_room_note_data(message["roomId"], message["voiceId"], message["noteData"])
+        return encode_note_data(message["voiceId"], message["noteData"])
+    if message["type"] == "note_data_batch":
+        return encode_note_data_batch(message["voices"])
+    return None
+
+
+def coalesce_key(message: dict) -> Optional[Hashable]:
+    """Get the key under which pending copies of a message can be merged.
+
+    Args:
+        message (dict): Message
+    Returns:
+        Optional[Hashable]: Key, or None when the message is never merged
+    """
+    message_type = message.get("type")
+    if message_type == "note_data":
+        # A room's voice and the client's own voice of the same ID stay apart
+        return (message_type, message.get("roomId"), message.get("voiceId"))
+    if message_type in SUPERSEDED_TYPES:
+        # Factors of different rooms, and the client's own, do not supersede each other
+        return (message_type, message.get("roomId"))
+    return None
+
+
+class OutboundMessage:
+    __slots__ = ("key", "message", "text", "binary")
+
+    def __init__(
+        self,
+        key: Optional[Hashable],
+        message: Optional[dict],
+        text: Optional[str],
+        binary: Optional[bytes] = None
+    ):
+        self.key = key
+        self.message = message
+        self.text = text
+        self.binary = binary
+
+
+class Connection:
+    """Outbound state of one websocket: a bounded queue drained by a writer task."""
+
+    def __init__(self, websocket: WebSocket, max_queue_size: int):
+        self.websocket = websocket
+        self.max_queue_size = max_queue_size
+        self.queue: Deque[OutboundMessage] = deque()
+        # Queued, not yet sent messages that later ones may be merged into
+        self.pending: Dict[Hashable, OutboundMessage] = {}
+        self.ready = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+        # Wire encoding of note_data frames, negotiated in the init message
+        self.encoding = "json"
+        self.coalesced = 0
+        self.max_depth = 0
+
+    def enqueue(
+        self,
+        message: Optional[dict] = None,
+        text: Optional[str] = None,
+        binary: Optional[bytes] = None
+    ) -> bool:
+        """Queue a message, merging it into a pending one when possible.
+
+        Pending `note_data` frames of the same voice are concatenated and
+        pending factor updates of the same type are replaced by the newer one.
+
+        Args:
+            message (Optional[dict]): Message
+            text (Optional[str]): Pre-serialized message, used as-is when given
+            binary (Optional[bytes]): Pre-encoded binary frame, used as-is for binary connections
+        Returns:
+            bool: False when the queue is full
+        """
+        if message is None:
+            message = json.loads(text)
+        key = coalesce_key(message)
+        entry = self.pending.get(key) if key is not None else None
+        if entry is not None:
+            if message["type"] == "note_data":
+                entry.message = {**entry.message, "noteData": entry.message["noteData"] + message["noteData"]}
+                entry.text = None
+                entry.binary = None
+            else:
+                entry.message = message
+                entry.text = text
+                entry.binary = binary
+            self.coalesced += 1
+            return True
+
+        if len(self.queue) >= self.max_queue_size:
+            return False
+        entry = OutboundMessage(key, message, text, binary)
+        self.queue.append(entry)
+        if key is not None:
+            self.pending[key] = entry
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self.ready.set()
+        return True
+
+    def next_frame(self) -> Union[str, bytes]:
+        """Pop the next message and serialize it for the connection's encoding."""
+        entry = self.queue.popleft()
+        if entry.key is not None:
+            self.pending.pop(entry.key, None)
+        if self.encoding == "binary":
+            frame = entry.binary if entry.binary is not None else encode_binary(entry.message)
+            if frame is not None:
+                return frame
+        return entry.text if entry.text is not None else encode_message(entry.message)
 
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, send_timeout: float = SEND_TIMEOUT, max_queue_size: int = MAX_QUEUE_SIZE):
         self.active_connections: Dict[str, WebSocket] = {}
-        
+        self.connections: Dict[str, Connection] = {}
+        self.send_timeout = send_timeout
+        self.max_queue_size = max_queue_size
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.coalesced = 0
+        self.evicted = 0
+
     async def connect(self, websocket: WebSocket, client_id: str):
         await websocket.accept()
         self.active_connections[client_id] = websocket
-        
+        connection = self.connections[client_id] = Connection(websocket, self.max_queue_size)
+        connection.writer = asyncio.create_task(self._write(client_id, connection))
+
     def disconnect(self, client_id: str):
         if client_id in self.active_connections:
             del self.active_connections[client_id]
-            
+        connection = self.connections.pop(client_id, None)
+        if connection is not None and connection.writer is not None:
+            connection.writer.cancel()
+
+    def set_encoding(self, client_id: str, encoding: str) -> str:
+        """Set the wire encoding of a client's note_data frames.
+
+        Args:
+            client_id (str): Client ID
+            encoding (str): Requested encoding, unknown values fall back to json
+        Returns:
+            str: Encoding in use
+        """
+        connection = self.connections.get(client_id)
+        if connection is None:
+            return "json"
+        connection.encoding = encoding if encoding in ENCODINGS else "json"
+        return connection.encoding
+
     async def send_note_data(self, client_id: str, message: dict):
-        if client_id in self.active_connections:
-            await self.active_connections[client_id].send_json(message)
+        self._enqueue(client_id, message=message)
+
+    def _enqueue(
+        self,
+        client_id: str,
+        message: Optional[dict] = None,
+        text: Optional[str] = None,
+        binary: Optional[bytes] = None
+    ) -> bool:
+        """Queue a message for a client, evicting the client when its queue is full.
+
+        Args:
+            client_id (str): Client ID
+            message (Optional[dict]): Message
+            text (Optional[str]): Pre-serialized message
+            binary (Optional[bytes]): Pre-encoded binary frame
+        Returns:
+            bool: Whether the message was queued
+        """
+        connection = self.connections.get(client_id)
+        if connection is None:
+            return False
+        coalesced = connection.coalesced
+        if not connection.enqueue(message, text, binary):
+            self.evict(client_id)
+            return False
+        self.coalesced += connection.coalesced - coalesced
+        return True
+
+    async def _write(self, client_id: str, connection: Connection) -> None:
+        """Send queued messages of a connection one at a time.
+
+        Args:
+            client_id (str): Client ID
+            connection (Connection): Connection
+        """
+        while True:
+            if not connection.queue:
+                connection.ready.clear()
+                await connection.ready.wait()
+                continue
+            try:
+                # Encoding can fail too (a message JSON or the protocol cannot
+                # carry), and would otherwise end the writer and stall the queue
+                frame = connection.next_frame()
+                if isinstance(frame, bytes):
+                    send = connection.websocket.send_bytes(frame)
+                else:
+                    send = connection.websocket.send_text(frame)
+                start = SEND_SECONDS.start()
+                await asyncio.wait_for(send, self.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.evict(client_id)
+                return
+            SEND_SECONDS.stop(start, (connection.encoding,))
+            self.frames_sent += 1
+            self.bytes_sent += len(frame)
+
+    def evict(self, client_id: str) -> None:
+        """Drop a connection that failed, timed out or overflowed and close its socket.
+
+        Args:
+            client_id (str): Client ID
+        """
+        websocket = self.active_connections.get(client_id)
+        self.disconnect(client_id)
+        if websocket is not None:
+            self.evicted += 1
+            asyncio.ensure_future(self._close(websocket))
+
+    async def _close(self, websocket: WebSocket) -> None:
+        try:
+            await asyncio.wait_for(websocket.close(code=1011), self.send_timeout)
+        except Exception:
+            pass
+
+    async def broadcast(self, message: dict, client_ids: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """Queue a message for many clients.
+
+        The message is serialized once per encoding in use and handed to
+        every connection's writer, so a slow socket never delays the others.
+        Clients whose queue is full are evicted.
+
+        Args:
+            message (dict): Message
+            client_ids (Optional[Iterable[str]]): Recipients, defaults to all clients
+        Returns:
+            Dict[str, int]: Delivery stats (recipients, queued, evicted)
+        """
+        if client_ids is None:
+            targets = list(self.connections)
+        else:
+            targets = [client_id for client_id in client_ids if client_id in self.connections]
+        text = binary = None
+        if any(self.connections[client_id].encoding != "binary" for client_id in targets):
+            text = encode_message(message)
+        if any(self.connections[client_id].encoding == "binary" for client_id in targets):
+            binary = encode_binary(message)
+        queued = 0
+        for client_id in targets:
+            connection = self.connections.get(client_id)
+            if connection is not None and self._enqueue(client_id, message=message, text=text, binary=binary):
+                queued += 1
+        return {
+            "recipients": len(targets),
+            "queued": queued,
+            "evicted": len(targets) - queued
+        }
+
+    def queue_stats(self) -> Dict[str, int]:
+        """Get outbound queue metrics over all connections.
+
+        Returns:
+            Dict[str, int]: Connections, current / peak queue depth, and
+                totals of sent frames and bytes, merged messages and evictions
+        """
+        connections = list(self.connections.values())
+        return {
+            "connections": len(connections),
+            "queue_depth": sum(len(c.queue) for c in connections),
+            "queue_depth_max": max((len(c.queue) for c in connections), default=0),
+            "queue_depth_peak": max((c.max_depth for c in connections), default=0),
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+            "coalesced": self.coalesced,
+            "evicted": self.evicted
+        }
 
 connection_manager = ConnectionManager()
+
+metrics.gauge_callback(
+    "ws_connections", "Open websocket connections", lambda: len(connection_manager.connections)
+)
+metrics.gauge_callback(
+    "ws_queue_depth", "Outbound frames waiting over all connections",
+    lambda: sum(len(c.queue) for c in connection_manager.connections.values())
+)
+metrics.counter_callback("ws_frames_sent_total", "Outbound frames written", lambda: connection_manager.frames_sent)
+metrics.counter_callback("ws_bytes_sent_total", "Outbound bytes written", lambda: connection_manager.bytes_sent)
+metrics.counter_callback(
+    "ws_coalesced_total", "Outbound messages merged into a pending one", lambda: connection_manager.coalesced
+)
+metrics.counter_callback(
+    "ws_evicted_total", "Connections dropped for slow or failed sends", lambda: connection_manager.evicted
+)
@@ -1,11 +1,28 @@
+from contextlib import asynccontextmanager
 from typing import Optional
 
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from api.routes import router
+from api.routes.global_factors import deliver_factor_update
+from api.routes.health import readiness
+from api.routes.websocket import generation_executor
+from core import state_backend
+from core.state_backend import FACTOR_CHANNEL
+from core.static_files import PrecompressedStaticFiles
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if state_backend.shared:
+        await state_backend.subscribe(FACTOR_CHANNEL, deliver_factor_update)
+    readiness.mark_ready()
+    yield
+    readiness.mark_stopping()
+    generation_executor.shutdown()
+    await state_backend.close()
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(router)
 
 app.add_middleware(
@@ -17,6 +34,6 @@ app.add_middleware(
 )
 
 try:
-    app.mount("/", StaticFiles(directory="frontend/dist", html=True), name="static")
+    app.mount("/", PrecompressedStaticFiles(directory="frontend/dist", html=True), name="static")
 except Exception as e:
     print(f"Error mounting static files: {e}")
@@ -1,3 +1,19 @@
-from music_generator.music_generator import MusicGenerator
+from music_generator.music_generator import (
+    MusicGenerator,
+    NOTE_DURATION_BEATS,
+    check_batch,
+    check_duration,
+    check_params,
+    get_note_seconds,
+    max_events_per_second
+)
 
-__all__ = ["MusicGenerator"]
+__all__ = [
+    "MusicGenerator",
+    "NOTE_DURATION_BEATS",
+    "check_batch",
+    "check_duration",
+    "check_params",
+    "get_note_seconds",
+    "max_events_per_second"
+]
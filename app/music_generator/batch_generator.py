@@ -0,0 +1,239 @@
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+import numpy as np
+from music_generator.music_generator import check_batch, stamp_events, take_chord
+from music_generator.scale_manager import ScaleManager
+from music_generator.tone_row import FORM_KINDS, ToneRowMatrix, get_snap_table, realize_candidates
+
+if TYPE_CHECKING:
+    from music_generator.music_generator import MusicGenerator
+
+
+class BatchNoteGenerator:
+    """Generate notes for many voices in one vectorized pass.
+
+    Durations, velocities, tempos, rests and chord sizes for every event of
+    every requested voice are drawn and computed as NumPy arrays; only the
+    walk through each voice's row stays a Python loop. Randomness comes from
+    a `numpy.random.Generator` per client, created from the client's seed.
+    It is not part of the voice state snapshots: after `restore_voice` in
+    another process the batch output of a seeded client starts its random
+    sequence over instead of continuing it, while `generate_next_notes`
+    continues bit for bit.
+    """
+
+    def __init__(self, music_generator: "MusicGenerator"):
+        self.music_generator = music_generator
+        self.rngs: Dict[str, np.random.Generator] = {}
+
+    def get_rng(self, client_id: str, seed: Optional[int] = None) -> np.random.Generator:
+        """Get the random generator of a client.
+
+        Args:
+            client_id (str): Client ID
+            seed (Optional[int]): Seed, only used when the generator is created
+        Returns:
+            np.random.Generator: Random generator
+        """
+        rng = self.rngs.get(client_id)
+        if rng is None:
+            rng = self.rngs[client_id] = np.random.default_rng(seed)
+        return rng
+
+    def remove_client(self, client_id: str) -> None:
+        """Forget the random generator of a client.
+
+        Args:
+            client_id (str): Client ID
+        """
+        self.rngs.pop(client_id, None)
+
+    def _duration_table(self, complexities: np.ndarray) -> np.ndarray:
+        """Build cumulative duration weights for each distinct complexity.
+
+        Args:
+            complexities (np.ndarray): Distinct complexities
+        Returns:
+            np.ndarray: (len(complexities), len(NOTE_DURATIONS)) cumulative weights
+        """
+        from music_generator.music_generator import NOTE_DURATIONS
+
+        table = np.empty((len(complexities), len(NOTE_DURATIONS)))
+        for i, complexity in enumerate(complexities.tolist()):
+            _, cum_weights = self.music_generator.get_note_duration_distribution(
+                max(0, min(100, complexity))
+            )
+            table[i, :len(cum_weights)] = cum_weights
+            table[i, len(cum_weights):] = cum_weights[-1]
+        return table
+
+    def generate_batch(self, client_id: str, requests: List[Dict]) -> Dict[int, List[Dict]]:
+        """Generate notes for several voices of a client at once.
+
+        Args:
+            client_id (str): Client ID
+            requests (List[Dict]): Voice requests with the same keys as the
+                `generate_notes` message: voiceId, params, globalParams and
+                duration (default 1); each voice at most once. Voices at
+                the same dissonance level get the same scale, chosen once
+        Returns:
+            Dict[int, List[Dict]]: Note data per voice ID
+        """
+        from music_generator.music_generator import MAX_TEMPO, MIN_TEMPO, NOTE_DURATIONS
+
+        rng = self.get_rng(client_id, self.music_generator.client_seeds.get(client_id))
+        if not requests:
+            return {}
+
+        counts = np.array(check_batch(requests), dtype=np.int64)
+        total = int(counts.sum())
+
+        def per_event(values, dtype=np.float64) -> np.ndarray:
+            return np.repeat(np.asarray(values, dtype=dtype), counts)
+
+        params = [request["params"] for request in requests]
+        global_params = [request["globalParams"] for request in requests]
+        base_velocity = per_event([p["velocity"] for p in params])
+        volume_factor = per_event([g.get("volumeFactor", 1.0) for g in global_params])
+        variation_range = per_event([p["velocityVariation"] / 100 * 0.5 for p in params])
+        base_tempo = per_event([p["tempo"] for p in params])
+        tempo_factor = per_event([g.get("tempoFactor", 1.0) for g in global_params])
+        rest_probability = per_event([
+            p["restProbability"] / 100 if p["rest"] else 0.0 for p in params
+        ])
+        chord_prob = per_event([p["chordProbability"] for p in params])
+        complexity = per_event([p["duration"] for p in params], dtype=np.int64)
+
+        draws = rng.random((5, total))
+
+        # Duration, velocity and tempo
+        distinct, complexity_index = np.unique(complexity, return_inverse=True)
+        cumulative = self._duration_table(distinct)[complexity_index]
+        duration_draw = draws[0] * cumulative[:, -1]
+        duration_index = (cumulative <= duration_draw[:, None]).sum(axis=1)
+        duration_index = np.minimum(duration_index, len(NOTE_DURATIONS) - 1)
+
+        velocity = base_velocity * volume_factor + (draws[1] * variation_range * 2 - variation_range)
+        np.clip(velocity, 0, 1, out=velocity)
+        tempo = base_tempo * tempo_factor + base_tempo * 0.1 * (draws[2] * 2 - 1)
+        np.clip(tempo, MIN_TEMPO, MAX_TEMPO, out=tempo)
+
+        # Rests
+        is_rest = draws[3] < rest_probability
+
+        # Chord sizes
+        chord_draw = draws[4] * 100
+        three_note_prob = np.where(chord_prob > 50, (chord_prob - 50) / 50 * 33, 0.0)
+        two_note_upper = np.where(
+            chord_prob > 50, three_note_prob + (100 - three_note_prob) / 2, chord_prob
+        )
+        num_notes = np.ones(total, dtype=np.int64)
+        num_notes[chord_draw < two_note_upper] = 2
+        num_notes[chord_draw < three_note_prob] = 3
+        num_notes[chord_prob <= 0] = 1
+
+        durations = [NOTE_DURATIONS[i] for i in duration_index.tolist()]
+        velocities = velocity.tolist()
+        tempos = tempo.tolist()
+        rests = is_rest.tolist()
+        chord_sizes = num_notes.tolist()
+
+        # One scale per dissonance level, shared by the voices of the batch
+        scales: Dict[float, Optional[Tuple[int, ...]]] = {}
+        for g in global_params:
+            level = g["dissonanceLevel"]
+            if level not in scales:
+                _, scale_pcs = ScaleManager.get_scale_for_dissonance_weighted(level, rng)
+                scales[level] = tuple(scale_pcs) if scale_pcs is not None else None
+
+        # Row advances
+        result: Dict[int, List[Dict]] = {}
+        offset = 0
+        for request, count in zip(requests, counts.tolist()):
+            result[request["voiceId"]] = self._advance_voice(
+                client_id,
+                request["voiceId"],
+                request,
+                rng,
+                scales[request["globalParams"]["dissonanceLevel"]],
+                durations[offset:offset + count],
+                velocities[offset:offset + count],
+                tempos[offset:offset + count],
+                rests[offset:offset + count],
+                chord_sizes[offset:offset + count]
+            )
+            offset += count
+        return result
+
+    def _advance_voice(
+        self,
+        client_id: str,
+        voice_id: int,
+        request: Dict,
+        rng: np.random.Generator,
+        scale_key: Optional[Tuple[int, ...]],
+        durations: List[str],
+        velocities: List[float],
+        tempos: List[float],
+        rests: List[bool],
+        chord_sizes: List[int]
+    ) -> List[Dict]:
+        """Walk a voice's row for precomputed events.
+
+        Args:
+            client_id (str): Client ID
+            voice_id (int): Voice ID
+            request (Dict): Voice request
+            rng (np.random.Generator): Random generator
+            scale_key (Optional[Tuple[int, ...]]): Scale pitch classes, None for no snapping
+            durations (List[str]): Note durations
+            velocities (List[float]): Velocities
+            tempos (List[float]): Tempos
+            rests (List[bool]): Rest flags
+            chord_sizes (List[int]): Requested notes per event
+        Returns:
+            List[Dict]: Note data
+        """
+        generator = self.music_generator
+        state = generator.get_voice_state(client_id, voice_id)
+        if not state:
+            generator.init_voice_state(client_id, voice_id)
+            state = generator.get_voice_state(client_id, voice_id)
+
+        params = request["params"]
+        dissonance_level = request["globalParams"]["dissonanceLevel"]
+        range_lower = params["rangeLower"]
+        range_upper = params["rangeUpper"]
+
+        notes_data = []
+        for duration, velocity, tempo, rest, num_notes in zip(
+            durations, velocities, tempos, rests, chord_sizes
+        ):
+            if rest:
+                notes_data.append({
+                    "notes": [],
+                    "duration": duration,
+                    "velocity": velocity,
+                    "tempo": tempo
+                })
+                continue
+
+            if not state.melody_row or state.sequence_index >= len(state.melody_row):
+                if not state.melody_row or rng.random() < 0.25:
+                    state.matrix = ToneRowMatrix(rng.permutation(12).tolist())
+                kind = FORM_KINDS[int(rng.integers(len(FORM_KINDS)))]
+                snap_table = get_snap_table(scale_key, range_lower, range_upper)
+                state.melody_row = bytes(
+                    realize_candidates(state.matrix.form(kind), snap_table, rng.random(24).tolist())
+                )
+                state.sequence_index = 0
+
+            num_notes = min(num_notes, len(state.melody_row) - state.sequence_index)
+            notes = take_chord(state, num_notes, dissonance_level)
+
+            notes_data.append({
+                "notes": notes,
+                "duration": duration,
+                "velocity": velocity,
+                "tempo": tempo
+            })
+        return stamp_events(state, notes_data)
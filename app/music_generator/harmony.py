@@ -0,0 +1,183 @@
+"""Interval-class dissonance of pitch-class sets and chord grouping selection.
+
+Every pitch-class set is a 12-bit mask (bit `pc` set for each pitch class).
+The interval-class vector of a set is counted with bit operations and
+reduced to a dissonance in [0, 1]: the mean roughness of the intervals
+between its pitch classes. Transposing a window does not change the
+dissonance of its groupings, so windows are transposed to start on pitch
+class 0, and the best grouping is scored for every dissonance level the
+first time such a window comes up; a chord then costs a translate and a
+dict lookup.
+
+`take_chord` imports this module on the first chord, and nothing is
+precomputed at import, so it adds nothing to startup.
+"""
+import math
+from functools import lru_cache
+from itertools import combinations
+from operator import itemgetter
+from typing import Dict, List, Sequence, Tuple
+from music_generator.scale_manager import DISSONANCE_BUCKETS
+
+# Row notes a chord is chosen from: the next note and the ones following it
+CHORD_WINDOW = 4
+
+# Roughness per interval class: minor 2nd/major 7th, major 2nd/minor 7th,
+# minor 3rd/major 6th, major 3rd/minor 6th, perfect 4th/5th, tritone
+INTERVAL_CLASS_DISSONANCE = (1.0, 0.6, 0.3, 0.2, 0.0, 0.8)
+
+# bytes.translate tables mapping a MIDI note to its pitch class above each root
+_TRANSPOSE = [bytes((note - root) % 12 for note in range(256)) for root in range(12)]
+
+
+def interval_class_vector(mask: int) -> Tuple[int, ...]:
+    """Count the interval classes of a pitch-class set.
+
+    Args:
+        mask (int): Pitch-class set as a 12-bit mask
+    Returns:
+        Tuple[int, ...]: Counts of interval classes 1-6
+    """
+    # Doubled so that shifting right rotates the pitch classes
+    doubled = mask | mask << 12
+    vector = []
+    for interval_class in range(1, 7):
+        # Pairs (pc, pc + ic); a tritone pair is found from both of its notes
+        pairs = bin(mask & (doubled >> interval_class)).count("1")
+        vector.append(pairs // 2 if interval_class == 6 else pairs)
+    return tuple(vector)
+
+
+@lru_cache(maxsize=4096)
+def dissonance(mask: int) -> float:
+    """Get the mean roughness of the intervals of a pitch-class set.
+
+    Args:
+        mask (int): Pitch-class set as a 12-bit mask
+    Returns:
+        float: Dissonance in [0, 1], 0 for sets with fewer than two pitch classes
+    """
+    vector = interval_class_vector(mask)
+    # Rounded so that sets with the same mean roughness tie exactly
+    return round(sum(map(float.__mul__, INTERVAL_CLASS_DISSONANCE, vector)) / max(sum(vector), 1), 12)
+
+
+def pitch_class_mask(notes: Sequence[int]) -> int:
+    """Get the pitch-class set of notes as a 12-bit mask.
+
+    Args:
+        notes (Sequence[int]): MIDI notes or pitch classes
+    Returns:
+        int: Mask for `interval_class_vector` and `dissonance`
+    """
+    mask = 0
+    for note in notes:
+        mask |= 1 << (note % 12)
+    return mask
+
+
+@lru_cache(maxsize=64)
+def chord_groupings(window: int, size: int) -> Tuple[Tuple[int, ...], ...]:
+    """Get the groupings of a chord from a window of row notes.
+
+    Args:
+        window (int): Notes in the window
+        size (int): Notes in the chord
+    Returns:
+        Tuple[Tuple[int, ...], ...]: Indexes into the window, each starting
+            with the first note, the consecutive grouping first
+    """
+    return tuple((0,) + rest for rest in combinations(range(1, window), size - 1))
+
+
+@lru_cache(maxsize=64)
+def chord_orders(window: int, size: int) -> Tuple[itemgetter, ...]:
+    """Get getters reordering the window for each grouping: the chord, then the skipped notes.
+
+    Args:
+        window (int): Notes in the window
+        size (int): Notes in the chord
+    Returns:
+        Tuple[itemgetter, ...]: Getters of the permuted window, in the order
+            of `chord_groupings`
+    """
+    return tuple(
+        itemgetter(*grouping, *(i for i in range(window) if i not in grouping))
+        for grouping in chord_groupings(window, size)
+    )
+
+
+def score_groupings(pitch_classes: bytes, size: int) -> bytes:
+    """Choose the grouping closest to every dissonance level.
+
+    Ties go to the earliest grouping, so notes are only taken out of row
+    order when that gets closer to the level.
+
+    Args:
+        pitch_classes (bytes): Pitch classes of the window
+        size (int): Notes in the chord
+    Returns:
+        bytes: Index into `chord_groupings` per dissonance bucket
+    """
+    earliest: Dict[float, int] = {}
+    for index, grouping in enumerate(chord_groupings(len(pitch_classes), size)):
+        earliest.setdefault(dissonance(pitch_class_mask([pitch_classes[i] for i in grouping])), index)
+    scores = sorted(earliest.items())
+    # The closest score only changes where the level passes the midpoint of
+    # two neighbouring scores, so fill runs of buckets between midpoints
+    best = bytearray()
+    for (low, low_index), (high, high_index) in zip(scores, scores[1:]):
+        bucket = max(len(best), math.ceil((low + high) / 2 * DISSONANCE_BUCKETS) - 1)
+        while bucket <= DISSONANCE_BUCKETS:
+            level = bucket / DISSONANCE_BUCKETS
+            if (abs(high - level), high_index) < (abs(low - level), low_index):
+                break
+            bucket += 1
+        best += bytes((low_index,)) * (bucket - len(best))
+    best += bytes((scores[-1][1],)) * (DISSONANCE_BUCKETS + 1 - len(best))
+    return bytes(best)
+
+
+# Best grouping per dissonance bucket, by chord size and transposed window.
+# Bounded by the 12**3 + 12**2 possible windows per size (about 0.4 MB each).
+_BEST_GROUPINGS: List[Dict[bytes, bytes]] = [{} for _ in range(CHORD_WINDOW + 1)]
+
+
+def best_grouping(window: bytes, size: int, bucket: int) -> int:
+    """Choose the grouping of a chord whose dissonance is closest to a level.
+
+    Args:
+        window (bytes): Next row notes (MIDI notes or pitch classes)
+        size (int): Notes in the chord, at most len(window)
+        bucket (int): Target dissonance, quantized to DISSONANCE_BUCKETS
+    Returns:
+        int: Index into `chord_groupings` and `chord_orders`; 0 keeps row order
+    """
+    if size >= len(window):
+        return 0
+    if not 0 <= bucket <= DISSONANCE_BUCKETS:
+        bucket = min(max(bucket, 0), DISSONANCE_BUCKETS)
+    pitch_classes = window.translate(_TRANSPOSE[window[0] % 12])
+    best = _BEST_GROUPINGS[size].get(pitch_classes)
+    if best is None:
+        best = _BEST_GROUPINGS[size][pitch_classes] = score_groupings(pitch_classes, size)
+    return best[bucket]
+
+
+def steer_row(row: bytes, start: int, size: int, bucket: int) -> bytes:
+    """Move the notes of the chord starting at `start` to the front of its window.
+
+    Args:
+        row (bytes): Melody row
+        start (int): Index of the chord's first note
+        size (int): Notes in the chord
+        bucket (int): Target dissonance, quantized to DISSONANCE_BUCKETS
+    Returns:
+        bytes: Row with the chord at `start` and the notes it skipped after
+            it, the same object when row order is kept
+    """
+    window = row[start:start + CHORD_WINDOW]
+    grouping = best_grouping(window, size, bucket)
+    if not grouping:
+        return row
+    return row[:start] + bytes(chord_orders(len(window), size)[grouping](window)) + row[start + len(window):]
@@ -0,0 +1,194 @@
+"""Streaming Standard MIDI File (format 1) writer.
+
+A track chunk starts with its byte length, so each track is written to a
+spooled temporary file (kept in memory up to `SPOOL_MAX_SIZE`, on disk
+beyond) and copied out in chunks once it is complete. Memory use is bounded
+by the spool size regardless of how long the piece is.
+
+Generated events carry their own tempo, so time is rendered as wall-clock
+seconds against a fixed conductor tempo (`TEMPO_BPM`).
+"""
+import random
+import struct
+from tempfile import SpooledTemporaryFile
+from typing import Dict, Iterator, List, Optional
+from music_generator.music_generator import MusicGenerator, get_note_seconds
+
+TICKS_PER_BEAT = 480
+TEMPO_BPM = 120
+TICKS_PER_SECOND = TICKS_PER_BEAT * TEMPO_BPM / 60
+SPOOL_MAX_SIZE = 1 << 20
+CHUNK_SIZE = 1 << 16
+# Events generated per generate_next_notes call while rendering
+RENDER_STEP = 256
+# Channel 10 (index 9) is reserved for percussion in General MIDI
+MELODIC_CHANNELS = tuple(channel for channel in range(16) if channel != 9)
+
+_END_OF_TRACK = b"\x00\xff\x2f\x00"
+
+
+def encode_var_len(value: int) -> bytes:
+    """Encode a variable-length quantity.
+
+    Args:
+        value (int): Non-negative value
+    Returns:
+        bytes: 7 bits per byte, most significant first, continuation bit set on all but the last
+    """
+    encoded = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.reverse()
+    return bytes(encoded)
+
+
+def header_chunk(track_count: int, ticks_per_beat: int = TICKS_PER_BEAT) -> bytes:
+    """Build the MThd chunk of a format 1 file.
+
+    Args:
+        track_count (int): Number of tracks including the conductor track
+        ticks_per_beat (int): Time division
+    Returns:
+        bytes: Header chunk
+    """
+    return b"MThd" + struct.pack(">IHHH", 6, 1, track_count, ticks_per_beat)
+
+
+def conductor_track(bpm: float = TEMPO_BPM) -> bytes:
+    """Build the conductor track holding the tempo.
+
+    Args:
+        bpm (float): Tempo
+    Returns:
+        bytes: Track chunk
+    """
+    microseconds = round(60_000_000 / bpm)
+    events = b"\x00\xff\x51\x03" + microseconds.to_bytes(3, "big") + _END_OF_TRACK
+    return b"MTrk" + struct.pack(">I", len(events)) + events
+
+
+class TrackWriter:
+    """Writes generated events of one voice as a MIDI track."""
+
+    def __init__(
+        self,
+        channel: int,
+        name: Optional[str] = None,
+        program: Optional[int] = None,
+        spool_max_size: int = SPOOL_MAX_SIZE
+    ):
+        """Initialize the writer.
+
+        Args:
+            channel (int): MIDI channel (0-15)
+            name (Optional[str]): Track name
+            program (Optional[int]): Program change sent at the start
+            spool_max_size (int): Bytes kept in memory before spilling to disk
+        """
+        self.channel = channel
+        self.file = SpooledTemporaryFile(max_size=spool_max_size)
+        self.length = 0
+        # Position in seconds and in ticks of the last written event
+        self.seconds = 0.0
+        self.tick = 0
+        if name:
+            encoded = name.encode()
+            self._write(b"\x00\xff\x03" + encode_var_len(len(encoded)) + encoded)
+        if program is not None:
+            self._write(bytes((0, 0xC0 | channel, program & 0x7F)))
+
+    def _write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.length += len(data)
+
+    def write_events(self, notes_data: List[Dict], until: Optional[float] = None) -> None:
+        """Append generated events; notes sound for the length of their event.
+
+        Args:
+            notes_data (List[Dict]): Events with notes, duration, velocity and tempo
+            until (Optional[float]): Drop events starting at or after this many seconds
+        """
+        note_on = 0x90 | self.channel
+        note_off = 0x80 | self.channel
+        out = bytearray()
+        for note_data in notes_data:
+            if until is not None and self.seconds >= until:
+                break
+            start_tick = round(self.seconds * TICKS_PER_SECOND)
+            self.seconds += get_note_seconds(note_data)
+            notes = note_data["notes"]
+            if not notes:
+                continue
+            end_tick = round(self.seconds * TICKS_PER_SECOND)
+            velocity = max(1, min(127, round(note_data["velocity"] * 127)))
+            delta = start_tick - self.tick
+            for note in notes:
+                out += encode_var_len(delta)
+                out += bytes((note_on, note, velocity))
+                delta = 0
+            delta = end_tick - start_tick
+            for note in notes:
+                out += encode_var_len(delta)
+                out += bytes((note_off, note, 0))
+                delta = 0
+            self.tick = end_tick
+        self._write(bytes(out))
+
+    def chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Finish the track and yield it as an MTrk chunk, then release the spool.
+
+        Args:
+            chunk_size (int): Bytes per yielded piece
+        Returns:
+            Iterator[bytes]: Track chunk pieces
+        """
+        # Trailing rests still count towards the length of the track
+        self._write(encode_var_len(round(self.seconds * TICKS_PER_SECOND) - self.tick) + _END_OF_TRACK[1:])
+        try:
+            yield b"MTrk" + struct.pack(">I", self.length)
+            self.file.seek(0)
+            while chunk := self.file.read(chunk_size):
+                yield chunk
+        finally:
+            self.file.close()
+
+
+def render_midi(
+    voices: List[Dict],
+    global_params: Dict,
+    length_seconds: float,
+    seed: Optional[int] = None
+) -> Iterator[bytes]:
+    """Render voices to a multi-track MIDI file.
+
+    Each voice is generated on its own until it reaches `length_seconds`
+    and streamed out before the next one starts. The same seed gives the
+    same file.
+
+    Args:
+        voices (List[Dict]): Voices with voiceId, params and optional program
+        global_params (Dict): Global parameters
+        length_seconds (float): Length of the piece
+        seed (Optional[int]): Random seed
+    Returns:
+        Iterator[bytes]: File pieces
+    """
+    generator = MusicGenerator(rng=random.Random(seed))
+    client_id = "render"
+    yield header_chunk(len(voices) + 1)
+    yield conductor_track()
+    for index, voice in enumerate(voices):
+        voice_id = voice["voiceId"]
+        track = TrackWriter(
+            MELODIC_CHANNELS[index % len(MELODIC_CHANNELS)],
+            name=f"Voice {voice_id}",
+            program=voice.get("program")
+        )
+        while track.seconds < length_seconds:
+            track.write_events(generator.generate_next_notes(
+                client_id, voice_id, voice["params"], global_params, RENDER_STEP
+            ), until=length_seconds)
+        generator.remove_voice(client_id, voice_id)
+        yield from track.chunks()
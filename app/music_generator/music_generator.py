@@ -1,21 +1,320 @@
-from dataclasses import dataclass
-from typing import List, Dict, Union, Optional
+from bisect import bisect
+from functools import lru_cache
+from itertools import accumulate
+from typing import List, Dict, Tuple, Union, Optional
 import random
-from music_generator.scale_manager import ScaleManager
+import struct
+from music_generator.scale_manager import DISSONANCE_BUCKETS, ScaleManager, nearest_pitch_classes
+from music_generator.state_store import VoiceStateStore
+from music_generator.tone_row import FORM_KINDS, ToneRowMatrix, get_snap_table, realize_candidates
+
+NOTE_DURATIONS = ['2n', '4n', '8n', '16n', '32n']
+# Length of each note duration in beats (quarter notes)
+NOTE_DURATION_BEATS = {'1n': 4.0, '2n': 2.0, '4n': 1.0, '8n': 0.5, '16n': 0.25, '32n': 0.125}
+
+
+def get_note_seconds(note_data: Dict) -> float:
+    """Get the playback length of a generated event.
+
+    Args:
+        note_data (Dict): Event with duration and tempo
+    Returns:
+        float: Length in seconds
+    """
+    return NOTE_DURATION_BEATS[note_data["duration"]] * 60 / max(note_data["tempo"], 1.0)
+
+
+# Tempo range of generated events in BPM; the UI sends 60-480 scaled by a 0.5-2 factor
+MIN_TEMPO = 20.0
+MAX_TEMPO = 1200.0
+
+# Events generated per call while filling a voice up to a time
+FILL_CHUNK_SIZE = 1
+# Upper bound of the events of one fill_until call
+FILL_MAX_EVENTS = 4096
+
+VOICE_STATE_VERSION = 3
+_CLOCK = struct.Struct("<dd")
+_RNG_STATE = struct.Struct("<625IBd")
 
 
-@dataclass
 class VoiceState:
-    melody_row: List[int]
-    base_row: List[int]
-    row_retro: List[int]
-    row_inverted: List[int]
-    row_retro_inverted: List[int]
-    sequence_index: int = 0
+    """Row state of one voice.
+
+    The current row is kept as a ToneRowMatrix (12 pitch-class bytes) and the
+    snapped, ranged melody row as MIDI note bytes. Voices of seeded clients
+    carry their own random source; the others draw from the generator's.
+    `beat` and `seconds` are the voice's clock: the position where the next
+    generated event starts, from the voice's first event.
+    """
+
+    __slots__ = ("melody_row", "matrix", "sequence_index", "rng", "beat", "seconds")
+
+    def __init__(
+        self,
+        melody_row: bytes,
+        matrix: ToneRowMatrix,
+        sequence_index: int = 0,
+        rng: Optional[random.Random] = None,
+        beat: float = 0.0,
+        seconds: float = 0.0
+    ):
+        self.melody_row = melody_row
+        self.matrix = matrix
+        self.sequence_index = sequence_index
+        self.rng = rng
+        self.beat = beat
+        self.seconds = seconds
+
+    def __repr__(self) -> str:
+        return (
+            f"VoiceState(melody_row={list(self.melody_row)}, "
+            f"row={list(self.matrix.prime)}, sequence_index={self.sequence_index}, "
+            f"seeded={self.rng is not None}, beat={self.beat}, seconds={self.seconds})"
+        )
+
+    def to_bytes(self) -> bytes:
+        """Serialize the state.
+
+        Layout: version, sequence index, 12 row bytes, melody row length and
+        bytes, the clock (beat and seconds as doubles), then a flag and, when
+        set, the Mersenne Twister state (624 words, position) and the cached
+        Gaussian.
+
+        Returns:
+            bytes: Serialized state
+        """
+        data = (
+            bytes((VOICE_STATE_VERSION, self.sequence_index)) + self.matrix.prime
+            + bytes((len(self.melody_row),)) + self.melody_row
+            + _CLOCK.pack(self.beat, self.seconds)
+        )
+        if self.rng is None:
+            return data + b"\x00"
+        _, words, gauss_next = self.rng.getstate()
+        return data + b"\x01" + _RNG_STATE.pack(
+            *words, gauss_next is not None, gauss_next or 0.0
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "VoiceState":
+        """Restore a state serialized with `to_bytes`.
+
+        Version 1 states (without melody length and random state) and
+        version 2 states (without clock) are accepted too, starting at beat 0.
+
+        Args:
+            data (bytes): Serialized state
+        Returns:
+            VoiceState: Voice state
+        """
+        if data[0] == 1:
+            return cls(bytes(data[14:]), ToneRowMatrix(data[2:14]), data[1])
+        if data[0] not in (2, VOICE_STATE_VERSION):
+            raise ValueError(f"Unsupported voice state version {data[0]}")
+        melody_end = 15 + data[14]
+        flag_offset = melody_end
+        beat = seconds = 0.0
+        if data[0] == VOICE_STATE_VERSION:
+            beat, seconds = _CLOCK.unpack_from(data, melody_end)
+            flag_offset += _CLOCK.size
+        rng = None
+        if data[flag_offset]:
+            *words, has_gauss, gauss_next = _RNG_STATE.unpack_from(data, flag_offset + 1)
+            rng = random.Random()
+            rng.setstate((3, tuple(words), gauss_next if has_gauss else None))
+        return cls(
+            melody_row=bytes(data[15:melody_end]),
+            matrix=ToneRowMatrix(data[2:14]),
+            sequence_index=data[1],
+            rng=rng,
+            beat=beat,
+            seconds=seconds
+        )
+
+
+def stamp_events(state: VoiceState, notes_data: List[Dict]) -> List[Dict]:
+    """Tag events with their start on the voice's clock and advance it.
+
+    Args:
+        state (VoiceState): Voice state owning the clock
+        notes_data (List[Dict]): Events in playback order
+    Returns:
+        List[Dict]: The same events with `beat` and `time` (seconds)
+    """
+    beat = state.beat
+    seconds = state.seconds
+    for note_data in notes_data:
+        note_data["beat"] = beat
+        note_data["time"] = seconds
+        beats = NOTE_DURATION_BEATS[note_data["duration"]]
+        beat += beats
+        seconds += beats * 60 / max(note_data["tempo"], 1.0)
+    state.beat = beat
+    state.seconds = seconds
+    return notes_data
+
+
+def take_chord(state: VoiceState, num_notes: int, dissonance_level: float) -> List[int]:
+    """Take the notes of the next event from the voice's melody row.
+
+    A chord starts with the next row note and takes the rest of its notes
+    from the following ones (`harmony.CHORD_WINDOW` in all), grouped to come
+    closest to the dissonance level. Notes it skips stay next in the row, so
+    every row note is still played once.
+
+    Args:
+        state (VoiceState): Voice state with at least num_notes row notes left
+        num_notes (int): Notes in the event
+        dissonance_level (float): Target dissonance
+    Returns:
+        List[int]: MIDI notes
+    """
+    start = state.sequence_index
+    row = state.melody_row
+    state.sequence_index += num_notes
+    if num_notes == 1:
+        return [row[start]]
+    harmony = _harmony or _load_harmony()
+    row = state.melody_row = harmony.steer_row(row, start, num_notes, round(dissonance_level * DISSONANCE_BUCKETS))
+    return list(row[start:start + num_notes])
+
+
+_harmony = None
+
+
+def _load_harmony():
+    global _harmony
+    # Imported on the first chord, keeping its tables out of startup
+    from music_generator import harmony
+    _harmony = harmony
+    return harmony
+
+
+def check_params(params: Dict, global_params: Dict) -> None:
+    """Reject parameters generation cannot use, before a stream or render relies on them.
+
+    Args:
+        params (Dict): Voice parameters
+        global_params (Dict): Global parameters
+    """
+    try:
+        if not 0 <= params["rangeLower"] <= params["rangeUpper"] <= 127:
+            raise ValueError("range must satisfy 0 <= rangeLower <= rangeUpper <= 127")
+        # One event exercises every parameter generation reads
+        MusicGenerator(VoiceStateStore(), random.Random(0)).generate_next_notes(
+            "check", 0, params, global_params, 1
+        )
+    except KeyError as e:
+        raise ValueError(f"missing parameter {e}") from None
+    except TypeError as e:
+        raise ValueError(str(e)) from None
+
+
+def check_duration(duration, voice_id) -> int:
+    """Reject a requested number of events that is not a non-negative integer.
+
+    Args:
+        duration: Requested events
+        voice_id: Voice ID, for the error message
+    Returns:
+        int: Requested events
+    """
+    if isinstance(duration, bool) or not isinstance(duration, int) or duration < 0:
+        raise ValueError(f"duration of voice {voice_id} must be a non-negative integer")
+    return duration
+
+
+def check_batch(voices: List[Dict]) -> List[int]:
+    """Reject batch requests that repeat a voice or ask for a negative number of events.
+
+    Batch results are keyed by voice ID, so a repeated voice would overwrite
+    the notes of its earlier request.
+
+    Args:
+        voices (List[Dict]): Voice requests with voiceId and duration (default 1)
+    Returns:
+        List[int]: Events requested per voice, in request order
+    """
+    durations = []
+    seen = set()
+    for voice in voices:
+        voice_id = voice["voiceId"]
+        if voice_id in seen:
+            raise ValueError(f"voice {voice_id} is requested more than once")
+        seen.add(voice_id)
+        durations.append(check_duration(voice.get("duration", 1), voice_id))
+    return durations
+
+
+def max_events_per_second(params: Dict, global_params: Dict) -> float:
+    """Get an upper bound of the events a voice generates per second of playback.
+
+    Every event is at least the shortest duration its complexity allows, at
+    the fastest tempo the parameters reach, clamped like generated tempos.
+
+    Args:
+        params (Dict): Voice parameters
+        global_params (Dict): Global parameters
+    Returns:
+        float: Events per second
+    """
+    durations, _ = MusicGenerator.get_note_duration_distribution(max(0, min(100, int(params["duration"]))))
+    tempo = params["tempo"] * global_params.get("tempoFactor", 1.0) + abs(params["tempo"]) * 0.1
+    tempo = max(MIN_TEMPO, min(MAX_TEMPO, tempo))
+    return tempo / 60 / NOTE_DURATION_BEATS[durations[-1]]
+
 
 class MusicGenerator:
-    def __init__(self):
-        self.client_states: Dict[str, Dict[int, VoiceState]] = {}
+    def __init__(
+        self,
+        state_store: Optional[VoiceStateStore] = None,
+        rng: Optional[random.Random] = None
+    ):
+        """Initialize the generator.
+
+        Args:
+            state_store (Optional[VoiceStateStore]): Voice state store, configured from the environment by default
+            rng (Optional[random.Random]): Random source, the shared `random` module by default; pass a seeded one for reproducible output
+        """
+        self.state_store = state_store if state_store is not None else VoiceStateStore.from_env()
+        self.rng = rng if rng is not None else random
+        self.client_seeds: Dict[str, int] = {}
+        self._batch_generator = None
+
+    def seed_client(self, client_id: str, seed: int) -> None:
+        """Make a client's generation reproducible.
+
+        Every voice of the client gets its own random source derived from the
+        seed and the voice ID, so voices and clients do not perturb each other.
+        Existing voices get one too, except those that already have their own
+        (e.g. restored from a snapshot), which continue where they left off.
+
+        Args:
+            client_id (str): Client ID
+            seed (int): Seed
+        """
+        self.client_seeds[client_id] = seed
+        for voice_id, state in self.state_store.voices(client_id).items():
+            if state.rng is None:
+                state.rng = self.create_voice_rng(client_id, voice_id)
+        if self._batch_generator is not None:
+            self._batch_generator.remove_client(client_id)
+
+    def create_voice_rng(self, client_id: str, voice_id: int) -> Optional[random.Random]:
+        """Create the random source of a voice.
+
+        Args:
+            client_id (str): Client ID
+            voice_id (int): Voice ID
+        Returns:
+            Optional[random.Random]: Random source, None when the client is not seeded
+        """
+        seed = self.client_seeds.get(client_id)
+        if seed is None:
+            return None
+        # String seeds are hashed with SHA-512, so this is stable across processes
+        return random.Random(f"{seed}:{voice_id!r}")
     
     def init_voice_state(self, client_id: str, voice_id: int) -> None:
         """Initialize voice state.
@@ -24,23 +323,14 @@ class MusicGenerator:
             client_id (str): Client ID
             voice_id (int): Voice ID
         """
-        if client_id not in self.client_states:
-            self.client_states[client_id] = {}
-            
         # Generate new 12-note sequence
-        base_row = self.generate_new_sequence()
-        row_retro = self.retrograde(base_row)
-        row_inverted = self.inversion(base_row)
-        row_retro_inverted = self.retrograde(row_inverted)
-        
-        self.client_states[client_id][voice_id] = VoiceState(
-            melody_row=[],
-            base_row=base_row,
-            row_retro=row_retro,
-            row_inverted=row_inverted,
-            row_retro_inverted=row_retro_inverted,
-            sequence_index=0
-        )
+        rng = self.create_voice_rng(client_id, voice_id)
+        self.state_store.set(client_id, voice_id, VoiceState(
+            melody_row=b"",
+            matrix=ToneRowMatrix(self.generate_new_sequence(rng)),
+            sequence_index=0,
+            rng=rng
+        ))
 
     def get_voice_state(self, client_id: str, voice_id: int) -> Optional[VoiceState]:
         """Get voice state.
@@ -49,16 +339,73 @@ class MusicGenerator:
             client_id (str): Client ID
             voice_id (int): Voice ID
         """
-        return self.client_states.get(client_id, {}).get(voice_id)
+        return self.state_store.get(client_id, voice_id)
+
+    def dump_voice(self, client_id: str, voice_id: int) -> Optional[bytes]:
+        """Serialize voice state.
+
+        Args:
+            client_id (str): Client ID
+            voice_id (int): Voice ID
+        Returns:
+            Optional[bytes]: Serialized state, None when the voice is unknown
+        """
+        state = self.get_voice_state(client_id, voice_id)
+        return state.to_bytes() if state is not None else None
+
+    def restore_voice(self, client_id: str, voice_id: int, data: bytes) -> None:
+        """Restore voice state serialized with `dump_voice`.
+
+        The voice's own random source is restored, but not the client's
+        batch generator (see `BatchNoteGenerator`).
+
+        Args:
+            client_id (str): Client ID
+            voice_id (int): Voice ID
+            data (bytes): Serialized state
+        """
+        self.state_store.set(client_id, voice_id, VoiceState.from_bytes(data))
+
+    def remove_voice(self, client_id: str, voice_id: int) -> None:
+        """Remove voice state.
+
+        Args:
+            client_id (str): Client ID
+            voice_id (int): Voice ID
+        """
+        self.state_store.remove_voice(client_id, voice_id)
+
+    def rename_voice(self, client_id: str, old_id: int, new_id: int) -> None:
+        """Move voice state to a new voice ID.
 
-    def generate_new_sequence(self) -> List[int]:
+        Args:
+            client_id (str): Client ID
+            old_id (int): Old voice ID
+            new_id (int): New voice ID
+        """
+        self.state_store.rename_voice(client_id, old_id, new_id)
+
+    def remove_client(self, client_id: str) -> None:
+        """Remove all state of a client.
+
+        Args:
+            client_id (str): Client ID
+        """
+        self.state_store.remove_client(client_id)
+        self.client_seeds.pop(client_id, None)
+        if self._batch_generator is not None:
+            self._batch_generator.remove_client(client_id)
+
+    def generate_new_sequence(self, rng: Optional[random.Random] = None) -> List[int]:
         """Generate new 12-note sequence.
         
+        Args:
+            rng (Optional[random.Random]): Random source, defaults to the generator's
         Returns:
             List[int]: 12-note sequence
         """
         notes = list(range(60, 72))  # 60-71 (C4-B4)
-        random.shuffle(notes)
+        (rng or self.rng).shuffle(notes)
         return notes
 
     def retrograde(self, row: List[int]) -> List[int]:
@@ -96,10 +443,8 @@ class MusicGenerator:
         octave = note // 12
         if scale_pcs is None:
             return note
-        distances = [(s, min(abs(s - pc), 12 - abs(s - pc))) for s in scale_pcs]
-        min_distance = min(distances, key=lambda x: x[1])[1]
-        closest_pcs = [s for s, d in distances if d == min_distance]
-        closest_pc = random.choice(closest_pcs)
+        closest_pcs = nearest_pitch_classes(tuple(scale_pcs))[pc]
+        closest_pc = self.rng.choice(closest_pcs)
         snapped_note = closest_pc + (octave * 12)
         possible_notes = [snapped_note - 12, snapped_note, snapped_note + 12]
         return min(possible_notes, key=lambda n: abs(n - note))
@@ -129,45 +474,70 @@ class MusicGenerator:
         if not possible_octaves:
             return None
         
-        selected_octave = random.choice(possible_octaves)
+        selected_octave = self.rng.choice(possible_octaves)
         return pitch_class + (selected_octave * 12)
 
-    def get_note_duration(self, complexity: int) -> str:
-        """Determine note duration based on complexity.
-        
+    @staticmethod
+    def get_note_duration_weights(complexity: int) -> List[float]:
+        """Get note duration weights based on complexity.
+
         Args:
             complexity (int): Complexity
         Returns:
-            str: Note duration
+            List[float]: Weights for the leading entries of NOTE_DURATIONS
         """
         if complexity <= 0:
-            return '2n'
+            return [1.0]
         elif complexity <= 25:
-            return random.choices(['2n', '4n'], weights=[1 - (0.5 * complexity/25), 0.5 * complexity/25])[0]
+            return [1 - (0.5 * complexity/25), 0.5 * complexity/25]
         elif complexity <= 50:
-            weights = [
+            return [
                 0.5 - (0.167 * (complexity-25)/25),
                 0.5 - (0.167 * (complexity-25)/25),
                 0.333 * (complexity-25)/25
             ]
-            return random.choices(['2n', '4n', '8n'], weights=weights)[0]
         elif complexity <= 75:
-            weights = [
+            return [
                 0.333 - (0.083 * (complexity-50)/25),
                 0.333 - (0.083 * (complexity-50)/25),
                 0.333 - (0.083 * (complexity-50)/25),
                 0.25 * (complexity-50)/25
             ]
-            return random.choices(['2n', '4n', '8n', '16n'], weights=weights)[0]
         else:
-            weights = [
+            return [
                 0.25 - (0.05 * (complexity-75)/25),
                 0.25 - (0.05 * (complexity-75)/25),
                 0.25 - (0.05 * (complexity-75)/25),
                 0.25 - (0.05 * (complexity-75)/25),
                 0.2 * (complexity-75)/25
             ]
-            return random.choices(['2n', '4n', '8n', '16n', '32n'], weights=weights)[0]
+
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def get_note_duration_distribution(complexity: int) -> Tuple[Tuple[str, ...], Tuple[float, ...]]:
+        """Get the cumulative note duration distribution for a complexity.
+
+        Args:
+            complexity (int): Complexity, already quantized to 0-100
+        Returns:
+            Tuple[Tuple[str, ...], Tuple[float, ...]]: Durations and cumulative weights
+        """
+        weights = MusicGenerator.get_note_duration_weights(complexity)
+        return tuple(NOTE_DURATIONS[:len(weights)]), tuple(accumulate(weights))
+
+    def get_note_duration(self, complexity: int, rng: Optional[random.Random] = None) -> str:
+        """Determine note duration based on complexity.
+        
+        Args:
+            complexity (int): Complexity
+            rng (Optional[random.Random]): Random source, defaults to the generator's
+        Returns:
+            str: Note duration
+        """
+        durations, cum_weights = self.get_note_duration_distribution(max(0, min(100, int(complexity))))
+        if len(durations) == 1:
+            return durations[0]
+        return durations[bisect(cum_weights, (rng or self.rng).random() * cum_weights[-1], 0, len(durations) - 1)]
 
     def generate_next_notes(
         self, 
@@ -175,7 +545,8 @@ class MusicGenerator:
         voice_id: int, 
         params: Dict, 
         global_params: Dict, 
-        duration: int = 1
+        duration: int = 1,
+        scale: Optional[Tuple[str, Optional[List[int]]]] = None
     ) -> List[Dict]:
         """Generate next notes based on 12-note technique.
         
@@ -185,6 +556,8 @@ class MusicGenerator:
             params (Dict): Parameters
             global_params (Dict): Global parameters
             duration (int): Duration
+            scale (Optional[Tuple[str, Optional[List[int]]]]): Scale name and pitch classes
+                already chosen for the dissonance level, chosen here when omitted
         Returns:
             List[Dict]: Next notes
         """
@@ -193,24 +566,32 @@ class MusicGenerator:
             self.init_voice_state(client_id, voice_id)
             state = self.get_voice_state(client_id, voice_id)
 
+        rng = state.rng if state.rng is not None else self.rng
+
         notes_data = []
         dissonance_level = global_params["dissonanceLevel"]
         tempo_factor = global_params.get("tempoFactor", 1.0)
         volume_factor = global_params.get("volumeFactor", 1.0)
-        _, scale_pcs = ScaleManager.get_scale_for_dissonance_weighted(dissonance_level)
+        if scale is None:
+            scale = ScaleManager.get_scale_for_dissonance_weighted(dissonance_level, rng)
+        _, scale_pcs = scale
+        scale_key = tuple(scale_pcs) if scale_pcs is not None else None
+        range_lower = params["rangeLower"]
+        range_upper = params["rangeUpper"]
 
         for _ in range(duration):
             # Process duration, velocity, and tempo
-            adjusted_duration = self.get_note_duration(params["duration"])
+            adjusted_duration = self.get_note_duration(params["duration"], rng)
             velocity_variation = params["velocityVariation"] / 100
             variation_range = velocity_variation * 0.5
-            adjusted_velocity = (params["velocity"] * volume_factor) + (random.random() * variation_range * 2 - variation_range)
+            adjusted_velocity = (params["velocity"] * volume_factor) + (rng.random() * variation_range * 2 - variation_range)
             adjusted_velocity = max(0, min(1, adjusted_velocity))
             
-            adjusted_tempo = (params["tempo"] * tempo_factor) + (params["tempo"] * 0.1 * (random.random() * 2 - 1))
+            adjusted_tempo = (params["tempo"] * tempo_factor) + (params["tempo"] * 0.1 * (rng.random() * 2 - 1))
+            adjusted_tempo = max(MIN_TEMPO, min(MAX_TEMPO, adjusted_tempo))
 
             # Process rest
-            if params["rest"] and (random.random() < params["restProbability"] / 100):
+            if params["rest"] and (rng.random() < params["restProbability"] / 100):
                 notes_data.append({
                     "notes": [],
                     "duration": adjusted_duration,
@@ -222,32 +603,16 @@ class MusicGenerator:
             # If melody_row is used up or not yet generated
             if not state.melody_row or state.sequence_index >= len(state.melody_row):
                 # Generate new 12-note sequence with 25% probability
-                if not state.melody_row or random.random() < 0.25:
-                    state.base_row = self.generate_new_sequence()
-                    state.row_retro = self.retrograde(state.base_row)
-                    state.row_inverted = self.inversion(state.base_row)
-                    state.row_retro_inverted = self.retrograde(state.row_inverted)
-
-                # Select one of the four rows randomly
-                selected_row = random.choice([
-                    state.base_row,
-                    state.row_retro,
-                    state.row_inverted,
-                    state.row_retro_inverted
-                ])
-
-                state.melody_row = []
-                
-                for i, note in enumerate(selected_row):
-                    snapped_note = self.snap_note(note, scale_pcs)
-                    adjusted_note = self.adjust_note_to_range(
-                        snapped_note,
-                        params["rangeLower"],
-                        params["rangeUpper"]
-                    )
-                    if adjusted_note is not None:
-                        state.melody_row.append(adjusted_note)
+                if not state.melody_row or rng.random() < 0.25:
+                    state.matrix = ToneRowMatrix(self.generate_new_sequence(rng))
 
+                # Select one of the four untransposed forms randomly and snap
+                # it to the scale and range; the snap table is shared by all
+                # voices, leaving only the random choices per refill
+                selected_row = state.matrix.form(rng.choice(FORM_KINDS))
+                snap_table = get_snap_table(scale_key, range_lower, range_upper)
+                draws = [rng.random() for _ in range(2 * len(selected_row))]
+                state.melody_row = bytes(realize_candidates(selected_row, snap_table, draws))
                 state.sequence_index = 0
 
             # Generate chord
@@ -255,7 +620,7 @@ class MusicGenerator:
             num_notes = 1
             
             if chord_prob > 0:
-                random_value = random.random() * 100
+                random_value = rng.random() * 100
                 if chord_prob <= 50:
                     if random_value < chord_prob:
                         num_notes = 2
@@ -272,11 +637,8 @@ class MusicGenerator:
             remaining_notes = len(state.melody_row) - state.sequence_index
             num_notes = min(num_notes, remaining_notes)
 
-            # Get notes
-            notes = []
-            for i in range(num_notes):
-                notes.append(state.melody_row[state.sequence_index + i])
-            state.sequence_index += num_notes
+            # Get notes, grouping chords toward the dissonance level
+            notes = take_chord(state, num_notes, dissonance_level)
 
             notes_data.append({
                 "notes": notes,
@@ -285,4 +647,92 @@ class MusicGenerator:
                 "tempo": adjusted_tempo
             })
 
+        return stamp_events(state, notes_data)
+
+    def fill_until(
+        self,
+        client_id: str,
+        voice_id: int,
+        params: Dict,
+        global_params: Dict,
+        until: float,
+        unit: str = "seconds",
+        max_events: int = FILL_MAX_EVENTS
+    ) -> List[Dict]:
+        """Generate events until the voice's clock reaches a time or beat.
+
+        Only the events needed are generated: the last one is the first
+        that ends at or after `until`, and nothing is generated when the
+        clock is already there. The scale is chosen once for the whole fill.
+
+        Args:
+            client_id (str): Client ID
+            voice_id (int): Voice ID
+            params (Dict): Parameters
+            global_params (Dict): Global parameters
+            until (float): Target position on the voice's clock
+            unit (str): seconds or beats
+            max_events (int): Events to stop after, at most FILL_MAX_EVENTS
+        Returns:
+            List[Dict]: Events with `beat` and `time`, at most `max_events`
+        """
+        if unit not in ("seconds", "beats"):
+            raise ValueError(f"Unknown clock unit: {unit}")
+        state = self.get_voice_state(client_id, voice_id)
+        if not state:
+            self.init_voice_state(client_id, voice_id)
+            state = self.get_voice_state(client_id, voice_id)
+        clock = "seconds" if unit == "seconds" else "beat"
+        if getattr(state, clock) >= until:
+            return []
+
+        rng = state.rng if state.rng is not None else self.rng
+        scale = ScaleManager.get_scale_for_dissonance_weighted(global_params["dissonanceLevel"], rng)
+        max_events = min(max_events, FILL_MAX_EVENTS)
+        notes_data = []
+        while getattr(state, clock) < until and len(notes_data) < max_events:
+            notes_data.extend(self.generate_next_notes(
+                client_id, voice_id, params, global_params, FILL_CHUNK_SIZE, scale
+            ))
         return notes_data
+
+    def generate_notes_batch(
+        self, client_id: str, voices: List[Dict], global_params: Dict
+    ) -> List[Dict]:
+        """Generate next notes for several voices sharing global parameters.
+
+        Runs on the vectorized batch engine (`generate_batch`), which
+        chooses the scale once for all voices.
+
+        Args:
+            client_id (str): Client ID
+            voices (List[Dict]): Voice requests with voiceId, params and duration
+            global_params (Dict): Global parameters
+        Returns:
+            List[Dict]: voiceId and noteData per voice, in request order
+        """
+        notes_data = self.generate_batch(client_id, [
+            {
+                "voiceId": voice["voiceId"],
+                "params": voice["params"],
+                "globalParams": global_params,
+                "duration": voice.get("duration", 1)
+            }
+            for voice in voices
+        ])
+        return [{"voiceId": voice["voiceId"], "noteData": notes_data[voice["voiceId"]]} for voice in voices]
+
+    def generate_batch(self, client_id: str, requests: List[Dict]) -> Dict[int, List[Dict]]:
+        """Generate next notes for several voices in one vectorized pass.
+
+        Args:
+            client_id (str): Client ID
+            requests (List[Dict]): Voice requests (voiceId, params, globalParams, duration)
+        Returns:
+            Dict[int, List[Dict]]: Next notes per voice ID
+        """
+        if self._batch_generator is None:
+            # The batch engine is only imported once it is used
+            from music_generator.batch_generator import BatchNoteGenerator
+            self._batch_generator = BatchNoteGenerator(self)
+        return self._batch_generator.generate_batch(client_id, requests)
@@ -0,0 +1,151 @@
+"""Record generator calls of live sessions and replay them bit-for-bit.
+
+Every MusicGenerator call made for a client (method, arguments, result) is
+appended as one JSON line. Replaying feeds the calls to a fresh generator
+and compares the results, which match exactly for clients that sent a
+`seed` in their `init` message:
+
+    python -m music_generator.replay session.jsonl [--client ID]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+from typing import Any, Dict, IO, Iterator, List, Optional
+from music_generator.music_generator import MusicGenerator
+
+
+def _encode(value: Any) -> Any:
+    """Make a value JSON-serializable, keeping bytes distinguishable."""
+    if isinstance(value, bytes):
+        return {"$bytes": base64.b64encode(value).decode()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    return value
+
+
+def _decode(value: Any) -> Any:
+    """Reverse `_encode`."""
+    if isinstance(value, dict):
+        if set(value) == {"$bytes"}:
+            return base64.b64decode(value["$bytes"])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+class SessionRecorder:
+    """Appends generator calls to a JSON Lines file."""
+
+    def __init__(self, path: str):
+        """Initialize the recorder.
+
+        Args:
+            path (str): File to append to
+        """
+        self.path = path
+        self.file: IO[str] = open(path, "a", encoding="utf-8")
+
+    @classmethod
+    def from_env(cls) -> Optional["SessionRecorder"]:
+        """Create a recorder writing to SESSION_RECORD_PATH, if set.
+
+        Returns:
+            Optional[SessionRecorder]: Recorder
+        """
+        path = os.getenv("SESSION_RECORD_PATH")
+        return cls(path) if path else None
+
+    def record(self, client_id: str, method: str, args: tuple, result: Any) -> None:
+        """Append one call.
+
+        Args:
+            client_id (str): Client ID
+            method (str): MusicGenerator method
+            args (tuple): Arguments after the client ID
+            result (Any): Result
+        """
+        if self.file.closed:
+            # Reopened after `close`, like the executor's pools after shutdown
+            self.file = open(self.path, "a", encoding="utf-8")
+        self.file.write(json.dumps(_encode({
+            "clientId": client_id,
+            "method": method,
+            "args": list(args),
+            "result": result
+        }), separators=(",", ":")) + "\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def load_session(path: str, client_id: Optional[str] = None) -> Iterator[Dict]:
+    """Read recorded calls.
+
+    Args:
+        path (str): Recording
+        client_id (Optional[str]): Only read calls of this client
+    Returns:
+        Iterator[Dict]: Calls with clientId, method, args and result
+    """
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            call = _decode(json.loads(line))
+            if client_id is None or call["clientId"] == client_id:
+                yield call
+
+
+def replay_session(
+    calls: Iterator[Dict], music_generator: Optional[MusicGenerator] = None
+) -> List[Dict]:
+    """Replay recorded calls and collect those whose result differs.
+
+    Args:
+        calls (Iterator[Dict]): Recorded calls
+        music_generator (Optional[MusicGenerator]): Generator to replay on, a fresh one by default
+    Returns:
+        List[Dict]: Mismatching calls with index, recorded and replayed results
+    """
+    generator = music_generator if music_generator is not None else MusicGenerator()
+    mismatches = []
+    for index, call in enumerate(calls):
+        result = getattr(generator, call["method"])(call["clientId"], *call["args"])
+        # Compare in recorded form so tuples and lists are equal
+        replayed = _decode(json.loads(json.dumps(_encode(result))))
+        if replayed != call["result"]:
+            mismatches.append({
+                "index": index,
+                "clientId": call["clientId"],
+                "method": call["method"],
+                "recorded": call["result"],
+                "replayed": replayed
+            })
+    return mismatches
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay a recorded session")
+    parser.add_argument("path", help="Recording written with SESSION_RECORD_PATH")
+    parser.add_argument("--client", help="Only replay this client")
+    args = parser.parse_args(argv)
+
+    calls = list(load_session(args.path, args.client))
+    mismatches = replay_session(calls)
+    for mismatch in mismatches[:10]:
+        print(
+            f"call {mismatch['index']} {mismatch['method']} ({mismatch['clientId']}) differs:\n"
+            f"  recorded: {mismatch['recorded']}\n  replayed: {mismatch['replayed']}"
+        )
+    print(f"{len(calls)} calls replayed, {len(mismatches)} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
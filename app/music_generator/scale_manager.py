@@ -1,52 +1,204 @@
+from bisect import bisect, bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from typing import Dict, List, Optional, Sequence, Tuple
+import json
+import os
 import random
 
+# Dissonance levels are quantized to this many buckets per unit (UI step is 0.01)
+DISSONANCE_BUCKETS = 100
+
+DEFAULT_SCALE_BANK_PATH = os.path.join(os.path.dirname(__file__), "scales", "default.json")
+
+# Scale name and pitch classes, None for no snapping
+Scale = Tuple[str, Optional[Tuple[int, ...]]]
+NO_SCALE: Scale = ("None", None)
+
+
+def normalize_pitch_classes(pcs: Optional[Sequence[int]]) -> Optional[Tuple[int, ...]]:
+    """Fold pitch classes into the octave, dropping repeats but keeping their order.
+
+    Args:
+        pcs (Optional[Sequence[int]]): Pitch classes, e.g. 14 for a 9th
+    Returns:
+        Optional[Tuple[int, ...]]: Pitch classes in 0-11
+    """
+    if pcs is None:
+        return None
+    return tuple(dict.fromkeys(pc % 12 for pc in pcs))
+
+
+@lru_cache(maxsize=1024)
+def nearest_pitch_classes(scale_pcs: Optional[Tuple[int, ...]]) -> Tuple[Tuple[int, ...], ...]:
+    """Get the closest scale pitch classes of every pitch class.
+
+    Args:
+        scale_pcs (Optional[Tuple[int, ...]]): Scale PC, None for no snapping
+    Returns:
+        Tuple[Tuple[int, ...], ...]: 12 entries with the equally close scale
+            pitch classes, in scale order
+    """
+    if scale_pcs is None:
+        return tuple((pc,) for pc in range(12))
+    scale_pcs = normalize_pitch_classes(scale_pcs)
+    table = []
+    for pc in range(12):
+        distances = [(s, min((s - pc) % 12, (pc - s) % 12)) for s in scale_pcs]
+        min_distance = min(d for _, d in distances)
+        table.append(tuple(s for s, d in distances if d == min_distance))
+    return tuple(table)
+
+
+class ScaleBand:
+    """Scales used for dissonance levels in [low, high).
+
+    The candidates are spread evenly over the band and weighted by how close
+    the dissonance level is to their position: with two candidates the
+    weights are (high - dissonance, dissonance - low), with more only the two
+    surrounding the level get weight. An optional `weight` per scale scales
+    its share.
+    """
+
+    __slots__ = ("low", "high", "scales", "weights", "anchors")
+
+    def __init__(self, low: float, high: float, scales: Sequence[Scale], weights: Optional[Sequence[float]] = None):
+        if not low < high:
+            raise ValueError(f"Empty dissonance band [{low}, {high})")
+        if not scales:
+            raise ValueError(f"Dissonance band [{low}, {high}) has no scales")
+        self.low = low
+        self.high = high
+        self.scales = tuple(scales)
+        self.weights = tuple(weights) if weights is not None else (1.0,) * len(self.scales)
+        count = len(self.scales)
+        self.anchors = tuple(low + (high - low) * i / (count - 1) for i in range(count - 1)) + (high,)
+
+    def distribution(self, dissonance: float) -> Tuple[Tuple[Scale, ...], Tuple[float, ...]]:
+        """Get the candidates and their cumulative weights at a dissonance level.
+
+        Args:
+            dissonance (float): Dissonance inside the band
+        Returns:
+            Tuple[Tuple[Scale, ...], Tuple[float, ...]]: Scales and cumulative weights
+        """
+        if len(self.scales) == 1:
+            return self.scales, (1.0,)
+        anchors = self.anchors
+        weights = [0.0] * len(self.scales)
+        below = min(max(bisect_right(anchors, dissonance) - 1, 0), len(anchors) - 2)
+        weights[below] = (anchors[below + 1] - dissonance) * self.weights[below]
+        weights[below + 1] = (dissonance - anchors[below]) * self.weights[below + 1]
+        return self.scales, tuple(accumulate(weights))
+
+
+class ScaleBank:
+    """Dissonance bands compiled for O(log n) lookup."""
+
+    def __init__(self, bands: Sequence[ScaleBand]):
+        """Initialize the bank.
+
+        Args:
+            bands (Sequence[ScaleBand]): Non-overlapping bands, in any order
+        """
+        self.bands: List[ScaleBand] = sorted(bands, key=lambda band: band.low)
+        for previous, band in zip(self.bands, self.bands[1:]):
+            if band.low < previous.high:
+                raise ValueError(
+                    f"Dissonance bands [{previous.low}, {previous.high}) and [{band.low}, {band.high}) overlap"
+                )
+        self.lows = [band.low for band in self.bands]
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ScaleBank":
+        """Compile a bank from its JSON form.
+
+        `{"bands": [{"low", "high", "scales": [{"name", "pcs", "weight"?}]}]}`,
+        where `pcs` may be null for no snapping.
+
+        Args:
+            data (Dict): Bank
+        Returns:
+            ScaleBank: Compiled bank
+        """
+        bands = []
+        for band in data["bands"]:
+            scales = [(scale["name"], normalize_pitch_classes(scale["pcs"])) for scale in band["scales"]]
+            weights = [float(scale.get("weight", 1.0)) for scale in band["scales"]]
+            bands.append(ScaleBand(float(band["low"]), float(band["high"]), scales, weights))
+        return cls(bands)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "ScaleBank":
+        """Load a bank file.
+
+        Args:
+            path (Optional[str]): JSON file, SCALE_BANK_PATH or the bundled default when omitted
+        Returns:
+            ScaleBank: Compiled bank
+        """
+        path = path or os.getenv("SCALE_BANK_PATH") or DEFAULT_SCALE_BANK_PATH
+        with open(path, encoding="utf-8") as file:
+            return cls.from_dict(json.load(file))
+
+    def band_for(self, dissonance: float) -> Optional[ScaleBand]:
+        """Find the band containing a dissonance level.
+
+        Args:
+            dissonance (float): Dissonance
+        Returns:
+            Optional[ScaleBand]: Band, None outside all bands
+        """
+        index = bisect_right(self.lows, dissonance) - 1
+        if index < 0 or dissonance >= self.bands[index].high:
+            return None
+        return self.bands[index]
+
+    def ranges(self) -> Dict[Tuple[float, float], List[Scale]]:
+        """Get the bank as {(low, high): [(name, pcs), ...]}."""
+        return {(band.low, band.high): list(band.scales) for band in self.bands}
+
+
 class ScaleManager:
-    SCALE_BANK = {
-        (0.0, 0.1): [
-            ("C5", [0, 7]),          # Only Root and Perfect 5th
-        ],
-        (0.1, 0.2): [
-            ("Cmaj", [0, 4, 7]),          # Start with the simplest form
-        ],
-        (0.2, 0.3): [
-            ("Cmaj7", [0, 4, 7, 11]),     # Add color with major 7th
-            ("Cadd9", [0, 4, 7, 14])      # Add 9th for more spread
-        ],
-        (0.3, 0.5): [
-            ("Cm7", [0, 3, 7, 10]),       # Move to minor
-            ("Cm9", [0, 3, 7, 10, 14])    # Add 9th for more complexity
-        ],
-        (0.5, 0.7): [
-            ("C7alt", [0, 4, 8, 10]),     # Add instability with altered 7th
-            ("Cm7b5", [0, 3, 6, 10])      # Add dissonance with minor 7th flat 5
-        ],
-        (0.7, 0.9): [
-            ("Cdim7", [0, 3, 6, 9]),      # Add dissonance with diminished 7th
-            ("Caugm7", [0, 4, 8, 10])     # Add instability with augmented 7th
-        ],
-        (0.9, 1.0): [
-            ("None", None)                 # No scale (no snap)
-        ]
-    }
+    bank = ScaleBank.load()
+    SCALE_BANK = bank.ranges()
+
+    @staticmethod
+    def use_bank(bank: ScaleBank) -> None:
+        """Replace the scale bank, e.g. with one loaded from another file.
+
+        Args:
+            bank (ScaleBank): Compiled bank
+        """
+        ScaleManager.bank = bank
+        ScaleManager.SCALE_BANK = bank.ranges()
+        ScaleManager.get_scale_distribution.cache_clear()
 
     @staticmethod
-    def get_scale_for_dissonance_weighted(dissonance: float) -> tuple:
+    @lru_cache(maxsize=2 * DISSONANCE_BUCKETS)
+    def get_scale_distribution(bucket: int) -> Tuple[Tuple[Scale, ...], Tuple[float, ...]]:
+        """Get the cumulative scale distribution for a dissonance bucket.
+
+        Args:
+            bucket (int): Quantized dissonance
+        Returns:
+            Tuple[Tuple[Scale, ...], Tuple[float, ...]]: Scale candidates and cumulative weights
+        """
+        dissonance = bucket / DISSONANCE_BUCKETS
+        band = ScaleManager.bank.band_for(dissonance)
+        if band is None:
+            return (NO_SCALE,), (1.0,)
+        return band.distribution(dissonance)
+
+    @staticmethod
+    def get_scale_for_dissonance_weighted(dissonance: float, rng=random) -> Scale:
         """Get scale for dissonance weighted.
-        
+
         Args:
             dissonance (float): Dissonance
+            rng: Random source providing `random()`
         """
-        for (low, high), scales in ScaleManager.SCALE_BANK.items():
-            if low <= dissonance < high:
-                # If there is only one scale candidate, return it
-                if len(scales) == 1:
-                    return scales[0]
-                # If there are multiple candidates, select one probabilistically
-                # Assume there are only two candidates, and get distribute weights
-                else:
-                    weights = [
-                        (high - dissonance),
-                        (dissonance - low)
-                    ]
-                    return random.choices(scales, weights=weights)[0]
-        return ("None", None)
+        scales, cum_weights = ScaleManager.get_scale_distribution(round(dissonance * DISSONANCE_BUCKETS))
+        if len(scales) == 1:
+            return scales[0]
+        return scales[bisect(cum_weights, rng.random() * cum_weights[-1], 0, len(scales) - 1)]
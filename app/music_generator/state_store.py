@@ -0,0 +1,212 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+
+class ClientEntry:
+    __slots__ = ("voices", "last_access")
+
+    def __init__(self, last_access: float):
+        # Voices in least recently used order
+        self.voices: "OrderedDict[int, Any]" = OrderedDict()
+        self.last_access = last_access
+
+
+class VoiceStateStore:
+    """Bounded store of per-client voice states.
+
+    Clients are kept in least recently used order. A client idle for longer
+    than `ttl_seconds` is dropped on the next access to the store, the least
+    recently used client is dropped once there are more than `max_clients`,
+    and the least recently used voice of a client is dropped once it has more
+    than `max_voices_per_client`. Every operation holds a lock, as the
+    thread backend calls the store from its workers and the event loop.
+    """
+
+    def __init__(
+        self,
+        max_clients: int = 10000,
+        max_voices_per_client: int = 32,
+        ttl_seconds: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """Initialize the store.
+
+        Args:
+            max_clients (int): Maximum number of clients
+            max_voices_per_client (int): Maximum number of voices per client
+            ttl_seconds (float): Idle time after which a client is dropped
+            clock (Callable[[], float]): Time source in seconds
+        """
+        self.max_clients = max_clients
+        self.max_voices_per_client = max_voices_per_client
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.clients: "OrderedDict[str, ClientEntry]" = OrderedDict()
+        self.evicted_clients = 0
+        self.evicted_voices = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "VoiceStateStore":
+        """Create a store configured by STATE_MAX_CLIENTS, STATE_MAX_VOICES and STATE_TTL_SECONDS.
+
+        Returns:
+            VoiceStateStore: Store
+        """
+        return cls(
+            max_clients=int(os.getenv("STATE_MAX_CLIENTS", "10000")),
+            max_voices_per_client=int(os.getenv("STATE_MAX_VOICES", "32")),
+            ttl_seconds=float(os.getenv("STATE_TTL_SECONDS", "3600"))
+        )
+
+    def _touch(self, client_id: str, create: bool) -> Optional[ClientEntry]:
+        now = self.clock()
+        self._evict_idle(now)
+        entry = self.clients.get(client_id)
+        if entry is None:
+            if not create:
+                return None
+            entry = self.clients[client_id] = ClientEntry(now)
+            while len(self.clients) > self.max_clients:
+                self.clients.popitem(last=False)
+                self.evicted_clients += 1
+        else:
+            entry.last_access = now
+            self.clients.move_to_end(client_id)
+        return entry
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drop clients idle for longer than the TTL.
+
+        Args:
+            now (Optional[float]): Current time, defaults to the clock
+        Returns:
+            int: Number of dropped clients
+        """
+        with self._lock:
+            return self._evict_idle(self.clock() if now is None else now)
+
+    def _evict_idle(self, now: float) -> int:
+        evicted = 0
+        # Clients are ordered by last access, so only the front needs checking
+        while self.clients:
+            client_id, entry = next(iter(self.clients.items()))
+            if now - entry.last_access <= self.ttl_seconds:
+                break
+            del self.clients[client_id]
+            evicted += 1
+        self.evicted_clients += evicted
+        return evicted
+
+    def get(self, client_id: str, voice_id: int) -> Optional[Any]:
+        """Get a voice state.
+
+        Args:
+            client_id (str): Client ID
+            voice_id (int): Voice ID
+        Returns:
+            Optional[Any]: Voice state
+        """
+        with self._lock:
+            entry = self._touch(client_id, create=False)
+            if entry is None:
+                return None
+            state = entry.voices.get(voice_id)
+            if state is not None:
+                entry.voices.move_to_end(voice_id)
+            return state
+
+    def set(self, client_id: str, voice_id: int, state: Any) -> None:
+        """Store a voice state.
+
+        Args:
+            client_id (str): Client ID
+            voice_id (int): Voice ID
+            state (Any): Voice state
+        """
+        with self._lock:
+            entry = self._touch(client_id, create=True)
+            entry.voices[voice_id] = state
+            entry.voices.move_to_end(voice_id)
+            while len(entry.voices) > self.max_voices_per_client:
+                entry.voices.popitem(last=False)
+                self.evicted_voices += 1
+
+    def remove_voice(self, client_id: str, voice_id: int) -> None:
+        """Remove a voice state.
+
+        Args:
+            client_id (str): Client ID
+            voice_id (int): Voice ID
+        """
+        with self._lock:
+            entry = self.clients.get(client_id)
+            if entry is not None:
+                entry.voices.pop(voice_id, None)
+
+    def rename_voice(self, client_id: str, old_id: int, new_id: int) -> None:
+        """Move a voice state to a new voice ID.
+
+        Args:
+            client_id (str): Client ID
+            old_id (int): Old voice ID
+            new_id (int): New voice ID
+        """
+        with self._lock:
+            entry = self.clients.get(client_id)
+            if entry is not None and old_id in entry.voices:
+                entry.voices[new_id] = entry.voices.pop(old_id)
+
+    def remove_client(self, client_id: str) -> None:
+        """Remove all voice states of a client.
+
+        Args:
+            client_id (str): Client ID
+        """
+        with self._lock:
+            self.clients.pop(client_id, None)
+
+    def voices(self, client_id: str) -> Dict[int, Any]:
+        """Get the voice states of a client without touching it.
+
+        Args:
+            client_id (str): Client ID
+        Returns:
+            Dict[int, Any]: Voice states by voice ID
+        """
+        with self._lock:
+            entry = self.clients.get(client_id)
+            return dict(entry.voices) if entry is not None else {}
+
+    def items(self) -> Iterator[Tuple[str, int, Any]]:
+        """Iterate over (client ID, voice ID, voice state), as of the call."""
+        with self._lock:
+            snapshot = [
+                (client_id, voice_id, state)
+                for client_id, entry in self.clients.items()
+                for voice_id, state in entry.voices.items()
+            ]
+        return iter(snapshot)
+
+    def stats(self) -> Dict[str, int]:
+        """Get store size and eviction counts.
+
+        Returns:
+            Dict[str, int]: Clients, voices, evicted clients and voices
+        """
+        with self._lock:
+            return {
+                "clients": len(self.clients),
+                "voices": sum(len(entry.voices) for entry in self.clients.values()),
+                "evicted_clients": self.evicted_clients,
+                "evicted_voices": self.evicted_voices
+            }
+
+    def __contains__(self, client_id: str) -> bool:
+        return client_id in self.clients
+
+    def __len__(self) -> int:
+        return len(self.clients)
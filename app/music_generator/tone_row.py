@@ -0,0 +1,131 @@
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+from music_generator.scale_manager import nearest_pitch_classes
+
+# Row form kinds, as passed to ToneRowMatrix.form
+PRIME = 0
+RETROGRADE = 1
+INVERSION = 2
+RETROGRADE_INVERSION = 3
+FORM_KINDS = (PRIME, RETROGRADE, INVERSION, RETROGRADE_INVERSION)
+
+# bytes.translate tables mapping a pitch class to its transposition / inversion
+_TRANSPOSE = tuple(bytes((pc + t) % 12 for pc in range(256)) for t in range(12))
+_INVERT = bytes((-pc) % 12 for pc in range(256))
+
+
+class ToneRowMatrix:
+    """Twelve-tone matrix giving O(1) access to all 48 forms of a row.
+
+    Only the prime form is stored, as 12 pitch-class bytes; any other form
+    is derived on access with a single `bytes.translate` (plus a reversal
+    for R and RI), so a voice carries 12 bytes instead of the full 576-byte
+    matrix. A form is addressed by its kind (P, R, I, RI) and its
+    transposition, where the transposition of R and RI is the one of the P
+    or I form they are the retrograde of.
+    """
+
+    __slots__ = ("prime",)
+
+    def __init__(self, row: Sequence[int]):
+        """Build the matrix from a 12-note row.
+
+        Args:
+            row (Sequence[int]): 12-note row (MIDI notes or pitch classes)
+        """
+        self.prime = bytes(note % 12 for note in row)
+
+    @property
+    def transposition(self) -> int:
+        """Transposition level of the untransposed prime form."""
+        return self.prime[0]
+
+    def form(self, kind: int, transposition: Optional[int] = None) -> bytes:
+        """Get one form of the row.
+
+        Args:
+            kind (int): PRIME, RETROGRADE, INVERSION or RETROGRADE_INVERSION
+            transposition (Optional[int]): Transposition level, defaults to
+                the level of the original row
+        Returns:
+            bytes: 12 pitch classes
+        """
+        first = self.prime[0]
+        if transposition is None:
+            transposition = first
+        if kind == PRIME or kind == RETROGRADE:
+            form = self.prime.translate(_TRANSPOSE[(transposition - first) % 12])
+        else:
+            # Inverting maps the first pitch class p to -p, so shift by t + p
+            form = self.prime.translate(_INVERT).translate(_TRANSPOSE[(transposition + first) % 12])
+        return form[::-1] if kind == RETROGRADE or kind == RETROGRADE_INVERSION else form
+
+
+class SnapTable:
+    """Precomputed snap-to-scale and fit-to-range lookup.
+
+    For every input pitch class the table stores the equally close scale
+    pitch classes and, for each of them, the notes available inside the
+    range. `realize_candidates` looks up the pitch classes of a row form in
+    it and makes the random choices that
+    `MusicGenerator.snap_note` and `MusicGenerator.adjust_note_to_range`
+    would have made.
+    """
+
+    __slots__ = ("candidates",)
+
+    def __init__(self, scale_pcs: Optional[Tuple[int, ...]], lower_note: int, upper_note: int):
+        """Build the table.
+
+        Args:
+            scale_pcs (Optional[Tuple[int, ...]]): Scale PC, None for no snapping
+            lower_note (int): Lower note
+            upper_note (int): Upper note
+        """
+        self.candidates: Tuple[Tuple[Tuple[int, ...], ...], ...] = tuple(
+            tuple(self._notes_in_range(s, lower_note, upper_note) for s in closest_pcs)
+            for closest_pcs in nearest_pitch_classes(scale_pcs)
+        )
+
+    @staticmethod
+    def _notes_in_range(pitch_class: int, lower_note: int, upper_note: int) -> Tuple[int, ...]:
+        return tuple(
+            note for note in range(pitch_class + (lower_note // 12) * 12, upper_note + 1, 12)
+            if note >= lower_note
+        )
+
+
+def realize_candidates(form: bytes, snap_table: SnapTable, draws: Sequence[float]) -> List[int]:
+    """Pick one note per position of a row form using pre-drawn uniforms.
+
+    Args:
+        form (bytes): Pitch classes of the row form
+        snap_table (SnapTable): Table from `get_snap_table`
+        draws (Sequence[float]): Two uniforms in [0, 1) per position
+    Returns:
+        List[int]: Notes, without positions that have no note in range
+    """
+    candidates = snap_table.candidates
+    notes = []
+    pairs = iter(draws)
+    for pc, pc_draw, octave_draw in zip(form, pairs, pairs):
+        choices = candidates[pc]
+        octaves = choices[int(pc_draw * len(choices))] if len(choices) > 1 else choices[0]
+        if octaves:
+            notes.append(octaves[int(octave_draw * len(octaves))])
+    return notes
+
+
+@lru_cache(maxsize=1024)
+def get_snap_table(scale_pcs: Optional[Tuple[int, ...]], lower_note: int, upper_note: int) -> SnapTable:
+    """Get the cached snap table for a scale and range.
+
+    Args:
+        scale_pcs (Optional[Tuple[int, ...]]): Scale PC
+        lower_note (int): Lower note
+        upper_note (int): Upper note
+    Returns:
+        SnapTable: Lookup table
+    """
+    return SnapTable(scale_pcs, lower_note, upper_note)
+
@@ -0,0 +1,64 @@
+import pytest
+
+from core import admission
+from core.admission import AdmissionController, RateLimited, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_take_spends_and_refills(clock):
+    bucket = TokenBucket(rate=10, burst=20)
+    assert bucket.take(15) == 0.0
+    assert bucket.available() == 5
+    # Not enough: nothing is taken and the wait until there is comes back
+    assert bucket.take(10) == pytest.approx(0.5)
+    assert bucket.available() == 5
+    clock[0] += 0.5
+    assert bucket.take(10) == 0.0
+    assert bucket.available() == 0
+
+
+def test_refill_stops_at_burst(clock):
+    bucket = TokenBucket(rate=10, burst=20)
+    bucket.take(20)
+    clock[0] += 60
+    assert bucket.available() == 20
+
+
+def test_charge_goes_into_debt(clock):
+    bucket = TokenBucket(rate=10, burst=20)
+    bucket.charge(30)
+    assert bucket.available() == -10
+    assert bucket.take(1) == pytest.approx(1.1)
+    clock[0] += 1.2
+    assert bucket.take(1) == 0.0
+
+
+@pytest.mark.parametrize("spend", ["take", "charge"])
+def test_negative_amounts_are_rejected(clock, spend):
+    bucket = TokenBucket(rate=10, burst=20)
+    with pytest.raises(ValueError):
+        getattr(bucket, spend)(-5)
+    assert bucket.available() == 20
+
+
+def test_admit_events_rejects_negative_durations(clock):
+    controller = AdmissionController(events_per_second=10, burst=20, max_duration=20)
+    with pytest.raises(ValueError):
+        controller.admit_events("client", 5, -5)
+    # Nothing was spent, so a full burst still passes
+    controller.admit_events("client", 20)
+
+
+def test_admit_events_over_the_rate(clock):
+    controller = AdmissionController(events_per_second=10, burst=20, max_duration=20)
+    controller.admit_events("client", 20)
+    with pytest.raises(RateLimited) as rejected:
+        controller.admit_events("client", 5)
+    assert rejected.value.reason == "rate"
+    assert rejected.value.retry_after == pytest.approx(0.5)
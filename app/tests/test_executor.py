@@ -0,0 +1,41 @@
+import asyncio
+import random
+
+import pytest
+
+from core.executor import GenerationExecutor
+from music_generator import MusicGenerator
+from tests.test_midi_writer import GLOBAL_PARAMS, PARAMS
+
+
+def generate(backend):
+    async def run():
+        generator = MusicGenerator(rng=random.Random(1))
+        generator.seed_client("client", 5)
+        executor = GenerationExecutor(generator, backend=backend, workers=2)
+        try:
+            return [
+                await executor.call("generate_next_notes", "client", voice_id, PARAMS, GLOBAL_PARAMS, 16)
+                for voice_id in (1, 2, 1)
+            ]
+        finally:
+            executor.shutdown()
+    return asyncio.run(run())
+
+
+def test_thread_backend_matches_inline():
+    assert generate("thread") == generate("inline")
+
+
+def test_shards_are_stable_across_workers():
+    # Process workers restarted elsewhere must route a client the same way
+    first = GenerationExecutor(MusicGenerator(), backend="thread", workers=4)
+    second = GenerationExecutor(MusicGenerator(), backend="thread", workers=4)
+    shards = [first.shard_for(f"client-{i}") for i in range(64)]
+    assert shards == [second.shard_for(f"client-{i}") for i in range(64)]
+    assert set(shards) == {0, 1, 2, 3}
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        GenerationExecutor(MusicGenerator(), backend="fiber")
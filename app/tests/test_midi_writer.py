@@ -0,0 +1,55 @@
+import struct
+
+from music_generator.midi_writer import encode_var_len, render_midi
+
+PARAMS = {
+    "duration": 80,
+    "velocity": 0.7,
+    "velocityVariation": 20,
+    "tempo": 120,
+    "rest": True,
+    "restProbability": 20,
+    "chordProbability": 60,
+    "rangeLower": 48,
+    "rangeUpper": 84,
+}
+GLOBAL_PARAMS = {"dissonanceLevel": 0.45, "tempoFactor": 1.0, "volumeFactor": 1.0}
+VOICES = [{"voiceId": 1, "params": PARAMS}, {"voiceId": 2, "params": PARAMS, "program": 40}]
+
+
+def render(seed):
+    return b"".join(render_midi(VOICES, GLOBAL_PARAMS, 20.0, seed=seed))
+
+
+def chunks(data):
+    offset = 0
+    while offset < len(data):
+        kind, length = struct.unpack_from(">4sI", data, offset)
+        yield kind, data[offset + 8:offset + 8 + length]
+        offset += 8 + length
+
+
+def test_var_len():
+    assert encode_var_len(0) == b"\x00"
+    assert encode_var_len(0x7F) == b"\x7f"
+    assert encode_var_len(0x80) == b"\x81\x00"
+    assert encode_var_len(0x0FFFFFFF) == b"\xff\xff\xff\x7f"
+
+
+def test_same_seed_same_file():
+    assert render(7) == render(7)
+    assert render(7) != render(8)
+
+
+def test_file_structure():
+    parsed = list(chunks(render(7)))
+    kinds = [kind for kind, _ in parsed]
+    assert kinds == [b"MThd", b"MTrk", b"MTrk", b"MTrk"]
+    format_type, tracks, _ = struct.unpack(">HHH", parsed[0][1])
+    assert (format_type, tracks) == (1, 3)
+    for _, track in parsed[1:]:
+        assert track.endswith(b"\x00\xff\x2f\x00")
+    # Each voice plays notes on its own channel
+    assert b"\x90" in parsed[2][1] and b"\x91" in parsed[3][1]
+    # Program change of the second voice
+    assert b"\xc1\x28" in parsed[3][1]
@@ -0,0 +1,69 @@
+import pytest
+
+from core.protocol import (
+    decode_note_data,
+    decode_note_data_batch,
+    decode_room_note_data,
+    encode_note_data,
+    encode_note_data_batch,
+    encode_room_note_data
+)
+from music_generator import NOTE_DURATION_BEATS
+
+# Velocities and tempos exact in float32, so they come back unchanged
+NOTES_DATA = [
+    {"notes": [60, 64, 67], "duration": "4n", "velocity": 0.75, "tempo": 120.0, "beat": 8.0, "time": 4.0},
+    {"notes": [], "duration": "8n", "velocity": 0.5, "tempo": 90.0},
+    {"notes": [127], "duration": "1n", "velocity": 1.0, "tempo": 60.5},
+]
+
+
+def expected(notes_data):
+    """Events as decoded: each starts where the previous one ended."""
+    beat, seconds = notes_data[0]["beat"], notes_data[0]["time"]
+    events = []
+    for note_data in notes_data:
+        events.append(dict(note_data, beat=beat, time=seconds))
+        beats = NOTE_DURATION_BEATS[note_data["duration"]]
+        beat += beats
+        seconds += beats * 60 / note_data["tempo"]
+    return events
+
+
+def assert_events(decoded, notes_data):
+    assert len(decoded) == len(notes_data)
+    for event, want in zip(decoded, expected(notes_data)):
+        assert event == pytest.approx(want)
+
+
+@pytest.mark.parametrize("voice_id", [3, -1, 2 ** 40, "lead", ""])
+def test_note_data_round_trip(voice_id):
+    decoded_id, notes_data = decode_note_data(encode_note_data(voice_id, NOTES_DATA))
+    assert decoded_id == voice_id
+    assert_events(notes_data, NOTES_DATA)
+
+
+def test_empty_note_data_round_trip():
+    assert decode_note_data(encode_note_data(1, [])) == (1, [])
+
+
+def test_batch_round_trip():
+    voices = [{"voiceId": 1, "noteData": NOTES_DATA}, {"voiceId": "bass", "noteData": NOTES_DATA[1:2]}]
+    decoded = decode_note_data_batch(encode_note_data_batch(voices))
+    assert [voice["voiceId"] for voice in decoded] == [1, "bass"]
+    assert_events(decoded[0]["noteData"], NOTES_DATA)
+    # Without a clock the voice starts at beat 0
+    assert_events(decoded[1]["noteData"], [dict(NOTES_DATA[1], beat=0.0, time=0.0)])
+
+
+def test_room_note_data_round_trip():
+    room_id, voice_id, notes_data = decode_room_note_data(encode_room_note_data("räum", 2, NOTES_DATA))
+    assert (room_id, voice_id) == ("räum", 2)
+    assert_events(notes_data, NOTES_DATA)
+
+
+def test_frame_kinds_are_checked():
+    with pytest.raises(ValueError):
+        decode_note_data_batch(encode_note_data(1, NOTES_DATA))
+    with pytest.raises(ValueError):
+        decode_note_data(encode_room_note_data("room", 1, NOTES_DATA))
@@ -0,0 +1,65 @@
+from music_generator.state_store import VoiceStateStore
+
+
+def make_store(**kwargs):
+    now = [0.0]
+    return VoiceStateStore(clock=lambda: now[0], **kwargs), now
+
+
+def test_least_recently_used_client_is_evicted():
+    store, _ = make_store(max_clients=2)
+    store.set("a", 1, "a1")
+    store.set("b", 1, "b1")
+    assert store.get("a", 1) == "a1"
+    store.set("c", 1, "c1")
+    assert "b" not in store
+    assert store.get("a", 1) == "a1" and store.get("c", 1) == "c1"
+    assert store.stats()["evicted_clients"] == 1
+
+
+def test_least_recently_used_voice_is_evicted():
+    store, _ = make_store(max_voices_per_client=2)
+    store.set("a", 1, "v1")
+    store.set("a", 2, "v2")
+    store.get("a", 1)
+    store.set("a", 3, "v3")
+    assert store.voices("a") == {1: "v1", 3: "v3"}
+    assert store.stats()["evicted_voices"] == 1
+
+
+def test_idle_clients_expire():
+    store, now = make_store(ttl_seconds=10)
+    store.set("a", 1, "a1")
+    store.set("b", 1, "b1")
+    now[0] = 8.0
+    store.get("b", 1)
+    now[0] = 10.0
+    assert store.get("a", 1) == "a1"
+    now[0] = 18.5
+    # b was last used at 8 and is dropped; a, used at 10, is kept
+    assert store.get("a", 1) == "a1"
+    assert "b" not in store
+    now[0] = 40.0
+    assert store.evict_idle() == 1
+    assert len(store) == 0
+
+
+def test_voices_does_not_touch_the_client():
+    store, now = make_store(ttl_seconds=10)
+    store.set("a", 1, "a1")
+    now[0] = 5.0
+    assert store.voices("a") == {1: "a1"}
+    now[0] = 11.0
+    assert store.get("a", 1) is None
+
+
+def test_rename_and_remove():
+    store, _ = make_store()
+    store.set("a", 1, "v1")
+    store.rename_voice("a", 1, 2)
+    assert store.voices("a") == {2: "v1"}
+    store.remove_voice("a", 2)
+    assert store.voices("a") == {}
+    store.set("a", 1, "v1")
+    store.remove_client("a")
+    assert "a" not in store
@@ -92,16 +92,27 @@ export const useWebSocketStore = defineStore('websocket', () => {
         break
       case 'note_data':
         if (data.noteData && data.voiceId) {
-          // add note data to the voice queue
+          // add note data to the voice queue; a room's voices are kept apart from our own
+          const queueKey = data.roomId != null ? `room/${data.roomId}/${data.voiceId}` : data.voiceId
           voiceQueues.value = {
             ...voiceQueues.value,
-            [data.voiceId]: [
-              ...(voiceQueues.value[data.voiceId] || []),
+            [queueKey]: [
+              ...(voiceQueues.value[queueKey] || []),
               ...data.noteData
             ]
           }
         }
         break
+      case 'note_data_batch':
+        if (data.voices) {
+          // add note data of every voice in one update
+          const queues = { ...voiceQueues.value }
+          for (const voice of data.voices) {
+            queues[voice.voiceId] = [...(queues[voice.voiceId] || []), ...voice.noteData]
+          }
+          voiceQueues.value = queues
+        }
+        break
       case 'volume_factor_updated':
         globalVolumeFactor.value = data.value
         break
@@ -109,7 +120,12 @@ export const useWebSocketStore = defineStore('websocket', () => {
         globalTempoFactor.value = data.value
         break
       case 'error':
-        console.error('Server error:', data.message)
+        if (data.code === 'rate_limited') {
+          // The voice asks again on its next queue check
+          console.warn('Rate limited:', data.message, data.retryAfter)
+        } else {
+          console.error('Server error:', data.message)
+        }
         break
     }
   }